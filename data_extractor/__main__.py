@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Tasdeed Extraction - headless batch CLI for servers and scheduled runs.
+
+    python -m data_extractor accounts.xlsx -o output --concurrency 4 --format xlsx --format csv
+
+Progress is written to stdout as JSON lines (events "start", "account",
+"output", "done" and "error"); logs go to stderr. Exit status: 0 when every
+account was extracted, 3 when some accounts failed, 2 for an unusable input
+sheet, 1 when the run failed and 130 when interrupted.
+"""
+
+import os
+import sys
+import json
+import asyncio
+import argparse
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+# Add the parent directory to the path so we can import the extractor package
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from data_extractor.main import DEFAULT_RETRIES, DEFAULT_RETRY_DELAY, OUTPUT_FORMATS, BatchRun
+from data_transform.tracing import TRACE_DIR_ENV
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_BAD_INPUT = 2
+EXIT_FAILED_ACCOUNTS = 3
+EXIT_INTERRUPTED = 130
+
+
+def emit(event: dict) -> None:
+    """Write one JSON-lines progress event to stdout."""
+    sys.stdout.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+    sys.stdout.flush()
+
+
+def read_accounts(path: str, user_type: Optional[str] = None) -> Tuple[str, List[str]]:
+    """
+    Read the user type and account numbers from an Excel/CSV sheet with
+    ACCOUNTNO and SUBTYPE columns (SUBTYPE may be omitted when ``user_type`` is given).
+
+    Raises:
+        ValueError: If the sheet lacks the columns, has several SUBTYPEs or no accounts
+    """
+    import pandas as pd
+
+    df = pd.read_excel(path, dtype={"ACCOUNTNO": str}) if path.endswith(".xlsx") else pd.read_csv(
+        path, dtype={"ACCOUNTNO": str})
+    if "ACCOUNTNO" not in df.columns:
+        raise ValueError("The file must contain an ACCOUNTNO column")
+    if user_type is None:
+        if "SUBTYPE" not in df.columns:
+            raise ValueError("The file must contain a SUBTYPE column (or pass --user-type)")
+        subtypes = df["SUBTYPE"].dropna().unique()
+        if len(subtypes) != 1:
+            raise ValueError("Only one user SUBTYPE should exist in the file")
+        user_type = str(subtypes[0])
+    accounts_list = [str(acc) for acc in df["ACCOUNTNO"] if pd.notna(acc)]
+    if not accounts_list:
+        raise ValueError("No valid accounts found in the ACCOUNTNO column")
+    return user_type, accounts_list
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m data_extractor",
+        description="Extract the bills of an account sheet without the desktop or web front ends.")
+    parser.add_argument("input", help="Excel/CSV sheet with ACCOUNTNO and SUBTYPE columns")
+    parser.add_argument("-o", "--output-dir", default="output", help="directory for the outputs (default: output)")
+    parser.add_argument("--user-type", help="company to log in as, instead of the sheet's SUBTYPE")
+    parser.add_argument("-c", "--concurrency", type=int, default=1, help="accounts processed at once (default: 1)")
+    parser.add_argument("--browsers", type=int,
+                        help="Chromium browsers shared by the sessions (default: TASDEED_BROWSER_POOL_SIZE or 1)")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+                        help=f"extra attempts for an account whose portal steps fail (default: {DEFAULT_RETRIES})")
+    parser.add_argument("--retry-delay", type=float, default=DEFAULT_RETRY_DELAY,
+                        help=f"seconds before the first retry, doubled for each further one "
+                             f"(default: {DEFAULT_RETRY_DELAY:g})")
+    parser.add_argument("-f", "--format", dest="formats", action="append", choices=OUTPUT_FORMATS,
+                        help="output format, may be repeated (default: xlsx)")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the last unfinished run of this sheet, retrying only its failed accounts")
+    parser.add_argument("--trace-dir",
+                        help="record per-account stage spans here as JSONL and a Chrome trace (TASDEED_TRACE_DIR)")
+    parser.add_argument("--log-level", default="INFO", help="log level for stderr (default: INFO)")
+    return parser.parse_args(argv)
+
+
+def run(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=args.log_level.upper(),
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        stream=sys.stderr,
+        force=True
+    )
+
+    if args.trace_dir:
+        os.environ[TRACE_DIR_ENV] = args.trace_dir
+
+    try:
+        user_type, accounts_list = read_accounts(args.input, args.user_type)
+    except (OSError, ValueError) as e:
+        emit({"event": "error", "error": str(e)})
+        return EXIT_BAD_INPUT
+
+    batch = BatchRun(
+        user_type, accounts_list, args.output_dir,
+        concurrency=args.concurrency,
+        retries=args.retries,
+        retry_delay=args.retry_delay,
+        formats=args.formats or ["xlsx"],
+        resume=args.resume,
+        source=os.path.abspath(args.input),
+        browsers=args.browsers,
+        progress=emit
+    )
+    try:
+        summary = asyncio.run(batch.run())
+    except KeyboardInterrupt:
+        emit({"event": "done", "time": datetime.now().isoformat(timespec="seconds"), "status": "interrupted",
+              "run_id": batch.run_id, "success": batch.success_count, "failed": batch.fail_count})
+        return EXIT_INTERRUPTED
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Extraction run failed: {e}", exc_info=True)
+        emit({"event": "done", "time": datetime.now().isoformat(timespec="seconds"), "status": "error",
+              "error": str(e), "run_id": batch.run_id, "success": batch.success_count, "failed": batch.fail_count})
+        return EXIT_ERROR
+    return EXIT_FAILED_ACCOUNTS if summary["failed"] else EXIT_OK
+
+
+if __name__ == '__main__':
+    sys.exit(run())
@@ -0,0 +1,144 @@
+"""
+A pool of long-lived Chromium browsers shared by extraction tasks.
+
+Starting Playwright and launching Chromium takes seconds and hundreds of MB,
+so a long-running process (the web server) starts one Playwright driver and a
+few browsers once and leases each task an isolated browser context instead.
+Browsers are health-checked when a context is leased and retired after
+``max_uses`` leases (a fresh browser takes their place; the old one closes
+once its last context is returned).
+"""
+
+import os
+import asyncio
+import logging
+from typing import List, Optional
+
+from playwright.async_api import async_playwright
+
+from data_extractor.get_exact_pg import launch_chromium, new_portal_context
+from data_transform.metrics import BROWSER_LEASES, BROWSERS_OPEN
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 1
+DEFAULT_MAX_USES = 50
+
+
+class PooledBrowser:
+    """One browser in the pool and its lease counters."""
+
+    def __init__(self, browser):
+        self.browser = browser
+        self.uses = 0
+        self.leases = 0
+
+    @property
+    def healthy(self) -> bool:
+        return self.browser.is_connected()
+
+
+class BrowserLease:
+    """An isolated browser context leased from the pool; return it with ``BrowserPool.release``."""
+
+    def __init__(self, slot: PooledBrowser, context):
+        self.slot = slot
+        self.context = context
+
+
+class BrowserPool:
+    """
+    Leases isolated contexts in a fixed number of shared Chromium browsers.
+
+    Configured with TASDEED_BROWSER_POOL_SIZE (browsers, default 1) and
+    TASDEED_BROWSER_MAX_USES (leases before a browser is recycled, default 50).
+    """
+
+    def __init__(self, size: Optional[int] = None, max_uses: Optional[int] = None):
+        self.size = size or int(os.environ.get("TASDEED_BROWSER_POOL_SIZE", DEFAULT_POOL_SIZE))
+        self.max_uses = max_uses or int(os.environ.get("TASDEED_BROWSER_MAX_USES", DEFAULT_MAX_USES))
+        self.playwright = None
+        self._slots: List[PooledBrowser] = []
+        self._retired: List[PooledBrowser] = []
+        self._lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        """Start the Playwright driver and launch the browsers."""
+        self.playwright = await async_playwright().start()
+        try:
+            for _ in range(self.size):
+                self._slots.append(await self._launch())
+        except Exception:
+            await self.close()
+            raise
+        logger.info(f"Browser pool started with {self.size} browser(s), recycled after {self.max_uses} uses")
+
+    async def _launch(self) -> PooledBrowser:
+        slot = PooledBrowser(await launch_chromium(self.playwright))
+        BROWSERS_OPEN.inc()
+        return slot
+
+    async def _close_browser(self, slot: PooledBrowser) -> None:
+        BROWSERS_OPEN.dec()
+        try:
+            await slot.browser.close()
+        except Exception as e:
+            logger.warning(f"Error closing pooled browser: {e}")
+
+    async def _retire(self, slot: PooledBrowser, reason: str) -> PooledBrowser:
+        """Replace a browser with a fresh one; the old one closes once it has no leases."""
+        logger.info(f"Recycling pooled browser ({reason})")
+        replacement = await self._launch()
+        self._slots[self._slots.index(slot)] = replacement
+        if slot.leases and slot.healthy:
+            self._retired.append(slot)
+        else:
+            await self._close_browser(slot)
+        return replacement
+
+    async def acquire(self) -> BrowserLease:
+        """Lease a new isolated context in the least busy healthy browser."""
+        if self.playwright is None:
+            raise RuntimeError("The browser pool has not been started")
+        async with self._lock:
+            slot = min(self._slots, key=lambda candidate: candidate.leases)
+            if not slot.healthy:
+                slot = await self._retire(slot, "browser disconnected")
+            elif slot.uses >= self.max_uses:
+                slot = await self._retire(slot, f"{slot.uses} uses")
+            slot.uses += 1
+            slot.leases += 1
+        try:
+            context = await new_portal_context(slot.browser)
+        except Exception:
+            slot.leases -= 1
+            raise
+        BROWSER_LEASES.inc()
+        return BrowserLease(slot, context)
+
+    def is_current(self, lease: BrowserLease) -> bool:
+        """Whether a lease's browser is still connected and has not been retired."""
+        return lease.slot in self._slots and lease.slot.healthy
+
+    async def release(self, lease: BrowserLease) -> None:
+        """Close a leased context and close its browser if it was retired meanwhile."""
+        BROWSER_LEASES.dec()
+        slot = lease.slot
+        slot.leases -= 1
+        try:
+            await lease.context.close()
+        except Exception as e:
+            logger.warning(f"Error closing leased browser context: {e}")
+        if slot in self._retired and not slot.leases:
+            self._retired.remove(slot)
+            await self._close_browser(slot)
+
+    async def close(self) -> None:
+        """Close every browser and stop the Playwright driver."""
+        for slot in self._slots + self._retired:
+            await self._close_browser(slot)
+        self._slots, self._retired = [], []
+        if self.playwright:
+            await self.playwright.stop()
+            self.playwright = None
+        logger.info("Browser pool closed")
@@ -1,18 +1,27 @@
 import asyncio
 import base64
 import datetime
+import importlib.metadata
+import json
 import logging
 import os
 import sys
 import glob
+from typing import Optional
 from urllib.parse import urlparse, parse_qs
 import subprocess
 from playwright.async_api import async_playwright, TimeoutError
 
+from data_transform.app_paths import app_data_dir
+from data_transform.metrics import BROWSERS_OPEN, timed
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Records the Chromium executable that last launched, so later launches skip the search and installer
+CHROMIUM_CACHE_FILE = "chromium.json"
+
 
 class PortalError(Exception):
     """Custom exception for portal-related errors."""
@@ -24,14 +33,70 @@ def resource_path(relative_path):
         return os.path.join(sys._MEIPASS, relative_path)
     return os.path.join(os.path.abspath("."), relative_path)
 
+def _chromium_cache_path() -> str:
+    return os.path.join(app_data_dir(), CHROMIUM_CACHE_FILE)
+
+
+def _playwright_version() -> str:
+    try:
+        return importlib.metadata.version("playwright")
+    except importlib.metadata.PackageNotFoundError:
+        return ""
+
+
+def cached_chromium_executable() -> Optional[str]:
+    """
+    Return the Chromium executable recorded by the last successful launch, or
+    None if there is no record, the file is gone or Playwright was upgraded since.
+    """
+    try:
+        with open(_chromium_cache_path(), encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    executable_path = cached.get("executable_path")
+    if not executable_path or not os.path.isfile(executable_path):
+        return None
+    if cached.get("playwright_version") != _playwright_version():
+        return None
+    return executable_path
+
+
+def cache_chromium_executable(executable_path: str, version: str) -> None:
+    """Record a Chromium executable that launched, with its version, in the app data directory."""
+    cache_path = _chromium_cache_path()
+    tmp_path = f"{cache_path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "executable_path": executable_path,
+                "version": version,
+                "playwright_version": _playwright_version(),
+                "installed_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            }, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Could not cache the Chromium location: {e}")
+
+
+def clear_chromium_cache() -> None:
+    try:
+        os.remove(_chromium_cache_path())
+    except OSError:
+        pass
+
+
+def install_chromium() -> None:
+    """Install Playwright's Chromium."""
+    logger.info("Installing Chromium via the playwright CLI...")
+    result = subprocess.run(['playwright', 'install', 'chromium'], capture_output=True, text=True)
+    if result.returncode != 0:
+        logger.warning(f"Could not install Chromium via playwright CLI: {result.stderr.strip()}")
+
+
 def find_chromium_executable():
     """Finds the Chromium executable dynamically inside bundled resources."""
     try:
-        # First try the system-wide installation
-        result = subprocess.run(['playwright', 'install', 'chromium'], capture_output=True, text=True)
-        if result.returncode != 0:
-            logger.warning("Could not install Chromium via playwright CLI")
-
         if sys.platform == 'win32':
             # Windows path
             chrome_relative_path = os.path.join('chromium-*', 'chrome-win', 'chrome.exe')
@@ -63,6 +128,58 @@ def find_chromium_executable():
         logger.error(f"Error finding Chromium executable: {e}")
         raise
 
+async def _launch(playwright, executable_path: Optional[str] = None):
+    browser = await playwright.chromium.launch(
+        executable_path=executable_path,
+        headless=True,
+        args=['--no-sandbox']
+    )
+    cache_chromium_executable(executable_path or playwright.chromium.executable_path, browser.version)
+    return browser
+
+
+async def launch_chromium(playwright):
+    """
+    Launch headless Chromium: the executable cached by the last successful
+    launch first, then Playwright's default, then a bundled/installed
+    executable and, as a last resort, after installing Playwright's Chromium.
+    """
+    cached_executable = cached_chromium_executable()
+    if cached_executable:
+        try:
+            return await playwright.chromium.launch(
+                executable_path=cached_executable,
+                headless=True,
+                args=['--no-sandbox']
+            )
+        except Exception as e:
+            logger.warning(f"Failed to launch cached Chromium {cached_executable}: {e}")
+            clear_chromium_cache()
+
+    try:
+        return await _launch(playwright)
+    except Exception as e:
+        logger.warning(f"Failed to launch browser with default config: {e}")
+
+    # Try to find specific Chromium executable
+    try:
+        return await _launch(playwright, find_chromium_executable())
+    except Exception as inner_e:
+        logger.error(f"Failed to launch browser with specific executable: {inner_e}")
+        # Try installing Playwright browsers as a last resort
+        install_chromium()
+        return await _launch(playwright)
+
+
+async def new_portal_context(browser):
+    """Create a browser context with the settings the portal needs."""
+    return await browser.new_context(
+        ignore_https_errors=True,
+        accept_downloads=True,
+        viewport={"width": 1280, "height": 720}
+    )
+
+
 class PortalClient:
     """
     A client to interact with a web portal for login, search, and document retrieval.
@@ -76,11 +193,16 @@ class PortalClient:
     """
 
     def __init__(self, username: str, password: str,
-                 cookies: list = None, base_url: str = "http://172.16.136.81"):
+                 cookies: list = None, base_url: str = "http://172.16.136.81", pool=None):
         self.username = username
         self.password = password
         self.cookies = cookies if cookies is not None else []
         self.base_url = base_url
+        # Optional BrowserPool: lease a context from a shared browser instead of launching one
+        self.pool = pool
+        self._lease = None
+        # Set by login(); a SessionPool hands out clients that are already logged in
+        self.logged_in = False
         self.playwright = None
         self.browser = None
         self.context = None
@@ -88,43 +210,28 @@ class PortalClient:
 
 
     async def __aenter__(self):
+        if self.pool is not None:
+            # Lease an isolated context in one of the pool's long-lived browsers
+            self._lease = await self.pool.acquire()
+            self.context = self._lease.context
+            try:
+                self.page = await self.context.new_page()
+                if self.cookies:
+                    await self.context.add_cookies(self.cookies)
+            except Exception:
+                await self.pool.release(self._lease)
+                self._lease = None
+                raise
+            return self
+
         try:
             self.playwright = await async_playwright().start()
-
-            # Try to launch browser with default configuration first
-            try:
-                self.browser = await self.playwright.chromium.launch(
-                    headless=True,
-                    args=['--no-sandbox']
-                )
-            except Exception as e:
-                logger.warning(f"Failed to launch browser with default config: {e}")
-
-                # Try to find specific Chromium executable
-                try:
-                    chromium_executable = find_chromium_executable()
-                    self.browser = await self.playwright.chromium.launch(
-                        executable_path=chromium_executable,
-                        headless=True,
-                        args=['--no-sandbox']
-                    )
-                except Exception as inner_e:
-                    logger.error(f"Failed to launch browser with specific executable: {inner_e}")
-                    # Try installing Playwright browsers as a last resort
-                    subprocess.run(["playwright", "install", "chromium"], check=True)
-                    self.browser = await self.playwright.chromium.launch(
-                        headless=True,
-                        args=['--no-sandbox']
-                    )
-
-            self.context = await self.browser.new_context(
-                ignore_https_errors=True,
-                accept_downloads=True,
-                viewport={"width": 1280, "height": 720}
-            )
+            self.browser = await launch_chromium(self.playwright)
+            self.context = await new_portal_context(self.browser)
             self.page = await self.context.new_page()
             if self.cookies:
                 await self.context.add_cookies(self.cookies)
+            BROWSERS_OPEN.inc()
             return self
         except Exception as e:
             logger.error(f"Failed to initialize browser context: {e}")
@@ -133,11 +240,18 @@ class PortalClient:
             raise
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self._lease is not None:
+            lease, self._lease = self._lease, None
+            await self.pool.release(lease)
+            return
+        if self.page:
+            BROWSERS_OPEN.dec()
         if self.browser:
             await self.browser.close()
         if self.playwright:
             await self.playwright.stop()
 
+    @timed("login")
     async def login(self) -> None:
         """Logs into the portal using the provided credentials."""
         login_url = f"{self.base_url}/Account/Login"
@@ -149,7 +263,12 @@ class PortalClient:
             await self.page.wait_for_selector("button.btn.btn-primary.btn-block", state="visible", timeout=100000)
             await self.page.click("button.btn.btn-primary.btn-block")
             await self.page.wait_for_load_state("networkidle", timeout=100000)
-            logger.info("Login successful.")
+            # A rejected login stays on the login page
+            self.logged_in = "/Account/Login" not in self.page.url
+            if self.logged_in:
+                logger.info("Login successful.")
+            else:
+                logger.error("The portal rejected the login.")
         except TimeoutError as e:
             logger.error("Timeout during login process.")
             raise PortalError("Timeout during login process.") from e
@@ -157,6 +276,39 @@ class PortalClient:
             logger.error(f"Error during login: {e}")
             raise PortalError("Login failed.") from e
 
+    @property
+    def browser_gone(self) -> bool:
+        """Whether this client's browser (or its page) was closed or crashed."""
+        browser = self._lease.slot.browser if self._lease is not None else self.browser
+        return self.page is None or self.page.is_closed() or (browser is not None and not browser.is_connected())
+
+    @property
+    def session_lost(self) -> bool:
+        """
+        Whether this client can no longer fetch: its browser is gone, or the portal
+        sent it back to the login page (``logged_in`` is then cleared).
+        """
+        if self.browser_gone:
+            return True
+        if "/Account/Login" in self.page.url:
+            self.logged_in = False
+            return True
+        return False
+
+    @timed("check_session")
+    async def check_session(self) -> bool:
+        """
+        Checks whether the portal still considers this client logged in.
+
+        Returns:
+            bool: False if the portal redirected to the login page.
+        """
+        await self.page.goto(self.base_url)
+        await self.page.wait_for_load_state("networkidle", timeout=100000)
+        self.logged_in = "/Account/Login" not in self.page.url
+        return self.logged_in
+
+    @timed("search_by_text")
     async def search_by_text(self, account_no) -> (str, str):
         """
         Searches by account number text and returns the customer ID.
@@ -183,6 +335,7 @@ class PortalClient:
             logger.error(f"Error in search_by_text: {e}")
             raise PortalError("Search by text failed.") from e
 
+    @timed("search_by_id")
     async def search_by_id(self, customer_id: str, customer_type: str) -> dict:
         """
         Searches by customer ID and extracts parameters required for navigation.
@@ -230,6 +383,7 @@ class PortalClient:
             logger.error(f"Error in search_by_id: {e}")
             raise PortalError("Search by ID failed.") from e
 
+    @timed("create_navigation_url")
     async def create_navigation_url(self, params: dict) -> str:
         """
         Calls CreateNavigationUrl API using the extracted parameters and retrieves the 'r' value.
@@ -257,6 +411,7 @@ class PortalClient:
             logger.error(f"Error in create_navigation_url: {e}")
             raise PortalError("Failed to create navigation URL.") from e
 
+    @timed("navigate_to_documents_page")
     async def navigate_to_documents_page(self, r_value: str) -> None:
         """
         Navigates to the documents page using the provided 'r' value.
@@ -270,6 +425,7 @@ class PortalClient:
             logger.error(f"Error navigating to documents page: {e}")
             raise PortalError("Navigation to documents page failed.") from e
 
+    @timed("fetch_document_data")
     async def fetch_document_data(self) -> dict:
         """
         Fetches document page data from the Document API.
@@ -300,6 +456,7 @@ class PortalClient:
             logger.error(f"Error fetching document data: {e}")
             raise PortalError("Fetching document data failed.") from e
 
+    @timed("fetch_pdf_data")
     async def fetch_pdf_data(self, document_id: str) -> bytes:
         """
         Fetches a PDF file as binary data for a given document ID.
@@ -341,6 +498,7 @@ class PortalClient:
             logger.error(f"Error fetching PDF data: {e}")
             raise PortalError("Fetching PDF data failed.") from e
 
+    @timed("save_pdf")
     async def save_pdf(self, pdf_data: bytes, filepath: str = 'output.pdf') -> None:
         """
         Saves the given binary PDF data to a file.
@@ -1,13 +1,34 @@
-from data_extractor.get_exact_pg import PortalClient
+import os
+import time
+import shutil
 import asyncio
-from data_transform.core_utils import extract_pdf_data, save_text_to_xlsx, generate_csv_from_docs, delete_pdf
 import logging
+import tempfile
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from data_extractor.browser_pool import BrowserPool
+from data_extractor.get_exact_pg import PortalClient
+from data_extractor.session_pool import SessionPool
+from data_transform.core_utils import _dummy_data
+from data_transform.extraction_cache import ExtractionCache
+from data_transform.writers import (
+    COMPRESSION_SUFFIXES, export_csv, export_parquet, export_parquet_from_env, export_xlsx, output_compression
+)
+from data_transform.results_store import ResultsStore, account_key
+from data_transform.pipeline import cached_extract, open_run_sink, output_stem
+from data_transform import metrics, tracing
 
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+OUTPUT_FORMATS = ("xlsx", "csv", "parquet")
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_DELAY = 5.0
+
+
 def get_user(user_type):
     """
     Returns the username and password based on the user type.
@@ -43,110 +64,293 @@ def get_user(user_type):
         return users["MUSCAT"]["username"], users["MUSCAT"]["password"]
 
 
+class AccountFailed(Exception):
+    """An account that yields a dummy row; ``retry`` is False for final answers such as "no bill"."""
+
+    def __init__(self, stage: str, message: str, retry: bool = True):
+        super().__init__(message)
+        self.stage = stage
+        self.retry = retry
+
+
+class SessionLost(Exception):
+    """A worker's portal session died (its browser went away); the account goes back to the queue."""
 
 
-async def main(user_type: str, accounts_list: list[str], output_directory: str):
+class BatchRun:
     """
-    Main function to handle the workflow of fetching and processing documents.
+    Headless extraction of an account list with several portal sessions at once.
+
+    Each of ``concurrency`` workers leases a logged-in session from a
+    SessionPool in a shared BrowserPool and takes accounts from a queue.
+    Accounts whose portal steps fail are retried ``retries`` times with
+    exponential backoff; when the portal logged the session out, it logs in
+    again first, and when the browser went away, the worker takes a new
+    session and the account is retried there. Rows go to the results store (and MongoDB when
+    configured), and the outputs are exported from it at the end. With
+    ``resume`` the latest unfinished run for the same source is continued,
+    skipping the accounts it already extracted.
 
     Args:
-        user_type (str): The user_type for authentication.
-        accounts_list (list[str]): List of account numbers to process.
-        output_directory (str): Directory to save the output files.
+        user_type: Company (SUBTYPE) the accounts belong to
+        accounts_list: Account numbers to extract
+        output_directory: Directory the outputs are written to
+        concurrency: Accounts processed at once
+        retries: Extra attempts for an account whose portal steps fail
+        retry_delay: Seconds before the first retry, doubled for each further one
+        formats: Output formats, out of OUTPUT_FORMATS
+        resume: Continue the latest unfinished run of ``source``
+        source: Identifies the input in the results store (e.g. the sheet's path)
+        browsers: Chromium browsers the sessions share (default: TASDEED_BROWSER_POOL_SIZE)
+        progress: Called with a dict for every progress event
     """
-    # Initialize the PortalClient with the provided username and password
-    username, password = get_user(user_type)
-    client = PortalClient(username=username, password=password, cookies=[])
-    async with client:
-        # Step 1: Login
-        await client.login()
-
-        for account_no in accounts_list:
-            logger.info(f"Processing account number: {account_no}")
-            try:
-                # Step 2: Search by text to get customer ID
-                customer_id, c_type = await client.search_by_text(account_no)
 
-                # Step 3: Search by ID to extract necessary parameters
-                params = await client.search_by_id(customer_id, c_type)
+    def __init__(self, user_type: str, accounts_list: Sequence[str], output_directory: str, concurrency: int = 1,
+                 retries: int = DEFAULT_RETRIES, retry_delay: float = DEFAULT_RETRY_DELAY,
+                 formats: Sequence[str] = ("xlsx",), resume: bool = False, source: str = "cli",
+                 browsers: Optional[int] = None, progress: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.user_type = user_type.upper()
+        self.accounts_list = list(accounts_list)
+        self.output_directory = output_directory
+        self.concurrency = max(concurrency, 1)
+        self.retries = max(retries, 0)
+        self.retry_delay = retry_delay
+        self.formats = list(formats)
+        self.resume = resume
+        self.source = f"cli:{source}"
+        self.browsers = browsers
+        self.progress = progress or (lambda event: None)
+        self.cache = ExtractionCache.default()
+        self.store = ResultsStore.default()
+        self.run_id = None
+        self.sink = None
+        self.pdf_folder = None
+        self.success_count = 0
+        self.fail_count = 0
+        self.done_count = 0
+        self.started_at = time.monotonic()
+        # Account -> (started, attempts) of accounts whose session died, until another worker takes them
+        self._interrupted: Dict[str, Tuple[float, int]] = {}
 
-                # Step 4: Create Navigation URL and extract r value
-                r_value = await client.create_navigation_url(params)
+    def _emit(self, event: str, **data) -> None:
+        self.progress({"event": event, "time": datetime.now().isoformat(timespec="seconds"), **data})
 
-                # Step 5: Navigate to the documents page
-                await client.navigate_to_documents_page(r_value)
+    def _start_or_resume_run(self) -> List[str]:
+        """Pick the run to write to and return the accounts it still needs."""
+        if self.resume:
+            for run in self.store.runs(self.user_type):
+                if run["source"] == self.source and not run["finished_at"]:
+                    self.run_id = run["run_id"]
+                    break
+        if self.run_id is None:
+            self.run_id = self.store.start_run(self.user_type, source=self.source)
+            return list(self.accounts_list)
 
-                # Step 6: Fetch document data from API
-                document_data = await client.fetch_document_data()
-                documents = document_data.get("Data", {}).get("Documents", [])
-                if not documents:
-                    logger.error("No documents found in document data.")
-                    # return
+        # Accounts with a real row are done; failed (dummy) accounts are tried again
+        written = self.store.run_accounts(self.run_id)
+        remaining = [account_no for account_no in self.accounts_list
+                     if written.get(account_key(account_no)) is not False]
+        self.success_count = self.done_count = len(self.accounts_list) - len(remaining)
+        logger.info(f"Resuming run {self.run_id}: {len(remaining)} of {len(self.accounts_list)} accounts left")
+        return remaining
 
-                # step 7: Handel the right document
-                document = documents[-1]
-                creation_date = document.get('CreationDate')
-                if not creation_date:
-                    logger.error("Creation date missing from document data.")
-                    # return
+    async def run(self) -> Dict[str, Any]:
+        """Extract every account and write the outputs; returns the summary (also emitted as "done")."""
+        os.makedirs(self.output_directory, exist_ok=True)
+        remaining = self._start_or_resume_run()
+        self._emit("start", user_type=self.user_type, run_id=self.run_id, total=len(self.accounts_list),
+                   remaining=len(remaining), resumed=len(remaining) < len(self.accounts_list),
+                   concurrency=self.concurrency)
 
-                try:
-                    if not PortalClient.is_in_current_month(creation_date):
-                        logger.info("Document is not from the current month. Aborting further PDF fetch.")
-                        # return
-                except ValueError as e:
-                    logger.error(f"Date format error: {e}")
-                    # return
+        # Off the event loop: connecting to MongoDB can block for seconds
+        self.sink = await asyncio.get_running_loop().run_in_executor(
+            None, open_run_sink, self.store, self.run_id, self.user_type)
+        self.pdf_folder = tempfile.mkdtemp(prefix="tasdeed_pdf_")
+
+        queue: "asyncio.Queue[str]" = asyncio.Queue()
+        for account_no in remaining:
+            queue.put_nowait(account_no)
 
-                # Step 8: Fetch PDF data for the document and save it
-                doc_id = document.get("Id")
-                pdf_data = await client.fetch_pdf_data(document_id=doc_id)
-                await client.save_pdf(pdf_data, filepath=f'./{doc_id}.pdf')
-                logger.info(f"PDF saved successfully for document ID {doc_id}.")
+        browser_pool = BrowserPool(self.browsers)
+        sessions = SessionPool(browser_pool, max_per_user=self.concurrency)
+        try:
+            if remaining:
+                await browser_pool.start()
+                username, password = get_user(self.user_type)
+                workers = min(self.concurrency, len(remaining))
+                results = await asyncio.gather(
+                    *(self._worker(sessions, username, password, queue) for _ in range(workers)),
+                    return_exceptions=True
+                )
+                errors = [result for result in results if isinstance(result, BaseException)]
+                # Workers that lost their session put their account back; fail if nobody was left to take it
+                if errors and not queue.empty():
+                    raise errors[0]
+            # Off the event loop, like the writes: the sessions are still open
+            await asyncio.get_running_loop().run_in_executor(None, self.sink.close)
+            outputs = self._export()
+            self.store.finish_run(self.run_id, outputs[0] if outputs else None)
+        finally:
+            await sessions.close()
+            await browser_pool.close()
+            self.sink.close()
+            shutil.rmtree(self.pdf_folder, ignore_errors=True)
+            metrics.write_textfile_from_env()
+            tracing.export_chrome_trace()
 
+        summary = {
+            "status": "completed" if not self.fail_count else "completed_with_failures",
+            "run_id": self.run_id,
+            "total": len(self.accounts_list),
+            "success": self.success_count,
+            "failed": self.fail_count,
+            "outputs": outputs,
+            "elapsed": round(time.monotonic() - self.started_at, 3),
+        }
+        self._emit("done", **summary)
+        return summary
+
+    async def _worker(self, sessions: SessionPool, username: str, password: str, queue: "asyncio.Queue[str]"):
+        while not queue.empty():
+            async with sessions.session(username, password) as client:
+                while not queue.empty():
+                    account_no = queue.get_nowait()
+                    try:
+                        await self._run_account(client, account_no)
+                    except SessionLost as e:
+                        logger.warning(f"Portal session lost ({e}), continuing with a new one")
+                        queue.put_nowait(account_no)
+                        sessions.discard(client)
+                        break
+                    except BaseException:
+                        # The session is gone: hand the account to the other workers
+                        queue.put_nowait(account_no)
+                        raise
 
-                # Step 9: Extract text from the PDF
-                extracted_data =  extract_pdf_data(f'./{doc_id}.pdf')
+    async def _recover_session(self, client: PortalClient) -> bool:
+        """Log a client the portal logged out in again; False if its browser is gone (or the login fails)."""
+        if client.browser_gone:
+            return False
+        logger.info("The portal logged the session out, logging in again")
+        try:
+            await client.login()
+        except Exception as e:
+            logger.warning(f"Could not log in again: {e}")
+            return False
+        return client.logged_in
 
-                # Step 10: Save extracted text to CSV TODO: here we need to insert the data to the file if it is already exist
-                save_text_to_xlsx(output_directory, extracted_data)
-                logger.info(f"Data saved successfully for account number {account_no}.")
-                delete_pdf(f'./{doc_id}.pdf')
-                logger.info(f"PDF deleted successfully for document ID {doc_id}.")
+    async def _run_account(self, client: PortalClient, account_no: str) -> None:
+        started, attempt = self._interrupted.pop(account_no, (time.monotonic(), 0))
+        with metrics.track_account(account_no):
+            while True:
+                attempt += 1
+                try:
+                    extracted_data = await self._process_account(client, account_no)
+                    break
+                except AccountFailed as e:
+                    failure = e
+                except Exception as e:
+                    failure = AccountFailed("unexpected", str(e))
+                if not failure.retry or attempt > self.retries:
+                    metrics.account_failed(failure.stage)
+                    self.sink.write(_dummy_data(account_no))
+                    self._finish_account(account_no, "failed", started, attempt, stage=failure.stage,
+                                         error=str(failure))
+                    return
+                if client.session_lost:
+                    if not await self._recover_session(client):
+                        self._interrupted[account_no] = (started, attempt)
+                        raise SessionLost(f"account {account_no} failed at {failure.stage}: {failure}")
+                    # The failure was the session's, not the account's: retry right away
+                    continue
+                delay = self.retry_delay * 2 ** (attempt - 1)
+                logger.warning(f"Account {account_no} failed at {failure.stage} ({failure}), retrying in {delay:g}s")
+                await asyncio.sleep(delay)
+            self.sink.write(extracted_data, account_no)
+            metrics.account_succeeded()
+        self._finish_account(account_no, "success", started, attempt)
 
+    def _finish_account(self, account_no: str, outcome: str, started: float, attempts: int, **details) -> None:
+        self.done_count += 1
+        if outcome == "success":
+            self.success_count += 1
+        else:
+            self.fail_count += 1
+        self._emit("account", account=account_no, outcome=outcome, attempts=attempts,
+                   seconds=round(time.monotonic() - started, 3), current=self.done_count,
+                   total=len(self.accounts_list), success=self.success_count, failed=self.fail_count, **details)
 
+    async def _process_account(self, client: PortalClient, account_no: str):
+        """Run the portal steps for one account and return its extracted row; raises AccountFailed."""
+        stage = "search_by_text"
+        try:
+            customer_id, customer_type = await client.search_by_text(account_no)
+            stage = "search_by_id"
+            params = await client.search_by_id(customer_id, customer_type)
+            stage = "create_navigation_url"
+            r_value = await client.create_navigation_url(params)
+            stage = "navigate_to_documents_page"
+            await client.navigate_to_documents_page(r_value)
+            stage = "fetch_document_data"
+            document_data = await client.fetch_document_data()
+        except Exception as e:
+            raise AccountFailed(stage, str(e)) from e
 
+        documents = document_data.get("Data", {}).get("Documents", [])
+        if not documents:
+            raise AccountFailed("no_documents", "No bill found", retry=False)
+        document = documents[-1]
+        creation_date = document.get("CreationDate")
+        if not creation_date or not PortalClient.is_in_current_month(creation_date):
+            raise AccountFailed("old_bill", "Old bill skipped", retry=False)
 
+        doc_id = document.get("Id")
+        pdf_path = os.path.join(self.pdf_folder, f"{doc_id}.pdf")
+        try:
+            return await cached_extract(self.cache, client, doc_id, pdf_path)
+        except Exception as e:
+            # The download and the parse are timed stages, so the account's last stage names the step
+            raise AccountFailed(metrics.current_stage() or "fetch_pdf_data", str(e)) from e
 
+    def _export(self) -> List[str]:
+        """Write the current row of each input account in each output format."""
+        stem = output_stem(self.output_directory, self.user_type, self.run_id[:8])
+        period = self.store.run_period(self.run_id)
+        outputs = []
+        for output_format in self.formats:
+            records = self.store.iter_current_records(self.user_type, period, self.accounts_list)
+            if output_format == "xlsx":
+                path = f"{stem}.xlsx"
+                export_xlsx(records, path)
+            elif output_format == "csv":
+                compression, level = output_compression()
+                path = f"{stem}.csv{COMPRESSION_SUFFIXES[compression] if compression else ''}"
+                export_csv(records, path, compression, level)
+            else:
+                path = f"{stem}.parquet"
+                export_parquet(records, path)
+            outputs.append(path)
+            self._emit("output", format=output_format, path=path)
+        if outputs and "parquet" not in self.formats:
+            try:
+                export_parquet_from_env(
+                    self.store.iter_current_records(self.user_type, period, self.accounts_list), outputs[0])
             except Exception as e:
-                logger.error(f"An error occurred: {e}")
-                continue
-
-
-# if __name__ == "__main__":
-#     # Example usage
-#     import pandas as pd
-#     import time
-#
-#     # Start the timer
-#     start_time = time.time()
-#     # Read the Excel file to get the list of account numbers
-#     df = pd.read_excel("/home/x/Desktop/tasdeed-projects_all/tasdeed_dktapp/MAZOON M EXCEL SHEET-2.xlsx", dtype={"ACCOUNTNO":str})  # Replace with the actual file path
-#     accounts_list = df["ACCOUNTNO"].astype(str).tolist()
-#     print(accounts_list)
-#     # Replace with the actual column name
-#     # For demonstration, using a hardcoded list of account numbers
-#
-#     user_type = "MAZOON"  # Replace with the desired user type
-#     # accounts_list = ["02136715", "00118494"]  # Replace with actual account numbers
-#     output_directory = "test_output"  # Replace with the desired output directory
-#
-#     # Run the main function
-#     asyncio.run(main(user_type, accounts_list, output_directory))
-#     end_time = time.time()
-#
-#     # Calculate and print the elapsed time
-#     elapsed_time = end_time - start_time
-#     print("start time:", start_time)
-#     print("end time:", end_time)
-#     print(f"Execution time: {elapsed_time:.2f} seconds")
\ No newline at end of file
+                logger.warning(f"Could not write the Parquet companion of {outputs[0]}: {e}")
+        return outputs
+
+
+async def main(user_type: str, accounts_list: List[str], output_directory: str, **options) -> Dict[str, Any]:
+    """
+    Extract the accounts of one user type into ``output_directory``.
+
+    Args:
+        user_type (str): The user_type for authentication.
+        accounts_list (list[str]): List of account numbers to process.
+        output_directory (str): Directory to save the output files.
+        **options: Further BatchRun arguments (concurrency, retries, formats, resume, ...)
+
+    Returns:
+        dict: The run summary
+    """
+    return await BatchRun(user_type, accounts_list, output_directory, **options).run()
@@ -0,0 +1,221 @@
+"""
+A pool of logged-in portal sessions, keyed by portal credentials.
+
+Logging in costs a full page load and a ``networkidle`` wait, and tasks for the
+same company (user type) use the same portal user, so a long-running process
+keeps logged-in ``PortalClient`` sessions around and leases them to tasks. A
+background keep-alive checks idle sessions, logs them in again when the portal
+has expired them and closes the ones idle for too long (or whose browser was
+recycled by the ``BrowserPool``).
+"""
+
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from data_extractor.browser_pool import BrowserPool
+from data_extractor.get_exact_pg import PortalClient
+from data_transform.metrics import PORTAL_SESSIONS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSIONS_PER_USER = 2
+DEFAULT_KEEPALIVE_SECONDS = 240.0
+DEFAULT_MAX_IDLE_SECONDS = 1800.0
+DEFAULT_RECHECK_SECONDS = 60.0
+
+SessionKey = Tuple[str, str, str]
+
+
+class PortalSession:
+    """A logged-in PortalClient and its bookkeeping."""
+
+    def __init__(self, key: SessionKey, client: PortalClient):
+        self.key = key
+        self.client = client
+        self.last_used = time.monotonic()
+        # Cleared by SessionPool.discard: close the session instead of reusing it
+        self.reusable = True
+
+
+class SessionPool:
+    """
+    Leases logged-in PortalClient sessions, at most ``max_per_user`` per portal user.
+
+    Configured with TASDEED_SESSIONS_PER_USER (default 2),
+    TASDEED_SESSION_KEEPALIVE_SECONDS (default 240),
+    TASDEED_SESSION_MAX_IDLE_SECONDS (default 1800) and
+    TASDEED_SESSION_RECHECK_SECONDS (default 60): a session idle for longer is
+    checked with the portal, and logged in again if needed, before it is leased.
+    """
+
+    def __init__(self, browser_pool: Optional[BrowserPool] = None, max_per_user: Optional[int] = None,
+                 keepalive_seconds: Optional[float] = None, max_idle_seconds: Optional[float] = None,
+                 recheck_seconds: Optional[float] = None):
+        self.browser_pool = browser_pool
+        self.max_per_user = max_per_user or int(os.environ.get("TASDEED_SESSIONS_PER_USER", DEFAULT_SESSIONS_PER_USER))
+        self.keepalive_seconds = keepalive_seconds or float(
+            os.environ.get("TASDEED_SESSION_KEEPALIVE_SECONDS", DEFAULT_KEEPALIVE_SECONDS))
+        self.max_idle_seconds = max_idle_seconds or float(
+            os.environ.get("TASDEED_SESSION_MAX_IDLE_SECONDS", DEFAULT_MAX_IDLE_SECONDS))
+        self.recheck_seconds = recheck_seconds if recheck_seconds is not None else float(
+            os.environ.get("TASDEED_SESSION_RECHECK_SECONDS", DEFAULT_RECHECK_SECONDS))
+        self._idle: Dict[SessionKey, List[PortalSession]] = {}
+        # id(client) -> session, for the sessions leased out
+        self._leased: Dict[int, PortalSession] = {}
+        self._counts: Dict[SessionKey, int] = {}
+        self._available = asyncio.Condition()
+        self._keepalive: Optional[asyncio.Task] = None
+        PORTAL_SESSIONS.set_function(lambda: sum(len(sessions) for sessions in self._idle.values()), "idle")
+        PORTAL_SESSIONS.set_function(
+            lambda: sum(self._counts.values()) - sum(len(sessions) for sessions in self._idle.values()), "in_use")
+
+    def start(self) -> None:
+        """Start the background keep-alive."""
+        self._keepalive = asyncio.create_task(self._keep_alive())
+
+    async def acquire(self, username: str, password: str, base_url: Optional[str] = None) -> PortalSession:
+        """
+        Lease a logged-in session for these credentials, logging in a new one
+        if none is idle and the user is below ``max_per_user``; otherwise wait.
+        """
+        client_kwargs = {"base_url": base_url} if base_url else {}
+        key = (username, password, base_url or "")
+        while True:
+            session = None
+            async with self._available:
+                while True:
+                    idle = self._idle.get(key)
+                    if idle:
+                        session = idle.pop()
+                        break
+                    if self._counts.get(key, 0) < self.max_per_user:
+                        self._counts[key] = self._counts.get(key, 0) + 1
+                        break
+                    await self._available.wait()
+            if session is None:
+                break
+            if await self._revalidate(session):
+                return self._lease(session)
+
+        client = PortalClient(username=username, password=password, cookies=[], pool=self.browser_pool,
+                              **client_kwargs)
+        try:
+            await client.__aenter__()
+            try:
+                await client.login()
+            except Exception:
+                await client.__aexit__(None, None, None)
+                raise
+        except BaseException:
+            await self._forget(key)
+            raise
+        logger.info(f"Opened portal session for {username}")
+        return self._lease(PortalSession(key, client))
+
+    def discard(self, client: PortalClient) -> None:
+        """Close the leased session of this client when it is released instead of reusing it."""
+        session = self._leased.get(id(client))
+        if session is not None:
+            session.reusable = False
+
+    async def release(self, session: PortalSession, reusable: bool = True) -> None:
+        """Return a session to the pool, or close it if it may be broken."""
+        self._leased.pop(id(session.client), None)
+        if not reusable or not session.reusable or not self._usable(session):
+            await self._close(session)
+            return
+        session.last_used = time.monotonic()
+        async with self._available:
+            self._idle.setdefault(session.key, []).append(session)
+            self._available.notify_all()
+
+    @asynccontextmanager
+    async def session(self, username: str, password: str, base_url: Optional[str] = None
+                      ) -> AsyncIterator[PortalClient]:
+        """Lease a logged-in PortalClient for the duration of a ``with`` block."""
+        session = await self.acquire(username, password, base_url)
+        try:
+            yield session.client
+        except BaseException:
+            await self.release(session, reusable=False)
+            raise
+        await self.release(session)
+
+    def _lease(self, session: PortalSession) -> PortalSession:
+        session.last_used = time.monotonic()
+        self._leased[id(session.client)] = session
+        return session
+
+    async def _revalidate(self, session: PortalSession) -> bool:
+        """Check an idle session before leasing it; False (and the session closed) if it is unusable."""
+        try:
+            if not self._usable(session):
+                await self._close(session)
+                return False
+            if time.monotonic() - session.last_used > self.recheck_seconds and not await session.client.check_session():
+                logger.info(f"Portal session of {session.key[0]} expired, logging in again")
+                await session.client.login()
+                if not session.client.logged_in:
+                    await self._close(session)
+                    return False
+        except Exception as e:
+            logger.warning(f"Idle portal session failed its check, closing it: {e}")
+            await self._close(session)
+            return False
+        return True
+
+    def _usable(self, session: PortalSession) -> bool:
+        lease = session.client._lease
+        return session.client.logged_in and (lease is None or self.browser_pool.is_current(lease))
+
+    async def _forget(self, key: SessionKey) -> None:
+        async with self._available:
+            self._counts[key] -= 1
+            self._available.notify_all()
+
+    async def _close(self, session: PortalSession) -> None:
+        try:
+            await session.client.__aexit__(None, None, None)
+        except Exception as e:
+            logger.warning(f"Error closing portal session: {e}")
+        await self._forget(session.key)
+
+    async def _keep_alive(self) -> None:
+        while True:
+            await asyncio.sleep(self.keepalive_seconds)
+            async with self._available:
+                idle = [session for sessions in self._idle.values() for session in sessions]
+                self._idle.clear()
+            for session in idle:
+                try:
+                    if time.monotonic() - session.last_used > self.max_idle_seconds or not self._usable(session):
+                        await self._close(session)
+                        continue
+                    if not await session.client.check_session():
+                        logger.info(f"Portal session of {session.key[0]} expired, logging in again")
+                        await session.client.login()
+                        if not session.client.logged_in:
+                            await self._close(session)
+                            continue
+                except Exception as e:
+                    logger.warning(f"Portal session keep-alive failed, closing the session: {e}")
+                    await self._close(session)
+                    continue
+                async with self._available:
+                    self._idle.setdefault(session.key, []).append(session)
+                    self._available.notify_all()
+
+    async def close(self) -> None:
+        """Stop the keep-alive and log out every idle session (sessions in use are closed by their tasks)."""
+        if self._keepalive:
+            self._keepalive.cancel()
+            await asyncio.gather(self._keepalive, return_exceptions=True)
+        async with self._available:
+            idle = [session for sessions in self._idle.values() for session in sessions]
+            self._idle.clear()
+        for session in idle:
+            await self._close(session)
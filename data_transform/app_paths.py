@@ -0,0 +1,15 @@
+import os
+
+
+def app_data_dir() -> str:
+    """
+    Return the per-user ORION application data directory, creating it if needed.
+
+    Windows: %LOCALAPPDATA%\\ORION, Linux/Mac: ~/.local/share/ORION
+    """
+    if os.name == 'nt':  # Windows
+        path = os.path.join(os.environ.get("LOCALAPPDATA", os.getcwd()), "ORION")
+    else:  # Linux/Mac
+        path = os.path.join(os.path.expanduser("~"), ".local", "share", "ORION")
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,211 @@
+import re
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, Optional, Tuple, Union
+
+from .pdf_typs import pdf_types
+
+# Text written to file outputs for fields that have no value (failed/dummy rows)
+NULL_TEXT = "null"
+
+# Field names in output order: the union of every template's fields, keeping the
+# order in which they first appear in pdf_types.
+FIELDS: Tuple[str, ...] = tuple(dict.fromkeys(
+    field_name for pdf_type in pdf_types.values() for field_name in pdf_type['fields']
+))
+
+_NUMERIC_FIELDS = {
+    "Previous_Reading",
+    "Current_Reading",
+    "Government_Subsidy",
+    "Total_Before_VAT",
+    "VAT",
+    "Total_After_VAT",
+    "Total_Payable_Amount",
+}
+_NUMERIC_PREFIXES = ("Consumption_KWH_", "Rate_")
+
+_DATE_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y-%m-%d", "%d-%b-%Y", "%d-%b-%y", "%d %b %Y", "%d/%m/%y")
+
+_NUMBER_RE = re.compile(r"^\d+(\.\d+)?$")
+
+
+def _field_type(field_name: str) -> type:
+    if field_name.endswith("_Date"):
+        return date
+    if field_name in _NUMERIC_FIELDS or field_name.startswith(_NUMERIC_PREFIXES):
+        return float
+    return str
+
+
+# Column types derived from the field names; used by writers and database sinks.
+FIELD_TYPES: Dict[str, type] = {field_name: _field_type(field_name) for field_name in FIELDS}
+
+
+def parse_number(text: Optional[str]) -> Union[float, str, None]:
+    """
+    Parse a numeric bill value such as "1,234.500", "12.300-" or "(5.000)".
+
+    Returns the float value, None for empty text, or the stripped text unchanged
+    when it is not a number so that no information is lost.
+    """
+    if text is None:
+        return None
+    cleaned = str(text).strip()
+    if not cleaned or cleaned.lower() == NULL_TEXT:
+        return None
+
+    candidate = cleaned.replace(",", "").replace(" ", "")
+    negative = False
+    if candidate.startswith("(") and candidate.endswith(")"):
+        candidate, negative = candidate[1:-1], True
+    if candidate.endswith("-"):
+        candidate, negative = candidate[:-1], True
+    if candidate.startswith("-"):
+        candidate, negative = candidate[1:], True
+
+    if _NUMBER_RE.match(candidate):
+        value = float(candidate)
+        return -value if negative else value
+    return cleaned
+
+
+def parse_date(text: Optional[str]) -> Union[date, str, None]:
+    """
+    Parse a bill date using the formats seen across the supported templates.
+
+    Returns a date, None for empty text, or the stripped text unchanged when no
+    format matches.
+    """
+    if text is None:
+        return None
+    cleaned = str(text).strip()
+    if not cleaned or cleaned.lower() == NULL_TEXT:
+        return None
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(cleaned, fmt).date()
+        except ValueError:
+            continue
+    return cleaned
+
+
+def parse_field(field_name: str, value: Any) -> Any:
+    """Convert an extracted text value to the column type of ``field_name``."""
+    field_type = FIELD_TYPES.get(field_name, str)
+    if field_type is float:
+        return parse_number(value)
+    if field_type is date:
+        return parse_date(value)
+    if value is None:
+        return None
+    return str(value)
+
+
+class BillRecord:
+    """
+    A single extracted bill, stored as one slot per schema field.
+
+    Numeric and date fields are parsed once when the record is built, so writers
+    and database sinks can consume typed values directly. The record also
+    behaves like a read-only mapping (``keys``, ``items``, ``get``, ``[]``).
+    """
+
+    __slots__ = FIELDS + ("is_dummy", "input_account")
+
+    def __init__(self, values: Optional[Dict[str, Any]] = None, is_dummy: bool = False):
+        for field_name in FIELDS:
+            setattr(self, field_name, None)
+        self.is_dummy = is_dummy
+        # The account number as given in the input sheet (the PDF's Account_No may be formatted differently)
+        self.input_account: Optional[str] = None
+        if values:
+            for field_name, value in values.items():
+                if field_name in FIELD_TYPES:
+                    setattr(self, field_name, value)
+
+    @classmethod
+    def from_text(cls, raw: Dict[str, Optional[str]]) -> "BillRecord":
+        """Build a record from the handler output of ``extract_pdf_data``, parsing typed fields."""
+        return cls({field_name: parse_field(field_name, value) for field_name, value in raw.items()})
+
+    @classmethod
+    def dummy(cls, account_no: Any) -> "BillRecord":
+        """Return the placeholder record written for accounts whose bill could not be extracted."""
+        record = cls(is_dummy=True)
+        record.Account_No = f"{account_no}"
+        record.input_account = f"{account_no}"
+        return record
+
+    @classmethod
+    def from_dict(cls, values: Dict[str, Any], is_dummy: bool = False) -> "BillRecord":
+        """Rebuild a record from ``to_dict`` output (e.g. JSON), re-parsing typed fields."""
+        parsed = {}
+        for field_name, value in values.items():
+            if field_name not in FIELD_TYPES:
+                continue
+            if FIELD_TYPES[field_name] is date and isinstance(value, str):
+                try:
+                    value = date.fromisoformat(value)
+                except ValueError:
+                    value = parse_date(value)
+            parsed[field_name] = value
+        return cls(parsed, is_dummy=is_dummy)
+
+    def keys(self) -> Tuple[str, ...]:
+        return FIELDS
+
+    def values(self) -> Iterator[Any]:
+        return (getattr(self, field_name) for field_name in FIELDS)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        return ((field_name, getattr(self, field_name)) for field_name in FIELDS)
+
+    def get(self, field_name: str, default: Any = None) -> Any:
+        if field_name not in FIELD_TYPES:
+            return default
+        return getattr(self, field_name)
+
+    def __getitem__(self, field_name: str) -> Any:
+        if field_name not in FIELD_TYPES:
+            raise KeyError(field_name)
+        return getattr(self, field_name)
+
+    def __contains__(self, field_name: str) -> bool:
+        return field_name in FIELD_TYPES
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(FIELDS)
+
+    def __len__(self) -> int:
+        return len(FIELDS)
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, BillRecord):
+            return NotImplemented
+        return self.is_dummy == other.is_dummy and tuple(self.values()) == tuple(other.values())
+
+    def __repr__(self) -> str:
+        return f"BillRecord(Account_No={self.Account_No!r}, Invoice_Month={self.Invoice_Month!r}, is_dummy={self.is_dummy})"
+
+    def to_dict(self, null: Any = None) -> Dict[str, Any]:
+        """
+        Return the typed values as a plain dict.
+
+        Args:
+            null: Value used in place of missing fields (e.g. ``NULL_TEXT`` for file outputs).
+        """
+        return {field_name: null if value is None else value for field_name, value in self.items()}
+
+    def to_json_dict(self) -> Dict[str, Any]:
+        """Return a JSON-serialisable dict; dates are written in ISO format."""
+        return {
+            field_name: value.isoformat() if isinstance(value, date) else value
+            for field_name, value in self.items()
+        }
+
+
+def as_row_dict(extracted_data: Union[BillRecord, Dict[str, Any]], null: Any = NULL_TEXT) -> Dict[str, Any]:
+    """Return a writer-ready dict for either a ``BillRecord`` or a plain dict."""
+    if isinstance(extracted_data, BillRecord):
+        return extracted_data.to_dict(null=null)
+    return dict(extracted_data)
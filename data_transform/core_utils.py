@@ -9,20 +9,29 @@ import logging
 import pandas as pd
 
 from .pdf_typs import pdf_types
-from typing import Dict, Optional, List
+from .bill_record import BillRecord, as_row_dict
+from .writers import COMPRESSION_SUFFIXES, open_text_output
+from .metrics import timed
+from typing import Dict, Iterable, Iterator, Optional, List
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def save_text_to_csv(output_directory, extracted_text, filename='output.csv'):
+def save_text_to_csv(output_directory, extracted_text, filename='output.csv', compression=None, level=None):
     """
     Save extracted text data to a CSV file.
 
+    With ``compression`` the row is appended to ``<filename>.gz``/``.zst`` as a
+    new gzip member / zstd frame. Every call reopens the file, so long runs
+    should use ``CsvAppendWriter`` or ``export_csv`` instead.
+
     Args:
         output_directory (str): Directory to save the CSV file
-        extracted_text (dict): Dictionary containing extracted data
+        extracted_text (dict): Dictionary mapping page numbers to BillRecord (or dict) rows
         filename (str, optional): Name of the CSV file. Defaults to 'output.csv'.
+        compression (str, optional): 'gzip' or 'zstd'. Defaults to a plain CSV.
+        level (int, optional): Compression level. Defaults to the codec's default.
 
     Raises:
         ValueError: If extracted_text is empty or invalid
@@ -40,17 +49,20 @@ def save_text_to_csv(output_directory, extracted_text, filename='output.csv'):
             logger.info(f"Created directory: {output_directory}")
 
         csv_path = os.path.join(output_directory, filename)
+        if compression:
+            csv_path += COMPRESSION_SUFFIXES[compression]
 
         # Extract the data from extracted_text[0]
         extracted_data = extracted_text[0]
 
-        if not extracted_data or not isinstance(extracted_data, dict):
+        if not extracted_data or not isinstance(extracted_data, (dict, BillRecord)):
             raise ValueError("Invalid data format in extracted text")
+        extracted_data = as_row_dict(extracted_data)
 
         # Check if CSV exists; if not, create it with headers
         file_exists = os.path.exists(csv_path)
 
-        with open(csv_path, mode='a', newline='', encoding='utf-8') as csv_file:
+        with open_text_output(csv_path, mode='a', compression=compression, level=level) as csv_file:
             writer = csv.DictWriter(csv_file, fieldnames=extracted_data.keys())
 
             # If file doesn't exist, write the headers
@@ -76,9 +88,13 @@ def save_text_to_xlsx(output_directory, extracted_text, filename='output.xlsx'):
     """
     Save extracted text data to an Excel file.
 
+    Note: this re-reads and rewrites the whole workbook on every call. For runs
+    over many accounts, write the rows through a ``BufferedSink`` into the
+    results store and stream them out once with ``data_transform.writers.export_xlsx``.
+
     Args:
         output_directory (str): Directory to save the Excel file
-        extracted_text (dict): Dictionary containing extracted data
+        extracted_text (dict): Dictionary mapping page numbers to BillRecord (or dict) rows
         filename (str, optional): Name of the Excel file. Defaults to 'output.xlsx'.
 
     Raises:
@@ -101,8 +117,9 @@ def save_text_to_xlsx(output_directory, extracted_text, filename='output.xlsx'):
         # Extract the data from extracted_text[0]
         extracted_data = extracted_text[0]
 
-        if not extracted_data or not isinstance(extracted_data, dict):
+        if not extracted_data or not isinstance(extracted_data, (dict, BillRecord)):
             raise ValueError("Invalid data format in extracted text")
+        extracted_data = as_row_dict(extracted_data)
 
         # Check if Excel file exists; if it does, read existing data
         if os.path.exists(excel_path):
@@ -256,6 +273,7 @@ def determine_pdf_type(page):
     else:
         return 'dofar'
 
+@timed("extract_pdf_data")
 def extract_pdf_data(pdf_file):
     """
     Extract data from a PDF file based on predefined coordinates and field types.
@@ -264,7 +282,7 @@ def extract_pdf_data(pdf_file):
         pdf_file (str): Path to the PDF file
 
     Returns:
-        dict: Dictionary containing extracted data from each page
+        dict: Dictionary mapping each page number to a typed BillRecord
 
     Raises:
         FileNotFoundError: If the PDF file does not exist
@@ -297,7 +315,7 @@ def extract_pdf_data(pdf_file):
                 try:
                     fields = pdf_types[pdf_type]['fields']
                 except KeyError as e:
-                    data[num] = _dummy_data(num)
+                    data[num] = BillRecord.dummy(num)
                     logger.error(f"PDF type '{pdf_type}' not defined in pdf_types or missing 'fields': {e}")
                     raise KeyError(f"PDF type configuration error: {str(e)}")
 
@@ -319,12 +337,13 @@ def extract_pdf_data(pdf_file):
                     except KeyError as e:
                         logger.error(f"Missing required field info for '{field_name}': {e}")
                         page_data[field_name] = None
-                        data[num] = _dummy_data(num)
+                        data[num] = BillRecord.dummy(num)
 
-                data[num] = page_data
+                # Numeric and date fields are parsed once here so downstream writers get typed values
+                data[num] = BillRecord.from_text(page_data)
                 num += 1
             except Exception as e:
-                data[num] = _dummy_data(num)
+                data[num] = BillRecord.dummy(num)
                 logger.error(f"Error processing page {page_number} in {pdf_file}: {e}")
                 # Continue with next page instead of failing the whole process
 
@@ -341,37 +360,8 @@ def extract_pdf_data(pdf_file):
             # Don't raise here as the main operation might have succeeded
 
 def _dummy_data(acc):
-    return {0: {
-        "Customer": "null",
-        "Customer_No": "null",
-        "Account_No": f"{acc}",
-        "Meter_No": "null",
-        "Previous_Reading_Date": "null",
-        "Previous_Reading": "null",
-        "Current_Reading_Date": "null",
-        "Current_Reading": "null",
-        "Due_Date": "null",
-        "Reading_Type": "null",
-        "Tariff_Type": "null",
-        "Invoice_Month": "null",
-        "Government_Subsidy": "null",
-        "Consumption_KWH_1": "null",
-        "Rate_1": "null",
-        "Consumption_KWH_2": "null",
-        "Rate_2": "null",
-        "Consumption_KWH_3": "null",
-        "Rate_3": "null",
-        "Consumption_KWH_4": "null",
-        "Rate_4": "null",
-        "Consumption_KWH_5": "null",
-        "Rate_5": "null",
-        "Consumption_KWH_6": "null",
-        "Rate_6": "null",
-        "Total_Before_VAT": "null",
-        "VAT": "null",
-        "Total_After_VAT": "null",
-        "Total_Payable_Amount": "null"
-    }}
+    """Return the placeholder result (a sentinel BillRecord) for an account whose bill could not be extracted."""
+    return {0: BillRecord.dummy(acc)}
 
 def is_float(string):
     try:
@@ -380,15 +370,40 @@ def is_float(string):
     except ValueError:
         return False
 
+def iter_csv_from_docs(docs: Iterable, chunk_size: int = 64 * 1024) -> Iterator[str]:
+    """
+    Generate CSV text from documents incrementally.
+
+    Rows are converted one at a time and yielded in chunks of roughly
+    ``chunk_size`` characters, so the whole CSV is never held in memory.
+    The header is taken from the first document.
+
+    Args:
+        docs (Iterable): BillRecords or row dicts (e.g. a results store query)
+        chunk_size (int, optional): Approximate size of each yielded chunk
+
+    Yields:
+        str: Consecutive pieces of the CSV text
+    """
+    csv_buffer = io.StringIO()
+    writer = None
+    for doc in docs:
+        row = as_row_dict(doc)
+        if writer is None:
+            writer = csv.DictWriter(csv_buffer, fieldnames=row.keys(), quoting=csv.QUOTE_MINIMAL, escapechar='\\')
+            writer.writeheader()
+        writer.writerow(row)
+        if csv_buffer.tell() >= chunk_size:
+            yield csv_buffer.getvalue()
+            csv_buffer.seek(0)
+            csv_buffer.truncate()
+    if csv_buffer.tell():
+        yield csv_buffer.getvalue()
+
 def generate_csv_from_docs(docs: List[Dict]) -> Optional[io.StringIO]:
     """
     Generate CSV data from a list of documents.
     """
     if not docs:
         return None
-    csv_buffer = io.StringIO()
-    writer = csv.DictWriter(csv_buffer, fieldnames=docs[0].keys(), quoting=csv.QUOTE_MINIMAL, escapechar='\\')
-    writer.writeheader()
-    writer.writerows(docs)
-    csv_buffer.seek(0)
-    return csv_buffer
+    return io.StringIO("".join(iter_csv_from_docs(docs)))
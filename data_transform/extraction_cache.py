@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import hashlib
+import inspect
+import sqlite3
+import logging
+import threading
+from typing import Dict, Optional
+
+from . import pdf_typs
+from .pdf_typs import pdf_types
+from .bill_record import BillRecord, FIELD_TYPES
+from .app_paths import app_data_dir
+
+logger = logging.getLogger(__name__)
+
+# Bump when the cached payload layout changes in a way the template fingerprint cannot see
+CACHE_FORMAT_VERSION = 1
+
+DEFAULT_MAX_ENTRIES = 5000
+
+
+def _describe_handler(handler) -> str:
+    """Return a stable description of a field handler (function or functools.partial)."""
+    func = getattr(handler, 'func', handler)
+    name = f"{getattr(func, '__module__', '')}.{getattr(func, '__qualname__', repr(func))}"
+    args = getattr(handler, 'args', ())
+    keywords = getattr(handler, 'keywords', {})
+    return f"{name}{args}{sorted(keywords.items()) if keywords else ''}"
+
+
+def _handler_code() -> str:
+    """
+    Return the code behind the field handlers: the source of the pdf_typs module,
+    so that editing a handler's body (not just its name) changes the version.
+
+    Frozen builds ship no source; there the handlers' bytecode stands in for it.
+    """
+    try:
+        return inspect.getsource(pdf_typs)
+    except (OSError, TypeError):
+        functions = {getattr(getattr(field_info.get('handler'), 'func', field_info.get('handler')), '__code__', None)
+                     for config in pdf_types.values() for field_info in config['fields'].values()}
+        return "".join(sorted(f"{code.co_name}:{code.co_code.hex()}{code.co_consts}" for code in functions if code))
+
+
+def template_version() -> str:
+    """
+    Fingerprint of the pdf_types templates and the BillRecord schema.
+
+    Any change to a field's coordinates or handler (including the handler code),
+    or to the record column types, produces a new version, which invalidates
+    previously cached extractions.
+    """
+    description = [f"format={CACHE_FORMAT_VERSION}",
+                   f"handlers={hashlib.sha1(_handler_code().encode('utf-8')).hexdigest()}"]
+    for pdf_type, config in pdf_types.items():
+        for field_name, field_info in config['fields'].items():
+            handler = _describe_handler(field_info.get('handler')) if field_info.get('handler') else 'identity'
+            description.append(f"{pdf_type}|{field_name}|{tuple(field_info['coordinates'])}|{handler}")
+    description.extend(f"{name}:{field_type.__name__}" for name, field_type in FIELD_TYPES.items())
+    return hashlib.sha1("\n".join(description).encode('utf-8')).hexdigest()
+
+
+def hash_pdf(pdf_data: bytes) -> str:
+    """Return the content hash stored alongside a cached extraction."""
+    return hashlib.sha256(pdf_data).hexdigest()
+
+
+class ExtractionCache:
+    """
+    Persistent LRU cache of ``extract_pdf_data`` results keyed by portal document Id.
+
+    The key is the document Id plus the template version only: a hit is what
+    lets the pipelines skip the PDF download, so the bytes are not there to
+    check. This relies on the portal never changing a document once it has an
+    Id. The PDF content hash is stored with each entry so a caller that has the
+    bytes can verify the entry (``get(doc_id, content_hash)``). Entries from an
+    older template version are dropped when the cache is opened, and the least
+    recently used entries are evicted beyond ``max_entries``.
+    """
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path or os.path.join(app_data_dir(), "extraction_cache.sqlite3")
+        self.max_entries = max_entries
+        self.version = template_version()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS extractions ("
+            " doc_id TEXT PRIMARY KEY,"
+            " content_hash TEXT NOT NULL,"
+            " template_version TEXT NOT NULL,"
+            " data TEXT NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_extractions_last_used ON extractions (last_used)")
+        removed = self._conn.execute(
+            "DELETE FROM extractions WHERE template_version != ?", (self.version,)
+        ).rowcount
+        self._conn.commit()
+        if removed:
+            logger.info(f"Extraction cache: dropped {removed} entries from an older template version")
+
+    @classmethod
+    def default(cls) -> Optional["ExtractionCache"]:
+        """
+        Return the process-wide cache in the application data directory.
+
+        Returns None (extraction then runs uncached) if the cache is disabled with
+        TASDEED_CACHE_MAX_ENTRIES=0 or cannot be opened.
+        """
+        with cls._default_lock:
+            if cls._default is None:
+                max_entries = int(os.environ.get("TASDEED_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+                if max_entries <= 0:
+                    return None
+                try:
+                    cls._default = cls(max_entries=max_entries)
+                except (sqlite3.Error, OSError) as e:
+                    logger.warning(f"Extraction cache unavailable, continuing without it: {e}")
+                    return None
+            return cls._default
+
+    def get(self, doc_id: str, content_hash: Optional[str] = None) -> Optional[Dict[int, BillRecord]]:
+        """
+        Return the cached extraction for ``doc_id``, or None on a miss (a
+        database error is logged and counted as a miss).
+
+        Without ``content_hash`` the entry is trusted on its document Id and
+        template version alone (see the class docstring).
+
+        Args:
+            doc_id (str): Portal document Id
+            content_hash (str, optional): If given, the entry must also match this PDF hash
+        """
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT content_hash, data FROM extractions WHERE doc_id = ? AND template_version = ?",
+                    (str(doc_id), self.version)
+                ).fetchone()
+                if row is None or (content_hash is not None and row[0] != content_hash):
+                    self.misses += 1
+                    return None
+                self._conn.execute("UPDATE extractions SET last_used = ? WHERE doc_id = ?",
+                                   (time.time(), str(doc_id)))
+                self._conn.commit()
+                self.hits += 1
+        except sqlite3.Error as e:
+            # The cache only saves work: a locked or broken database is a miss, not a failed account
+            logger.warning(f"Extraction cache read failed for document {doc_id}, treating it as a miss: {e}")
+            self.misses += 1
+            return None
+
+        try:
+            pages = json.loads(row[1])
+            return {int(page): BillRecord.from_dict(values) for page, values in pages.items()}
+        except (ValueError, TypeError, AttributeError) as e:
+            logger.warning(f"Discarding unreadable cache entry for document {doc_id}: {e}")
+            self.invalidate(doc_id)
+            return None
+
+    def put(self, doc_id: str, content_hash: str, data: Dict[int, BillRecord]) -> None:
+        """
+        Store an extraction result. Results containing placeholder pages are not
+        cached, and a database error is logged and otherwise ignored.
+
+        Args:
+            doc_id (str): Portal document Id
+            content_hash (str): Hash of the PDF bytes (see ``hash_pdf``)
+            data (dict): Result of ``extract_pdf_data``
+        """
+        if not data or any(getattr(record, 'is_dummy', True) for record in data.values()):
+            return
+        payload = json.dumps({str(page): record.to_json_dict() for page, record in data.items()})
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO extractions (doc_id, content_hash, template_version, data, last_used)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (str(doc_id), content_hash, self.version, payload, time.time())
+                )
+                self._conn.execute(
+                    "DELETE FROM extractions WHERE doc_id IN ("
+                    " SELECT doc_id FROM extractions ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Extraction cache write failed for document {doc_id}, not caching it: {e}")
+                try:
+                    self._conn.rollback()
+                except sqlite3.Error:
+                    pass
+
+    def invalidate(self, doc_id: str) -> None:
+        """Remove a single entry."""
+        with self._lock:
+            try:
+                self._conn.execute("DELETE FROM extractions WHERE doc_id = ?", (str(doc_id),))
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Extraction cache could not remove document {doc_id}: {e}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,384 @@
+"""
+Lightweight in-process metrics in the Prometheus text exposition format.
+
+The pipelines (GUI, web and CLI) report through a few hooks:
+
+* ``timed(stage)`` decorates a sync or async function, and ``stage(name)`` wraps
+  a block; both record the duration in ``tasdeed_stage_seconds{stage=...}``.
+* ``track_account(account_no)`` wraps the processing of one account (in-flight
+  gauge, end-to-end latency, accounts/s), and ``account_succeeded()`` /
+  ``account_failed(stage)`` count its outcome. A failure without an explicit
+  stage is attributed to the last stage entered for that account.
+
+With TASDEED_TRACE_DIR set, the same hooks also record a span per stage and per
+account (see ``tracing``).
+
+The web server exposes ``render()`` at ``/metrics``; the GUI and CLI write the
+same text to TASDEED_METRICS_FILE (e.g. for node_exporter's textfile collector)
+when it is set.
+"""
+
+import os
+import math
+import time
+import asyncio
+import logging
+import functools
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+FLUSH_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+RATE_WINDOW_SECONDS = 60.0
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Base class: a named metric with optional labels; one child value per label combination."""
+
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.label_names:
+            # Unlabelled metrics are exported (as zero) before their first update
+            self._children[()] = self._new_child()
+
+    def _child(self, label_values: Tuple[str, ...]):
+        if len(label_values) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}")
+        with self._lock:
+            child = self._children.get(label_values)
+            if child is None:
+                child = self._children[label_values] = self._new_child()
+            return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return [0.0]
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        child = self._child(label_values)
+        with self._lock:
+            child[0] += amount
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            items = [(labels, child[0]) for labels, child in self._children.items()]
+        for labels, value in items:
+            yield f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """A value that goes up and down; a child may instead be read from a function at render time."""
+
+    kind = "gauge"
+
+    def _new_child(self):
+        return [0.0, None]
+
+    def set(self, value: float, *label_values: str) -> None:
+        child = self._child(label_values)
+        with self._lock:
+            child[0] = value
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        child = self._child(label_values)
+        with self._lock:
+            child[0] += amount
+
+    def dec(self, *label_values: str, amount: float = 1.0) -> None:
+        self.inc(*label_values, amount=-amount)
+
+    def set_function(self, function: Callable[[], float], *label_values: str) -> None:
+        child = self._child(label_values)
+        with self._lock:
+            child[1] = function
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            items = list(self._children.items())
+        for labels, (value, function) in items:
+            if function is not None:
+                try:
+                    value = function()
+                except Exception as e:
+                    logger.warning(f"Metric {self.name} could not be read: {e}")
+                    continue
+            yield f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, help_text, labels)
+
+    def _new_child(self):
+        # Per-bucket counts (not cumulative), then sum
+        return [[0] * len(self.buckets), 0.0]
+
+    def observe(self, value: float, *label_values: str) -> None:
+        child = self._child(label_values)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            child[0][index] += 1
+            child[1] += value
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._children.items()]
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = _format_labels(self.label_names, labels, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}"
+
+
+class MetricsRegistry:
+    """The set of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "tasdeed_stage_seconds", "Time spent in each pipeline stage", ("stage",)))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "tasdeed_stage_errors_total", "Exceptions raised by each pipeline stage", ("stage",)))
+ACCOUNT_SECONDS = REGISTRY.register(Histogram(
+    "tasdeed_account_seconds", "End-to-end time to process one account"))
+ACCOUNTS = REGISTRY.register(Counter(
+    "tasdeed_accounts_total", "Processed accounts by outcome and failure stage", ("outcome", "stage")))
+ACCOUNTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "tasdeed_accounts_in_flight", "Accounts being processed right now"))
+ACCOUNTS_PER_SECOND = REGISTRY.register(Gauge(
+    "tasdeed_accounts_per_second", f"Accounts finished per second over the last {RATE_WINDOW_SECONDS:g}s"))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "tasdeed_queue_depth", "Items waiting in internal queues", ("queue",)))
+BROWSERS_OPEN = REGISTRY.register(Gauge(
+    "tasdeed_browsers_open", "Chromium browsers currently launched"))
+BROWSER_LEASES = REGISTRY.register(Gauge(
+    "tasdeed_browser_pool_leases", "Browser contexts currently leased from the browser pool"))
+PORTAL_SESSIONS = REGISTRY.register(Gauge(
+    "tasdeed_portal_sessions", "Logged-in portal sessions in the session pool", ("state",)))
+FLUSH_SECONDS = REGISTRY.register(Histogram(
+    "tasdeed_output_flush_seconds", "Time to flush one batch of rows to the output writers",
+    buckets=FLUSH_BUCKETS))
+FLUSH_ROWS = REGISTRY.register(Counter(
+    "tasdeed_output_rows_flushed_total", "Rows flushed to the output writers"))
+
+_finished_at: Deque[float] = deque()
+_finished_lock = threading.Lock()
+
+
+def _accounts_per_second() -> float:
+    cutoff = time.monotonic() - RATE_WINDOW_SECONDS
+    with _finished_lock:
+        while _finished_at and _finished_at[0] < cutoff:
+            _finished_at.popleft()
+        return len(_finished_at) / RATE_WINDOW_SECONDS
+
+
+ACCOUNTS_PER_SECOND.set_function(_accounts_per_second)
+
+
+class _AccountState:
+    def __init__(self, account_no: Optional[str] = None):
+        self.account_no = account_no
+        self.stage: Optional[str] = None
+        self.counted = False
+        self.outcome: Optional[str] = None
+        self.failed_stage: Optional[str] = None
+
+
+_current_account: ContextVar[Optional[_AccountState]] = ContextVar("tasdeed_current_account", default=None)
+
+
+def _enter_stage(name: str) -> Optional[_AccountState]:
+    state = _current_account.get()
+    if state is not None:
+        state.stage = name
+    return state
+
+
+@contextmanager
+def stage(name: str, attribute: bool = True) -> Iterator[None]:
+    """
+    Time a block as pipeline stage ``name``.
+
+    Args:
+        name: Stage name
+        attribute: Whether a later failure of the account without an explicit
+            stage is attributed to this stage (False for bookkeeping such as the output write)
+    """
+    state = _enter_stage(name) if attribute else _current_account.get()
+    started_at = time.time() if tracing.get_tracer() else None
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException as e:
+        outcome = type(e).__name__
+        if isinstance(e, Exception):
+            STAGE_ERRORS.inc(name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, name)
+        if started_at is not None:
+            tracing.record_span(name, "stage", started_at, elapsed, outcome=outcome,
+                                account=state.account_no if state else None)
+
+
+def timed(name: str) -> Callable:
+    """Decorator: time every call of a sync or async function as pipeline stage ``name``."""
+    def decorator(function: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def track_account(account_no: Optional[str] = None) -> Iterator[None]:
+    """
+    Wrap the processing of one account. An account that leaves the block
+    without ``account_succeeded``/``account_failed`` is counted as failed at its
+    last stage. ``account_no`` labels the account's trace spans.
+    """
+    state = _AccountState(account_no)
+    token = _current_account.set(state)
+    ACCOUNTS_IN_FLIGHT.inc()
+    started_at = time.time() if tracing.get_tracer() else None
+    started = time.perf_counter()
+    try:
+        yield
+    except (asyncio.CancelledError, KeyboardInterrupt):
+        # Interrupted, not failed
+        state.counted = True
+        state.outcome = "interrupted"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        ACCOUNTS_IN_FLIGHT.dec()
+        ACCOUNT_SECONDS.observe(elapsed)
+        if not state.counted:
+            account_failed()
+        _current_account.reset(token)
+        with _finished_lock:
+            _finished_at.append(time.monotonic())
+        if started_at is not None:
+            tracing.record_span("account", "account", started_at, elapsed, account=account_no,
+                                outcome=state.outcome, stage=state.failed_stage)
+
+
+def _count_account(outcome: str, stage_name: str) -> None:
+    state = _current_account.get()
+    if state is not None:
+        if state.counted:
+            return
+        state.counted = True
+        state.outcome = outcome
+        state.failed_stage = stage_name or None
+    ACCOUNTS.inc(outcome, stage_name)
+
+
+def current_stage() -> Optional[str]:
+    """Return the last stage the current account entered (None outside ``track_account``)."""
+    state = _current_account.get()
+    return state.stage if state else None
+
+
+def account_succeeded() -> None:
+    """Count the current account as extracted."""
+    _count_account("success", "")
+
+
+def account_failed(stage_name: Optional[str] = None) -> None:
+    """Count the current account as failed at ``stage_name`` (default: the last stage it entered)."""
+    state = _current_account.get()
+    _count_account("failure", stage_name or (state.stage if state and state.stage else "unknown"))
+
+
+def render() -> str:
+    """Return every metric in the Prometheus text format."""
+    return REGISTRY.render()
+
+
+def write_textfile_from_env() -> None:
+    """Write the metrics to TASDEED_METRICS_FILE, if set (atomically, for textfile collectors)."""
+    path = os.environ.get("TASDEED_METRICS_FILE")
+    if not path:
+        return
+    try:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(render())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write metrics to {path}: {e}")
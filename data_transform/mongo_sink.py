@@ -0,0 +1,185 @@
+import os
+import time
+import queue
+import logging
+import threading
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from .bill_record import BillRecord
+from .metrics import QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_MAX_BUFFER = 5000
+DEFAULT_PUT_TIMEOUT = 60.0
+MAX_RETRIES = 5
+
+# Natural key of a bill: one document per account and invoice month
+KEY_FIELDS = ("Account_No", "Invoice_Month")
+
+
+def record_to_document(record: BillRecord, extra_fields: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Convert a BillRecord to a BSON-friendly document (dates become datetimes)."""
+    document = {}
+    for field_name, value in record.items():
+        if isinstance(value, date) and not isinstance(value, datetime):
+            value = datetime(value.year, value.month, value.day)
+        document[field_name] = value
+    document["is_dummy"] = record.is_dummy
+    document["updated_at"] = datetime.now(timezone.utc)
+    if extra_fields:
+        document.update(extra_fields)
+    return document
+
+
+class MongoSink:
+    """
+    Batched MongoDB results sink.
+
+    Records are queued in a bounded in-memory buffer and written by a background
+    thread with unordered bulk upserts keyed on (Account_No, Invoice_Month),
+    which is backed by a unique index. When the buffer is full, ``write`` blocks
+    (backpressure) for up to ``put_timeout`` seconds before dropping the record
+    with an error; the file outputs remain the source of truth.
+
+    The sink follows the writer interface used by ``BufferedSink``
+    (``write``/``flush``/``close``). Pass ``collection`` to use an existing
+    collection or an in-process stand-in (e.g. ``mongomock``) instead of ``uri``.
+    """
+
+    def __init__(self, collection=None, uri: Optional[str] = None, database: str = "tasdeed",
+                 collection_name: str = "bills", batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_buffer: int = DEFAULT_MAX_BUFFER, put_timeout: float = DEFAULT_PUT_TIMEOUT,
+                 extra_fields: Optional[Dict[str, Any]] = None):
+        if collection is None:
+            from pymongo import MongoClient
+            client = MongoClient(uri or "mongodb://localhost:27017", serverSelectionTimeoutMS=5000)
+            collection = client[database][collection_name]
+        self.collection = collection
+        self.batch_size = batch_size
+        self.put_timeout = put_timeout
+        self.extra_fields = dict(extra_fields or {})
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+
+        self.collection.create_index(
+            [(field_name, 1) for field_name in KEY_FIELDS], unique=True, name="account_invoice_month"
+        )
+
+        self._queue: "queue.Queue[BillRecord]" = queue.Queue(maxsize=max_buffer)
+        self._stop = threading.Event()
+        self._worker = threading.Thread(target=self._drain, name="mongo-sink", daemon=True)
+        self._worker.start()
+
+    @classmethod
+    def from_env(cls, extra_fields: Optional[Dict[str, Any]] = None) -> Optional["MongoSink"]:
+        """
+        Create a sink from MONGO_URI (and optional MONGO_DB / MONGO_COLLECTION).
+
+        Returns None when MONGO_URI is not set or the server cannot be reached,
+        so extraction continues with file outputs only.
+        """
+        uri = os.environ.get("MONGO_URI")
+        if not uri:
+            return None
+        try:
+            return cls(
+                uri=uri,
+                database=os.environ.get("MONGO_DB", "tasdeed"),
+                collection_name=os.environ.get("MONGO_COLLECTION", "bills"),
+                extra_fields=extra_fields,
+            )
+        except Exception as e:
+            logger.error(f"MongoDB sink unavailable, continuing without it: {e}")
+            return None
+
+    def write(self, record: BillRecord) -> None:
+        """Queue a record; blocks while the buffer is full (up to ``put_timeout``)."""
+        try:
+            self._queue.put(record, timeout=self.put_timeout)
+            QUEUE_DEPTH.inc("mongo")
+        except queue.Full:
+            self.dropped += 1
+            logger.error(f"MongoDB buffer full, dropped record for account {record.Account_No}")
+
+    def flush(self) -> None:
+        """
+        No-op: queued records are written by the background thread in batches of
+        ``batch_size``, so the account loop never waits on the database here.
+        """
+
+    def join(self) -> None:
+        """Block until every queued record has been written (or given up on)."""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Wait for the buffer to drain and stop the background writer. Safe to call more than once."""
+        if self._stop.is_set():
+            return
+        self.join()
+        self._stop.set()
+        self._worker.join()
+        logger.info(f"MongoDB sink closed: written={self.written}, dropped={self.dropped}, "
+                    f"write_errors={self.write_errors}")
+
+    def _next_batch(self) -> List[BillRecord]:
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self) -> None:
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                # Never let the writer thread die, or producers would block on a full buffer
+                self.dropped += len(batch)
+                logger.error(f"MongoDB sink failed to write {len(batch)} records: {e}", exc_info=True)
+            finally:
+                QUEUE_DEPTH.dec("mongo", amount=len(batch))
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, batch: List[BillRecord]) -> None:
+        from pymongo import ReplaceOne
+        from pymongo.errors import BulkWriteError, PyMongoError
+
+        operations = []
+        for record in batch:
+            document = record_to_document(record, self.extra_fields)
+            key = {field_name: document[field_name] for field_name in KEY_FIELDS}
+            operations.append(ReplaceOne(key, document, upsert=True))
+
+        for attempt in range(1, MAX_RETRIES + 1):
+            try:
+                self.collection.bulk_write(operations, ordered=False)
+                self.written += len(operations)
+                return
+            except BulkWriteError as e:
+                # Unordered: the remaining operations were applied; report the failed ones
+                errors = e.details.get("writeErrors", [])
+                self.write_errors += len(errors)
+                self.written += len(operations) - len(errors)
+                logger.error(f"MongoDB bulk write: {len(errors)} of {len(operations)} operations failed")
+                return
+            except PyMongoError as e:
+                if attempt == MAX_RETRIES:
+                    self.dropped += len(operations)
+                    logger.error(f"MongoDB bulk write failed after {attempt} attempts, dropped {len(operations)} records: {e}")
+                    return
+                delay = min(2 ** attempt, 30)
+                logger.warning(f"MongoDB bulk write failed (attempt {attempt}), retrying in {delay}s: {e}")
+                time.sleep(delay)
@@ -0,0 +1,94 @@
+"""
+Steps shared by the desktop, web and batch pipelines.
+
+``open_run_sink`` sets up where a run's rows go, ``cached_extract`` turns a
+portal document into its extracted rows, through the extraction cache, and
+``output_stem`` names a run's output files.
+"""
+
+import os
+import asyncio
+import logging
+import contextvars
+from datetime import datetime
+from typing import Any, Dict, Optional, Sequence
+
+from .bill_record import BillRecord
+from .extraction_cache import ExtractionCache, hash_pdf
+from .mongo_sink import MongoSink
+from .results_store import ResultsStore
+from .sinks import BufferedSink
+
+logger = logging.getLogger(__name__)
+
+
+def open_run_sink(store: ResultsStore, run_id: str, user_type: str, writers: Sequence[Any] = ()) -> BufferedSink:
+    """
+    Open the output sink of a results-store run.
+
+    Rows reach the writers in batches (every N rows or T seconds): ``writers``,
+    then the results store, then MongoDB when MONGO_URI is configured.
+    Connecting to MongoDB can block for seconds, so event-loop callers run this
+    in an executor.
+
+    Args:
+        store: The results store
+        run_id: The run the rows belong to (see ``ResultsStore.start_run``)
+        user_type: Company (SUBTYPE), upper case
+        writers: Writers that get the rows before the results store (e.g. a live CSV)
+    """
+    sink_writers = [*writers, store.writer(run_id, user_type)]
+    mongo_sink = MongoSink.from_env(extra_fields={"user_type": user_type})
+    if mongo_sink:
+        sink_writers.append(mongo_sink)
+    return BufferedSink(sink_writers)
+
+
+def output_stem(output_directory: str, user_type: str, run_tag: str) -> str:
+    """
+    Return the path, without extension, of a run's output files: ``<USER_TYPE>_<month>-<year>_<run_tag>``.
+
+    The tag (a task or run id) keeps runs of the same user type and month from
+    writing the same file. The user type stays first: the Parquet dataset of
+    the outputs is named after it.
+
+    Args:
+        output_directory: Directory of the outputs
+        user_type: Company (SUBTYPE)
+        run_tag: Task or run id
+    """
+    now = datetime.now()
+    # Use #m-%Y format for Windows, %-m-%Y for other platforms
+    month_year = now.strftime("%#m-%Y") if os.name == "nt" else now.strftime("%-m-%Y")
+    return os.path.join(output_directory, f"{user_type}_{month_year}_{run_tag}")
+
+
+async def cached_extract(cache: Optional[ExtractionCache], client, doc_id: str,
+                         pdf_path: str) -> Dict[int, BillRecord]:
+    """
+    Return the ``extract_pdf_data`` rows of a portal document.
+
+    A cache hit skips both the PDF download and the parse. Otherwise the PDF is
+    fetched with ``client`` (a PortalClient), saved at ``pdf_path`` and parsed in
+    a worker thread (in the caller's context, so the parse is attributed to its
+    account in metrics and traces); the file is removed and the rows are cached.
+
+    Raises:
+        Exception: Whatever the download or the parse raised
+    """
+    from .core_utils import extract_pdf_data, delete_pdf
+
+    extracted_data = cache.get(doc_id) if cache else None
+    if extracted_data is not None:
+        return extracted_data
+    try:
+        pdf_data = await client.fetch_pdf_data(document_id=doc_id)
+        await client.save_pdf(pdf_data, filepath=pdf_path)
+        extracted_data = await asyncio.get_running_loop().run_in_executor(
+            None, contextvars.copy_context().run, extract_pdf_data, pdf_path)
+    finally:
+        if os.path.exists(pdf_path):
+            delete_pdf(pdf_path)
+    if cache:
+        cache.put(doc_id, hash_pdf(pdf_data), extracted_data)
+    return extracted_data
@@ -0,0 +1,327 @@
+import os
+import uuid
+import sqlite3
+import logging
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from .bill_record import BillRecord, FIELDS, FIELD_TYPES
+from .app_paths import app_data_dir
+
+logger = logging.getLogger(__name__)
+
+_COLUMNS = ", ".join(f'"{field_name}"' for field_name in FIELDS)
+
+
+def _column_type(field_name: str) -> str:
+    return "REAL" if FIELD_TYPES[field_name] is float else "TEXT"
+
+
+def _to_db(value: Any) -> Any:
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def account_key(account_no: Any) -> str:
+    """Normalise an account number for matching (input sheets and PDFs differ in whitespace/leading zeros)."""
+    return f"{account_no}".strip().lstrip("0")
+
+
+def current_period() -> str:
+    """The billing period (YYYY-MM) a run started now belongs to."""
+    return datetime.now().strftime("%Y-%m")
+
+
+class ResultsStore:
+    """
+    Local SQLite (WAL mode) store of every extracted record and dummy/failure row.
+
+    Each GUI/web/CLI run gets a ``run_id``; its rows are written through
+    ``writer(run_id)`` (a ``BufferedSink`` writer) and can be streamed back with
+    ``iter_records``, or looked up later by account number, user type or invoice
+    month without re-running the extraction.
+
+    Besides this per-run history, the store keeps one current row per
+    (user type, billing period, account). A dummy/failure row never replaces a
+    real one and a real row replaces a dummy, so reruns of the same month
+    (including "failed accounts only" passes) converge on one row per account;
+    ``iter_current_records`` streams that set, scoped to a run's input
+    accounts, for the final export. Dummy rows carry no Invoice_Month, so the
+    period is the month the run was started in, which is the month of every
+    bill the pipelines accept.
+    """
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.environ.get("TASDEED_RESULTS_DB") or os.path.join(app_data_dir(), "results.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        self._create_schema()
+
+    @classmethod
+    def default(cls) -> "ResultsStore":
+        """Return the process-wide store (TASDEED_RESULTS_DB or the application data directory)."""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _create_schema(self) -> None:
+        field_columns = ",\n".join(f'  "{field_name}" {_column_type(field_name)}' for field_name in FIELDS)
+        with self._lock:
+            self._conn.executescript(f"""
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id TEXT PRIMARY KEY,
+                    user_type TEXT,
+                    source TEXT,
+                    started_at TEXT NOT NULL,
+                    finished_at TEXT,
+                    output_path TEXT,
+                    period TEXT
+                );
+                CREATE TABLE IF NOT EXISTS bills (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id TEXT NOT NULL,
+                    user_type TEXT,
+                    is_dummy INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL,
+                    input_account TEXT,
+                {field_columns}
+                );
+                CREATE INDEX IF NOT EXISTS idx_bills_run ON bills (run_id);
+                CREATE INDEX IF NOT EXISTS idx_bills_account ON bills ("Account_No");
+                CREATE INDEX IF NOT EXISTS idx_bills_user_type ON bills (user_type);
+                CREATE INDEX IF NOT EXISTS idx_bills_invoice_month ON bills ("Invoice_Month");
+                CREATE TABLE IF NOT EXISTS current_bills (
+                    user_type TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    account_key TEXT NOT NULL,
+                    bill_id INTEGER NOT NULL,
+                    is_dummy INTEGER NOT NULL,
+                    first_bill_id INTEGER NOT NULL,
+                    PRIMARY KEY (user_type, period, account_key)
+                ) WITHOUT ROWID;
+            """)
+            # Under the write lock, so that processes starting together do not add a column twice
+            self._conn.execute("BEGIN IMMEDIATE")
+            # Stores created before billing periods were tracked
+            run_columns = {row[1] for row in self._conn.execute("PRAGMA table_info(runs)")}
+            if "period" not in run_columns:
+                self._conn.execute("ALTER TABLE runs ADD COLUMN period TEXT")
+            # Stores created before rows recorded the input-sheet account number
+            bill_columns = {row[1] for row in self._conn.execute("PRAGMA table_info(bills)")}
+            if "input_account" not in bill_columns:
+                self._conn.execute("ALTER TABLE bills ADD COLUMN input_account TEXT")
+            self._conn.commit()
+
+    def start_run(self, user_type: str, source: str = "", period: Optional[str] = None) -> str:
+        """Register a new run for a billing period (default: the current month) and return its id."""
+        run_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO runs (run_id, user_type, source, started_at, period) VALUES (?, ?, ?, ?, ?)",
+                (run_id, user_type, source, datetime.now().isoformat(timespec='seconds'), period or current_period())
+            )
+            self._conn.commit()
+        return run_id
+
+    def run_period(self, run_id: str) -> str:
+        """Return the billing period of a run."""
+        with self._lock:
+            row = self._conn.execute("SELECT period FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"Unknown run: {run_id}")
+        return row[0] or current_period()
+
+    def finish_run(self, run_id: str, output_path: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE runs SET finished_at = ?, output_path = ? WHERE run_id = ?",
+                (datetime.now().isoformat(timespec='seconds'), output_path, run_id)
+            )
+            self._conn.commit()
+
+    def insert_records(self, run_id: str, user_type: str, records: List[BillRecord],
+                       period: Optional[str] = None) -> None:
+        """
+        Insert a batch of records in one transaction and upsert the current row of each account.
+
+        The current row of an account only moves to the new record when the
+        existing one is a dummy, so good rows are never replaced. Accounts are
+        matched on the input-sheet account number (``record.input_account``),
+        falling back to the Account_No read from the PDF.
+        """
+        if not records:
+            return
+        period = period or self.run_period(run_id)
+        created_at = datetime.now().isoformat(timespec='seconds')
+        placeholders = ", ".join("?" for _ in range(len(FIELDS) + 5))
+        insert_bill = (f"INSERT INTO bills (run_id, user_type, is_dummy, created_at, input_account, {_COLUMNS})"
+                       f" VALUES ({placeholders})")
+        with self._lock:
+            with self._conn:
+                for record in records:
+                    bill_id = self._conn.execute(
+                        insert_bill,
+                        (run_id, user_type, int(record.is_dummy), created_at, record.input_account,
+                         *(_to_db(value) for value in record.values()))
+                    ).lastrowid
+                    account_no = record.input_account if record.input_account is not None else record.Account_No
+                    # A row with no account number at all is kept as its own account rather than merged
+                    key = account_key(account_no) if account_no is not None else f"#{bill_id}"
+                    self._conn.execute(
+                        """
+                        INSERT INTO current_bills (user_type, period, account_key, bill_id, is_dummy, first_bill_id)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (user_type, period, account_key) DO UPDATE
+                            SET bill_id = excluded.bill_id, is_dummy = excluded.is_dummy
+                            WHERE current_bills.is_dummy = 1
+                        """,
+                        (user_type, period, key, bill_id, int(record.is_dummy), bill_id)
+                    )
+
+    def writer(self, run_id: str, user_type: str) -> "StoreWriter":
+        """Return a writer that persists a run's rows (for use with ``BufferedSink``)."""
+        return StoreWriter(self, run_id, user_type)
+
+    def iter_records(self, run_id: Optional[str] = None, account_no: Optional[str] = None,
+                     user_type: Optional[str] = None, invoice_month: Optional[str] = None,
+                     include_dummy: bool = True) -> Iterator[BillRecord]:
+        """
+        Stream matching records in insertion order.
+
+        A separate read connection is used, so this can run while a writer is
+        active (WAL readers do not block writers).
+        """
+        clauses, params = [], []
+        for column, value in (("run_id", run_id), ('"Account_No"', account_no),
+                              ("user_type", user_type), ('"Invoice_Month"', invoice_month)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if not include_dummy:
+            clauses.append("is_dummy = 0")
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        # The generator may be resumed from different threads (e.g. one executor call per chunk)
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        try:
+            cursor = conn.execute(f"SELECT is_dummy, {_COLUMNS} FROM bills{where} ORDER BY id", params)
+            while True:
+                rows = cursor.fetchmany(500)
+                if not rows:
+                    break
+                for row in rows:
+                    yield BillRecord.from_dict(dict(zip(FIELDS, row[1:])), is_dummy=bool(row[0]))
+        finally:
+            conn.close()
+
+    def iter_current_records(self, user_type: str, period: str,
+                             accounts: Optional[Iterable[Any]] = None) -> Iterator[BillRecord]:
+        """
+        Stream the current row of every account seen for a user type and billing
+        period, in the order the accounts were first written.
+
+        With ``accounts`` (an input sheet), only those accounts are streamed, in
+        the sheet's order, so a run's output holds its own accounts (with the
+        rows earlier runs of the month wrote for them) and nobody else's.
+        """
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        bill_columns = ", ".join(f'b."{field_name}"' for field_name in FIELDS)
+        try:
+            if accounts is None:
+                cursor = conn.execute(
+                    f"SELECT b.is_dummy, {bill_columns} FROM current_bills c JOIN bills b ON b.id = c.bill_id"
+                    f" WHERE c.user_type = ? AND c.period = ? ORDER BY c.first_bill_id",
+                    (user_type, period)
+                )
+            else:
+                conn.execute("CREATE TEMP TABLE wanted (account_key TEXT PRIMARY KEY, position INTEGER)")
+                conn.executemany("INSERT OR IGNORE INTO wanted VALUES (?, ?)",
+                                 ((account_key(account_no), position) for position, account_no in enumerate(accounts)))
+                cursor = conn.execute(
+                    f"SELECT b.is_dummy, {bill_columns} FROM wanted w"
+                    f" JOIN current_bills c ON c.user_type = ? AND c.period = ? AND c.account_key = w.account_key"
+                    f" JOIN bills b ON b.id = c.bill_id ORDER BY w.position",
+                    (user_type, period)
+                )
+            while True:
+                rows = cursor.fetchmany(500)
+                if not rows:
+                    break
+                for row in rows:
+                    yield BillRecord.from_dict(dict(zip(FIELDS, row[1:])), is_dummy=bool(row[0]))
+        finally:
+            conn.close()
+
+    def run_accounts(self, run_id: str) -> Dict[str, bool]:
+        """
+        Return the accounts a run has written rows for, as ``account_key -> is_dummy``.
+
+        Accounts are identified by their input-sheet number (the PDF's Account_No
+        for rows written without one). An account with any real row maps to
+        False. Used to resume an interrupted run from the accounts it had not
+        reached yet.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT COALESCE(input_account, "Account_No") AS account, MIN(is_dummy) FROM bills'
+                ' WHERE run_id = ? GROUP BY account', (run_id,)
+            ).fetchall()
+        accounts: Dict[str, bool] = {}
+        for account_no, is_dummy in rows:
+            if account_no is None:
+                continue
+            key = account_key(account_no)
+            accounts[key] = accounts.get(key, True) and bool(is_dummy)
+        return accounts
+
+    def runs(self, user_type: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Return the most recent runs, newest first."""
+        query = "SELECT run_id, user_type, source, started_at, finished_at, output_path, period FROM runs"
+        params: List[Any] = []
+        if user_type is not None:
+            query += " WHERE user_type = ?"
+            params.append(user_type)
+        query += " ORDER BY started_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        keys = ("run_id", "user_type", "source", "started_at", "finished_at", "output_path", "period")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class StoreWriter:
+    """``BufferedSink`` writer that inserts a run's rows into the ResultsStore, one transaction per flush."""
+
+    def __init__(self, store: ResultsStore, run_id: str, user_type: str):
+        self.store = store
+        self.run_id = run_id
+        self.user_type = user_type
+        self.period = store.run_period(run_id)
+        self._pending: List[BillRecord] = []
+
+    def write(self, record: BillRecord) -> None:
+        self._pending.append(record)
+
+    def flush(self) -> None:
+        # The insert is one transaction: on an error nothing was stored, and the rows stay pending for a retry
+        self.store.insert_records(self.run_id, self.user_type, self._pending, self.period)
+        self._pending = []
+
+    def close(self) -> None:
+        self.flush()
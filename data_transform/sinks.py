@@ -0,0 +1,216 @@
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from .bill_record import BillRecord
+from .writers import to_record
+from . import tracing
+from .metrics import FLUSH_ROWS, FLUSH_SECONDS, QUEUE_DEPTH, stage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_ROWS = 25
+DEFAULT_FLUSH_SECONDS = 5.0
+
+
+class SinkMetrics:
+    """Counters describing how a BufferedSink has been flushing."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rows_written = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.rows_flushed = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    def record_write(self) -> None:
+        with self._lock:
+            self.rows_written += 1
+
+    def record_flush(self, batch_size: int, seconds: float) -> None:
+        with self._lock:
+            self.flushes += 1
+            self.rows_flushed += batch_size
+            self.last_batch_size = batch_size
+            self.max_batch_size = max(self.max_batch_size, batch_size)
+            self.last_flush_seconds = seconds
+            self.max_flush_seconds = max(self.max_flush_seconds, seconds)
+            self.total_flush_seconds += seconds
+
+    def record_error(self) -> None:
+        with self._lock:
+            self.flush_errors += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the current values as a plain dict (safe to JSON-encode)."""
+        with self._lock:
+            return {
+                "rows_written": self.rows_written,
+                "rows_flushed": self.rows_flushed,
+                "rows_pending": self.rows_written - self.rows_flushed,
+                "flushes": self.flushes,
+                "flush_errors": self.flush_errors,
+                "last_batch_size": self.last_batch_size,
+                "max_batch_size": self.max_batch_size,
+                "avg_batch_size": self.rows_flushed / self.flushes if self.flushes else 0.0,
+                "last_flush_seconds": self.last_flush_seconds,
+                "max_flush_seconds": self.max_flush_seconds,
+                "avg_flush_seconds": self.total_flush_seconds / self.flushes if self.flushes else 0.0,
+            }
+
+
+class BufferedSink:
+    """
+    Buffers records between the account loop and the output writers.
+
+    Records are handed to every writer (``write(record)`` then ``flush()``) in
+    batches: when ``max_rows`` records are pending, or when the oldest pending
+    record has waited ``max_seconds``. The flushes run on a background thread, so
+    ``write`` never waits on a writer (a MongoDB sink under backpressure, a
+    locked database) and can be called from an event loop; with
+    ``max_seconds=0`` there is no thread and ``write`` flushes inline. ``flush``
+    and ``close`` block: call ``close`` on cancel/finish (from a worker thread
+    when on an event loop).
+
+    A failing writer does not lose rows or hold up the others: the records it
+    did not accept are kept for it, and a writer whose ``flush`` raised is
+    expected to keep what it was given, so the next flush (the timer retries
+    within ``max_seconds``) hands it the rest and flushes it again.
+    """
+
+    def __init__(self, writers: Sequence[Any], max_rows: Optional[int] = None, max_seconds: Optional[float] = None):
+        self.writers = list(writers)
+        self.max_rows = max_rows or int(os.environ.get("TASDEED_FLUSH_ROWS", DEFAULT_FLUSH_ROWS))
+        self.max_seconds = max_seconds if max_seconds is not None else float(
+            os.environ.get("TASDEED_FLUSH_SECONDS", DEFAULT_FLUSH_SECONDS))
+        self.metrics = SinkMetrics()
+        self._buffer: List[BillRecord] = []
+        self._oldest_at: Optional[float] = None
+        # Per writer: records it has not accepted yet because an earlier flush failed
+        self._backlog: List[List[BillRecord]] = [[] for _ in self.writers]
+        self._retry_rows = 0
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._timer = None
+        if self.max_seconds > 0:
+            self._timer = threading.Thread(target=self._flush_periodically, name="sink-flush", daemon=True)
+            self._timer.start()
+
+    def write(self, extracted: Union[BillRecord, Dict[Any, Any]], account_no: Optional[str] = None) -> None:
+        """
+        Buffer one row (a BillRecord or ``extract_pdf_data``-style dict), flushing if a limit is reached.
+
+        Args:
+            extracted: The row
+            account_no: The input-sheet account number the row was extracted for; the results
+                store matches accounts on it rather than on the Account_No parsed from the PDF
+        """
+        if self._closed:
+            raise ValueError("Cannot write to a closed sink")
+        with stage("write", attribute=False):
+            record = to_record(extracted)
+            if account_no is not None:
+                record.input_account = f"{account_no}"
+            with self._buffer_lock:
+                self._buffer.append(record)
+                if self._oldest_at is None:
+                    self._oldest_at = time.monotonic()
+                due = len(self._buffer) >= self.max_rows
+            self.metrics.record_write()
+            QUEUE_DEPTH.inc("output_buffer")
+            if due and self._timer:
+                self._wake.set()
+            elif due:
+                try:
+                    self.flush()
+                except Exception:
+                    # Logged by flush; the rows are kept and retried, the account itself was extracted
+                    pass
+
+    def _is_due(self) -> bool:
+        with self._buffer_lock:
+            if self._retry_rows or len(self._buffer) >= self.max_rows:
+                return True
+            return self._oldest_at is not None and time.monotonic() - self._oldest_at >= self.max_seconds
+
+    def _flush_periodically(self) -> None:
+        interval = max(self.max_seconds / 2, 0.05)
+        while not self._stop.is_set():
+            self._wake.wait(interval)
+            self._wake.clear()
+            if not self._stop.is_set() and self._is_due():
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error(f"Background flush failed: {e}")
+
+    def flush(self) -> None:
+        """
+        Hand all buffered records to the writers and flush them.
+
+        Raises:
+            Exception: The first writer error, after every writer has been tried
+                (the rows are kept for the next flush, see the class docstring)
+        """
+        with self._flush_lock:
+            with self._buffer_lock:
+                batch, self._buffer = self._buffer, []
+                self._oldest_at = None
+                retry_rows = self._retry_rows
+            if not batch and not retry_rows:
+                return
+            QUEUE_DEPTH.dec("output_buffer", amount=len(batch))
+
+            started_at = time.time()
+            started = time.perf_counter()
+            error = None
+            for index, writer in enumerate(self.writers):
+                records = self._backlog[index] + batch if self._backlog[index] else batch
+                accepted = 0
+                try:
+                    for record in records:
+                        writer.write(record)
+                        accepted += 1
+                    writer.flush()
+                except Exception as e:
+                    error = error or e
+                    logger.error(f"Failed to flush {len(records)} rows to {type(writer).__name__},"
+                                 f" keeping them for the next flush", exc_info=True)
+                self._backlog[index] = records[accepted:]
+            with self._buffer_lock:
+                self._retry_rows = retry_rows + len(batch) if error else 0
+            if error:
+                self.metrics.record_error()
+                raise error
+            elapsed = time.perf_counter() - started
+            self.metrics.record_flush(retry_rows + len(batch), elapsed)
+            FLUSH_SECONDS.observe(elapsed)
+            FLUSH_ROWS.inc(amount=retry_rows + len(batch))
+            tracing.record_span("flush", "flush", started_at, elapsed, rows=retry_rows + len(batch))
+
+    def close(self) -> None:
+        """Stop the timer, flush whatever is still buffered and close the writers. Safe to call more than once."""
+        if self._closed:
+            return
+        self._closed = True
+        self._stop.set()
+        self._wake.set()
+        if self._timer and self._timer is not threading.current_thread():
+            self._timer.join()
+        try:
+            self.flush()
+        finally:
+            for writer in self.writers:
+                if hasattr(writer, "close"):
+                    writer.close()
+        logger.info(f"Output sink closed: {self.metrics.snapshot()}")
@@ -0,0 +1,161 @@
+"""
+Optional per-account stage tracing.
+
+Set TASDEED_TRACE_DIR to record a span for every pipeline stage
+(``metrics.stage``/``metrics.timed``), every account (``metrics.track_account``)
+and every output flush, carrying the account number and outcome. Spans are
+appended to ``trace-<started>-<pid>.jsonl`` in that directory as they finish.
+``export_chrome_trace`` converts the file into ``trace-<started>-<pid>.json``
+in the Chrome ``trace_event`` format, which opens in Perfetto
+(https://ui.perfetto.dev) or chrome://tracing. There, every asyncio task and
+thread is its own track, so concurrency, waiting and tail latency across a run
+are visible.
+
+JSONL spans look like::
+
+    {"name": "fetch_pdf_data", "kind": "stage", "start": 1718000000.123, "duration": 1.84,
+     "pid": 4242, "lane": 3, "account": "00118494", "outcome": "ok"}
+"""
+
+import os
+import json
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TRACE_DIR_ENV = "TASDEED_TRACE_DIR"
+
+
+class Tracer:
+    """Appends spans of this process to a JSONL file and exports them as a Chrome trace."""
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, f"trace-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}")
+        self.jsonl_path = f"{stem}.jsonl"
+        self.chrome_path = f"{stem}.json"
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        # (kind, id) of an asyncio task or thread -> (track number, track name)
+        self._lanes: Dict[Tuple[str, int], Tuple[int, str]] = {}
+        self._file = open(self.jsonl_path, "a", encoding="utf-8", buffering=1)
+
+    def _lane(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is not None:
+            key, name = ("task", id(task)), task.get_name()
+        else:
+            key, name = ("thread", threading.get_ident()), threading.current_thread().name
+        lane = self._lanes.get(key)
+        if lane is None or lane[1] != name:
+            lane = self._lanes[key] = (len(self._lanes) + 1, name)
+        return lane[0]
+
+    def record(self, name: str, kind: str, start: float, duration: float, **args: Any) -> None:
+        """
+        Append one finished span.
+
+        Args:
+            name: Stage name (or "account"/"flush")
+            kind: "stage", "account" or "flush"
+            start: Wall-clock start, in seconds since the epoch
+            duration: Seconds
+            **args: Span attributes (account, outcome, ...); None values are left out
+        """
+        span = {"name": name, "kind": kind, "start": round(start, 6), "duration": round(duration, 6),
+                "pid": self.pid}
+        span.update((key, value) for key, value in args.items() if value is not None)
+        with self._lock:
+            span["lane"] = self._lane()
+            self._file.write(json.dumps(span, ensure_ascii=False) + "\n")
+
+    def export_chrome_trace(self) -> str:
+        """Write every span recorded so far as a Chrome trace_event file and return its path."""
+        with self._export_lock:
+            with self._lock:
+                self._file.flush()
+                lanes = sorted(self._lanes.values())
+            tmp_path = f"{self.chrome_path}.tmp"
+            with open(self.jsonl_path, encoding="utf-8") as spans, open(tmp_path, "w", encoding="utf-8") as out:
+                out.write('{"displayTimeUnit": "ms", "traceEvents": [\n')
+                out.write(json.dumps({"name": "process_name", "ph": "M", "pid": self.pid,
+                                      "args": {"name": f"tasdeed {self.pid}"}}))
+                for lane, lane_name in lanes:
+                    out.write(",\n" + json.dumps({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": lane,
+                                                  "args": {"name": lane_name}}))
+                for line in spans:
+                    try:
+                        span = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash
+                        continue
+                    event = {
+                        "name": span.pop("name"),
+                        "cat": span.pop("kind"),
+                        "ph": "X",
+                        "ts": int(span.pop("start") * 1_000_000),
+                        "dur": int(span.pop("duration") * 1_000_000),
+                        "pid": span.pop("pid"),
+                        "tid": span.pop("lane"),
+                        "args": span,
+                    }
+                    out.write(",\n" + json.dumps(event, ensure_ascii=False))
+                out.write("\n]}\n")
+            os.replace(tmp_path, self.chrome_path)
+            return self.chrome_path
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Optional[Tracer]:
+    """Return the process-wide tracer, or None when TASDEED_TRACE_DIR is not set."""
+    global _tracer
+    if _tracer is None:
+        directory = os.environ.get(TRACE_DIR_ENV)
+        if not directory:
+            return None
+        with _tracer_lock:
+            if _tracer is None:
+                try:
+                    _tracer = Tracer(directory)
+                except OSError as e:
+                    logger.warning(f"Tracing disabled, cannot write to {directory}: {e}")
+                    os.environ.pop(TRACE_DIR_ENV, None)
+                    return None
+                logger.info(f"Tracing spans to {_tracer.jsonl_path}")
+    return _tracer
+
+
+def record_span(name: str, kind: str, start: float, duration: float, **args: Any) -> None:
+    """Record a span if tracing is enabled (see ``Tracer.record``)."""
+    tracer = get_tracer()
+    if tracer is not None:
+        tracer.record(name, kind, start, duration, **args)
+
+
+def export_chrome_trace() -> Optional[str]:
+    """Export the spans recorded so far as a Chrome trace, if tracing is enabled; returns its path."""
+    tracer = get_tracer()
+    if tracer is None:
+        return None
+    try:
+        path = tracer.export_chrome_trace()
+    except OSError as e:
+        logger.warning(f"Could not write the Chrome trace: {e}")
+        return None
+    logger.info(f"Chrome trace written to {path}")
+    return path
@@ -0,0 +1,424 @@
+import io
+import os
+import csv
+import gzip
+import shutil
+import logging
+import threading
+from datetime import date
+from typing import Any, Dict, IO, Iterable, Optional, Tuple, Union
+
+from .bill_record import BillRecord, FIELDS, FIELD_TYPES, NULL_TEXT
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
+
+
+def to_record(extracted: Union[BillRecord, Dict[Any, Any]]) -> BillRecord:
+    """
+    Normalise writer input to a BillRecord.
+
+    Accepts a BillRecord, a plain field dict, or the page dict returned by
+    ``extract_pdf_data``/``_dummy_data`` (only page 0 is written, as before).
+
+    Raises:
+        ValueError: If the input is empty or has an unexpected shape
+    """
+    if isinstance(extracted, BillRecord):
+        return extracted
+    if not extracted or not isinstance(extracted, dict):
+        raise ValueError("Invalid or empty extracted text data")
+    if 0 in extracted:
+        page = extracted[0]
+        if isinstance(page, BillRecord):
+            return page
+        if not page or not isinstance(page, dict):
+            raise ValueError("Invalid data format in extracted text")
+        return BillRecord.from_text(page)
+    return BillRecord.from_text(extracted)
+
+
+def _cell(value: Any) -> Any:
+    return NULL_TEXT if value is None else value
+
+
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+DEFAULT_COMPRESSION_LEVELS = {"gzip": 6, "zstd": 10}
+_COMPRESSION_ALIASES = {"gz": "gzip", "zst": "zstd"}
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def output_compression() -> Tuple[Optional[str], Optional[int]]:
+    """
+    Read the output compression settings.
+
+    TASDEED_OUTPUT_COMPRESSION selects ``gzip`` or ``zstd`` (unset means plain
+    files) and TASDEED_OUTPUT_COMPRESSION_LEVEL overrides the codec's default level.
+
+    Returns:
+        Tuple[Optional[str], Optional[int]]: The codec (or None) and its level
+    """
+    compression = os.environ.get("TASDEED_OUTPUT_COMPRESSION", "").strip().lower()
+    compression = _COMPRESSION_ALIASES.get(compression, compression)
+    if not compression:
+        return None, None
+    if compression not in COMPRESSION_SUFFIXES:
+        logger.warning(f"Ignoring TASDEED_OUTPUT_COMPRESSION={compression!r}; "
+                       f"expected one of {', '.join(COMPRESSION_SUFFIXES)}")
+        return None, None
+    level = os.environ.get("TASDEED_OUTPUT_COMPRESSION_LEVEL")
+    return compression, int(level) if level else DEFAULT_COMPRESSION_LEVELS[compression]
+
+
+def compression_of(path: str) -> Optional[str]:
+    """Return the codec implied by a file's suffix (``.gz``/``.zst``), or None for plain files."""
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if path.endswith(suffix):
+            return compression
+    return None
+
+
+def strip_compression_suffix(path: str) -> str:
+    """Return ``path`` without a ``.gz``/``.zst`` suffix."""
+    compression = compression_of(path)
+    return path[:-len(COMPRESSION_SUFFIXES[compression])] if compression else path
+
+
+def open_text_output(path: str, mode: str = 'w', compression: Optional[str] = None,
+                     level: Optional[int] = None) -> IO[str]:
+    """
+    Open a text file for writing (``w``) or appending (``a``), optionally compressed.
+
+    Compressed data is produced incrementally as text is written. Appending to a
+    compressed file adds a new gzip member / zstd frame, which readers treat as
+    one continuous stream.
+    """
+    if compression is None:
+        return open(path, mode=mode, newline='', encoding='utf-8')
+    if level is None:
+        level = DEFAULT_COMPRESSION_LEVELS[compression]
+    if compression == "gzip":
+        return gzip.open(path, mode=f"{mode}t", compresslevel=level, newline='', encoding='utf-8')
+    if compression == "zstd":
+        import zstandard
+
+        raw = open(path, mode=f"{mode}b")
+        stream = zstandard.ZstdCompressor(level=level).stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(stream, newline='', encoding='utf-8')
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+def open_text_input(path: str) -> IO[str]:
+    """Open a plain, ``.gz`` or ``.zst`` text file for reading (decompressing on the fly)."""
+    compression = compression_of(path)
+    if compression == "gzip":
+        return gzip.open(path, mode='rt', newline='', encoding='utf-8')
+    if compression == "zstd":
+        import zstandard
+
+        stream = zstandard.ZstdDecompressor().stream_reader(open(path, mode='rb'), read_across_frames=True,
+                                                            closefd=True)
+        return io.TextIOWrapper(stream, newline='', encoding='utf-8')
+    return open(path, newline='', encoding='utf-8')
+
+
+def _tmp_path(path: str) -> str:
+    """Temporary path of an export to ``path``, unique per process and thread so that two writers never share it."""
+    return f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+
+
+def compress_file(source_path: str, target_path: str, compression: str, level: Optional[int] = None) -> str:
+    """
+    Stream-compress ``source_path`` into ``target_path`` (via a temporary file).
+
+    Returns:
+        str: ``target_path``
+    """
+    if level is None:
+        level = DEFAULT_COMPRESSION_LEVELS[compression]
+    tmp_path = _tmp_path(target_path)
+    with open(source_path, mode='rb') as source:
+        if compression == "gzip":
+            with gzip.open(tmp_path, mode='wb', compresslevel=level) as target:
+                shutil.copyfileobj(source, target, COPY_CHUNK_SIZE)
+        elif compression == "zstd":
+            import zstandard
+
+            with open(tmp_path, mode='wb') as target:
+                zstandard.ZstdCompressor(level=level).copy_stream(source, target, read_size=COPY_CHUNK_SIZE)
+        else:
+            raise ValueError(f"Unsupported compression: {compression}")
+    os.replace(tmp_path, target_path)
+    logger.info(f"Compressed {source_path} ({os.path.getsize(source_path)} bytes) to {target_path} "
+                f"({os.path.getsize(target_path)} bytes, {compression} level {level})")
+    return target_path
+
+
+@timed("export_xlsx")
+def export_xlsx(records: Iterable[BillRecord], xlsx_path: str) -> int:
+    """
+    Write records to an Excel file using a constant-memory write-only workbook.
+
+    The workbook is written to a temporary file and moved into place, so a
+    failure never leaves a truncated file at ``xlsx_path``.
+
+    Returns:
+        int: Number of data rows written
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(list(FIELDS))
+    count = 0
+    for record in records:
+        sheet.append([_cell(value) for value in record.values()])
+        count += 1
+
+    tmp_path = _tmp_path(xlsx_path)
+    workbook.save(tmp_path)
+    os.replace(tmp_path, xlsx_path)
+    logger.info(f"Wrote {count} rows to {xlsx_path}")
+    return count
+
+
+@timed("export_csv")
+def export_csv(records: Iterable[BillRecord], csv_path: str, compression: Optional[str] = None,
+               level: Optional[int] = None) -> int:
+    """
+    Stream records to a CSV file with the fixed BillRecord header.
+
+    Like ``export_xlsx`` the file is written to a temporary path and moved into place.
+
+    Args:
+        records: Rows to write
+        csv_path: Target path (including any ``.gz``/``.zst`` suffix)
+        compression: ``gzip``, ``zstd`` or None for a plain CSV
+        level: Compression level (codec default when None)
+
+    Returns:
+        int: Number of data rows written
+    """
+    tmp_path = _tmp_path(csv_path)
+    count = 0
+    with open_text_output(tmp_path, compression=compression, level=level) as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(FIELDS)
+        for record in records:
+            writer.writerow([_cell(value) for value in record.values()])
+            count += 1
+    os.replace(tmp_path, csv_path)
+    logger.info(f"Wrote {count} rows to {csv_path}")
+    return count
+
+
+PARQUET_BATCH_ROWS = 5000
+PARQUET_MODES = ("file", "dataset")
+# Partition used for rows without an invoice month (failed/dummy rows)
+UNKNOWN_MONTH = "unknown"
+
+
+def parquet_schema():
+    """
+    Arrow schema for BillRecord rows, derived from ``FIELD_TYPES``.
+
+    Date fields become ``date32``, numeric fields ``float64`` and everything
+    else ``string``; an ``is_dummy`` column marks failed/dummy rows.
+    """
+    import pyarrow as pa
+
+    arrow_types = {date: pa.date32(), float: pa.float64(), str: pa.string()}
+    columns = [pa.field(field_name, arrow_types[FIELD_TYPES[field_name]]) for field_name in FIELDS]
+    columns.append(pa.field("is_dummy", pa.bool_()))
+    return pa.schema(columns)
+
+
+def _iter_parquet_batches(records: Iterable[BillRecord], schema, counts: Dict[str, int]):
+    """Yield record batches of ``PARQUET_BATCH_ROWS`` rows, nulling values that do not match their column type."""
+    import pyarrow as pa
+
+    def empty_columns():
+        return {field_name: [] for field_name in schema.names}
+
+    columns = empty_columns()
+    pending = 0
+    for record in records:
+        for field_name, value in record.items():
+            expected = FIELD_TYPES[field_name]
+            if value is not None and not isinstance(value, expected):
+                # Text the parser could not convert (e.g. "N/A" in a reading column)
+                counts["coerced"] += 1
+                value = None
+            columns[field_name].append(value)
+        columns["is_dummy"].append(record.is_dummy)
+        pending += 1
+        if pending >= PARQUET_BATCH_ROWS:
+            counts["rows"] += pending
+            yield pa.RecordBatch.from_pydict(columns, schema=schema)
+            columns, pending = empty_columns(), 0
+    if pending:
+        counts["rows"] += pending
+        yield pa.RecordBatch.from_pydict(columns, schema=schema)
+
+
+@timed("export_parquet")
+def export_parquet(records: Iterable[BillRecord], parquet_path: str, partition_by_month: bool = False,
+                   compression: str = "zstd", file_prefix: str = "part") -> int:
+    """
+    Write records to a typed, compressed Parquet file or month-partitioned dataset.
+
+    Rows are converted in batches, so memory stays bounded for large runs.
+    With ``partition_by_month`` the output is a directory partitioned by
+    ``Invoice_Month`` (``<dir>/Invoice_Month=<month>/<file_prefix>-0.parquet``);
+    files with other prefixes are left in place, so the directory accumulates runs.
+    Rows without an invoice month go to the ``Invoice_Month=unknown`` partition.
+
+    Values that do not match their column type are written as null.
+
+    Args:
+        records: Rows to write
+        parquet_path: Target file, or the dataset directory when partitioning
+        partition_by_month: Write a partitioned dataset instead of a single file
+        compression: Parquet compression codec
+        file_prefix: Name of the partition files (dataset only); reusing it replaces them
+
+    Returns:
+        int: Number of data rows written
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    counts = {"rows": 0, "coerced": 0}
+    batches = _iter_parquet_batches(records, schema, counts)
+
+    if partition_by_month:
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+
+        month_index = schema.get_field_index("Invoice_Month")
+        batches = (
+            batch.set_column(month_index, "Invoice_Month", pc.fill_null(batch.column(month_index), UNKNOWN_MONTH))
+            for batch in batches
+        )
+
+        ds.write_dataset(
+            batches,
+            parquet_path,
+            schema=schema,
+            format="parquet",
+            file_options=ds.ParquetFileFormat().make_write_options(compression=compression),
+            partitioning=ds.partitioning(pa.schema([schema.field("Invoice_Month")]), flavor="hive"),
+            basename_template=f"{file_prefix}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+    else:
+        tmp_path = _tmp_path(parquet_path)
+        with pq.ParquetWriter(tmp_path, schema, compression=compression) as parquet_writer:
+            for batch in batches:
+                parquet_writer.write_batch(batch)
+        os.replace(tmp_path, parquet_path)
+
+    if counts["coerced"]:
+        logger.warning(f"{counts['coerced']} values did not match their column type and were written as null")
+    logger.info(f"Wrote {counts['rows']} rows to {parquet_path}")
+    return counts["rows"]
+
+
+def export_parquet_from_env(records: Iterable[BillRecord], output_path: str) -> Optional[str]:
+    """
+    Write the Parquet companion of a CSV/XLSX output when TASDEED_PARQUET is set.
+
+    ``TASDEED_PARQUET=file`` writes ``<output stem>.parquet`` next to the output;
+    ``TASDEED_PARQUET=dataset`` adds the run to a month-partitioned dataset in
+    ``<output dir>/<USER_TYPE>_parquet``. The codec can be changed with
+    TASDEED_PARQUET_COMPRESSION (default zstd).
+
+    Returns:
+        Optional[str]: The written path, or None when Parquet output is disabled
+    """
+    mode = os.environ.get("TASDEED_PARQUET", "").strip().lower()
+    if not mode:
+        return None
+    if mode not in PARQUET_MODES:
+        logger.warning(f"Ignoring TASDEED_PARQUET={mode!r}; expected one of {', '.join(PARQUET_MODES)}")
+        return None
+
+    compression = os.environ.get("TASDEED_PARQUET_COMPRESSION", "zstd")
+    stem = os.path.splitext(strip_compression_suffix(output_path))[0]
+    if mode == "dataset":
+        user_type = os.path.basename(stem).split("_")[0]
+        dataset_dir = os.path.join(os.path.dirname(output_path), f"{user_type}_parquet")
+        # The partition files are named after the run's output, e.g. MAZOON_3-2025_<run>-0.parquet, so every
+        # run adds its own files to the month partition
+        export_parquet(records, dataset_dir, partition_by_month=True, compression=compression,
+                       file_prefix=os.path.basename(stem))
+        return dataset_dir
+
+    parquet_path = f"{stem}.parquet"
+    export_parquet(records, parquet_path, compression=compression)
+    return parquet_path
+
+
+class CsvAppendWriter:
+    """
+    Output writer that keeps one CSV file open for a whole run.
+
+    Rows are appended through a ``csv.DictWriter`` with the fixed ``FIELDS``
+    header, so each write is O(1). ``flush`` pushes written rows to disk, and
+    only whole lines are ever left behind: when an existing file is reopened
+    with ``append=True``, a torn final line from a crash is cut off first.
+    """
+
+    def __init__(self, output_directory: str, filename: str = 'output.csv', append: bool = False):
+        os.makedirs(output_directory, exist_ok=True)
+        self.path = os.path.join(output_directory, filename)
+        self.rows_written = 0
+
+        has_header = False
+        if append and os.path.exists(self.path):
+            self._repair_tail()
+            has_header = os.path.getsize(self.path) > 0
+        self._file = open(self.path, mode='a' if append else 'w', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=FIELDS)
+        if not has_header:
+            self._writer.writeheader()
+            self.flush()
+
+    def _repair_tail(self) -> None:
+        """Truncate the file after its last complete line."""
+        with open(self.path, mode='rb+') as csv_file:
+            end = csv_file.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                step = min(8192, position)
+                position -= step
+                csv_file.seek(position)
+                block = csv_file.read(step)
+                newline = block.rfind(b"\n")
+                if newline != -1:
+                    keep = position + newline + 1
+                    break
+            else:
+                keep = 0
+            if keep != end:
+                logger.warning(f"Removing {end - keep} bytes of an incomplete row from {self.path}")
+                csv_file.truncate(keep)
+
+    def write(self, extracted: Union[BillRecord, Dict[Any, Any]]) -> None:
+        """Append one row (a BillRecord or ``extract_pdf_data``-style dict)."""
+        record = to_record(extracted)
+        self._writer.writerow({field_name: _cell(value) for field_name, value in record.items()})
+        self.rows_written += 1
+
+    def flush(self) -> None:
+        """Push written rows to disk. Callers batch rows between flushes (see ``BufferedSink``)."""
+        if not self._file.closed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
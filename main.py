@@ -1,21 +1,24 @@
+import time
+
+STARTED_AT = time.perf_counter()
+
 import asyncio
 import os
 import logging
+import importlib
 import subprocess
-import pandas as pd
 import sys
 import glob
 import shutil
-from datetime import datetime
-from typing import Tuple, Dict, List, Optional
+import threading
+from collections import deque
+from typing import TYPE_CHECKING, Tuple, Dict, List, Optional
 
 
+from data_transform.app_paths import app_data_dir
+
 # Safe log directory in AppData
-if os.name == 'nt':  # Windows
-    log_dir = os.path.join(os.environ.get("LOCALAPPDATA", os.getcwd()), "ORION")
-else:  # Linux/Mac
-    log_dir = os.path.join(os.path.expanduser("~"), ".local", "share", "ORION")
-os.makedirs(log_dir, exist_ok=True)
+log_dir = app_data_dir()
 log_file_path = os.path.join(log_dir, "app.log")
 
 # Configure logging
@@ -29,37 +32,112 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Set up Playwright browsers path for bundled executable
+# Set up Playwright browsers path for bundled executable (the browsers are installed by StartupThread)
 if hasattr(sys, "_MEIPASS"):
     # For bundled executable, use a persistent location
     browser_path = os.path.join(os.environ.get("LOCALAPPDATA", os.getcwd()), "ORION", "browsers")
     os.makedirs(browser_path, exist_ok=True)
     os.environ["PLAYWRIGHT_BROWSERS_PATH"] = browser_path
-
-    # Install browsers if they don't exist
-    chromium_path = os.path.join(browser_path, "chromium-1140")
-    if not os.path.exists(chromium_path):
-        try:
-            logger.info("Installing Playwright browsers for the first time...")
-            subprocess.run([sys.executable, "-m", "playwright", "install", "chromium"], check=True)
-            logger.info("Playwright browsers installed successfully")
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Failed to install Playwright browsers: {e}")
-        except Exception as e:
-            logger.error(f"Unexpected error installing browsers: {e}")
 else:
     # For development, use default location
     os.environ["PLAYWRIGHT_BROWSERS_PATH"] = "0"
 
 from PyQt5.QtGui import QIcon, QPixmap, QFont
 from PyQt5.QtWidgets import (
-    QApplication, QWidget, QLabel, QPushButton, QVBoxLayout, QTextEdit,
+    QApplication, QWidget, QLabel, QPushButton, QVBoxLayout, QListView,
     QFileDialog, QProgressBar, QMessageBox, QStackedLayout, QLineEdit
 )
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from PyQt5.QtCore import Qt, QThread, QTimer, QAbstractListModel, QModelIndex, pyqtSignal
+
+# pandas, PyMuPDF (fitz) and Playwright take seconds to import on office machines, so they are imported
+# where extraction needs them; StartupThread preloads them in the background once the window is shown
+from data_transform.extraction_cache import ExtractionCache
+from data_transform.writers import (
+    COMPRESSION_SUFFIXES, export_csv, export_xlsx, export_parquet_from_env, output_compression
+)
+from data_transform.results_store import ResultsStore
+from data_transform.pipeline import cached_extract, open_run_sink, output_stem
+from data_transform import metrics, tracing
+
+if TYPE_CHECKING:
+    from data_extractor.get_exact_pg import PortalClient
+
+# Heavy modules preloaded by StartupThread, in import order
+PIPELINE_MODULES = ("pandas", "fitz", "playwright.async_api", "data_transform.core_utils",
+                    "data_extractor.get_exact_pg")
+
+# Cleared while StartupThread installs browsers and preloads the pipeline; extraction waits for it
+startup_done = threading.Event()
+startup_done.set()
+# Seconds spent importing each preloaded module, logged in the startup report
+import_times: Dict[str, float] = {}
+
+
+def timed_import(name: str):
+    """Import a module and record how long it took (0 if it was already imported)."""
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    import_times.setdefault(name, time.perf_counter() - start)
+    return module
+
+
+def install_browsers() -> None:
+    """Install Chromium on first start of the bundled executable."""
+    if not hasattr(sys, "_MEIPASS"):
+        return
+    from data_extractor.get_exact_pg import cached_chromium_executable
+
+    chromium_path = os.path.join(os.environ["PLAYWRIGHT_BROWSERS_PATH"], "chromium-1140")
+    if cached_chromium_executable() or os.path.exists(chromium_path):
+        return
+    try:
+        logger.info("Installing Playwright browsers for the first time...")
+        subprocess.run([sys.executable, "-m", "playwright", "install", "chromium"], check=True)
+        logger.info("Playwright browsers installed successfully")
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Failed to install Playwright browsers: {e}")
+    except Exception as e:
+        logger.error(f"Unexpected error installing browsers: {e}")
+
+
+def log_startup_report(window_shown: float) -> None:
+    """Log how long the window took to show and what each deferred import cost."""
+    imports = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in import_times.items())
+    logger.info(f"Startup report: window shown after {window_shown:.2f}s; "
+                f"background setup finished after {time.perf_counter() - STARTED_AT:.2f}s; imports: {imports}")
+
+
+class StartupThread(QThread):
+    """Installs the browsers and preloads the heavy modules after the window is shown."""
+    status = pyqtSignal(str)
+
+    def __init__(self, window_shown: float):
+        super().__init__()
+        self.window_shown = window_shown
+        startup_done.clear()
+
+    def run(self):
+        try:
+            self.status.emit("⏳ Preparing browser...")
+            install_browsers()
+            self.status.emit("⏳ Loading extraction modules...")
+            for name in PIPELINE_MODULES:
+                timed_import(name)
+            self.status.emit("✅ Ready")
+        except Exception as e:
+            logger.error(f"Startup preparation failed: {e}", exc_info=True)
+            self.status.emit(f"⚠️ Browser setup failed: {e}")
+        finally:
+            startup_done.set()
+            log_startup_report(self.window_shown)
+
 
-from data_extractor.get_exact_pg import PortalClient
-from data_transform.core_utils import extract_pdf_data, save_text_to_xlsx, delete_pdf, _dummy_data
+# Progress signals are only recorded as they arrive; the widgets are updated at this rate
+UI_REFRESH_HZ = 10
+# The log view keeps only the most recent lines
+MAX_LOG_LINES = 5000
+# How long a cancel waits for the extraction thread to stop on its own before terminating it
+CANCEL_WAIT_MS = 10000
 
 
 def resource_path(filename: str) -> str:
@@ -91,6 +169,10 @@ class ExtractionThread(QThread):
         self.accounts_list = accounts_list
         self.output_directory = output_directory
         self.pdf_folder = pdf_folder
+        self.cache = ExtractionCache.default()
+        self.store = ResultsStore.default()
+        self.run_id = None
+        self.sink = None
         self._is_running = True
 
     def stop(self):
@@ -98,6 +180,9 @@ class ExtractionThread(QThread):
 
     def run(self):
         try:
+            if not startup_done.is_set():
+                self.update_progress.emit(0, len(self.accounts_list), "⏳ Preparing browser...")
+                startup_done.wait()
             asyncio.run(self.async_task())
         except asyncio.CancelledError:
             logger.info("Extraction task cancelled")
@@ -107,10 +192,14 @@ class ExtractionThread(QThread):
             self.error.emit(f"Critical error: {str(e)}")
 
     async def async_task(self):
+        from data_extractor.get_exact_pg import PortalClient
+
         try:
             username, password = get_user(self.user_type)
             client = PortalClient(username=username, password=password, cookies=[])
-            output_file = os.path.join(self.output_directory, "output.xlsx")
+            # Every row is persisted in the local results store; the workbook is exported from it at the end
+            self.run_id = self.store.start_run(self.user_type.upper(), source="desktop")
+            self.sink = open_run_sink(self.store, self.run_id, self.user_type.upper())
 
             async with client:
                 self.update_progress.emit(0, len(self.accounts_list), "⏳ Processing...")
@@ -122,20 +211,29 @@ class ExtractionThread(QThread):
                         raise asyncio.CancelledError()
 
                     try:
-                        await self._process_account(client, account_no, i, total)
+                        with metrics.track_account(account_no):
+                            await self._process_account(client, account_no, i, total)
                     except Exception as e:
                         logger.error(f"Error processing account {account_no}: {e}", exc_info=True)
                         # Note: This catch is for any unexpected errors not handled in _process_account
                         # The _process_account method now handles all expected errors internally
 
-                await self._finalize_output(output_file)
+                await self._finalize_output()
 
         except Exception as e:
             logger.error(f"Error in async task: {e}", exc_info=True)
             self.error.emit(str(e))
             return
+        finally:
+            # Flush whatever is still buffered on finish, error or cancel
+            if self.sink:
+                self.sink.close()
+            metrics.write_textfile_from_env()
+            tracing.export_chrome_trace()
+
+    async def _process_account(self, client: "PortalClient", account_no: str, i: int, total: int):
+        from data_transform.core_utils import _dummy_data
 
-    async def _process_account(self, client: PortalClient, account_no: str, i: int, total: int):
         if not self._is_running:
             raise asyncio.CancelledError()
 
@@ -144,7 +242,7 @@ class ExtractionThread(QThread):
         except Exception as e:
             logger.error(f"Error searching for account {account_no}: {e}")
             self.update_progress.emit(i, total, f"❌ Failed to access this account: {account_no}")
-            save_text_to_xlsx(self.output_directory, _dummy_data(account_no))
+            self.sink.write(_dummy_data(account_no))
             return  # Exit immediately instead of raising
 
         try:
@@ -152,7 +250,7 @@ class ExtractionThread(QThread):
         except Exception as e:
             logger.error(f"Error getting details for account {account_no}: {e}")
             self.update_progress.emit(i, total, f"❌ Failed to get details for account: {account_no}")
-            save_text_to_xlsx(self.output_directory, _dummy_data(account_no))
+            self.sink.write(_dummy_data(account_no))
             return  # Exit immediately instead of raising
 
         try:
@@ -161,7 +259,7 @@ class ExtractionThread(QThread):
         except Exception as e:
             logger.error(f"Error navigating to documents for account {account_no}: {e}")
             self.update_progress.emit(i, total, f"❌ Failed to access this account: {account_no}")
-            save_text_to_xlsx(self.output_directory, _dummy_data(account_no))
+            self.sink.write(_dummy_data(account_no))
             return  # Exit immediately instead of raising
 
         try:
@@ -170,55 +268,68 @@ class ExtractionThread(QThread):
         except Exception as e:
             logger.error(f"Error fetching documents for account {account_no}: {e}")
             self.update_progress.emit(i, total, f"❌ Failed to fetch data from bill: {account_no}")
-            save_text_to_xlsx(self.output_directory, _dummy_data(account_no))
+            self.sink.write(_dummy_data(account_no))
             return  # Exit immediately instead of raising
 
         if not documents:
             self.update_progress.emit(i, total, f"⚠️ No bill found for {account_no}")
-            save_text_to_xlsx(self.output_directory, _dummy_data(account_no))
+            metrics.account_failed("no_documents")
+            self.sink.write(_dummy_data(account_no))
             return
 
         document = documents[-1]
         creation_date = document.get("CreationDate")
-        if not creation_date or not PortalClient.is_in_current_month(creation_date):
+        if not creation_date or not client.is_in_current_month(creation_date):
             self.update_progress.emit(i, total, f"ℹ️ Old bill skipped: {account_no}")
-            save_text_to_xlsx(self.output_directory, _dummy_data(account_no))
+            metrics.account_failed("old_bill")
+            self.sink.write(_dummy_data(account_no))
             return
 
         doc_id = document.get("Id")
         pdf_path = os.path.join(self.pdf_folder, f"{doc_id}.pdf")
 
         try:
-            pdf_data = await client.fetch_pdf_data(document_id=doc_id)
-            await client.save_pdf(pdf_data, filepath=pdf_path)
-            extracted_data = extract_pdf_data(pdf_path)
-            save_text_to_xlsx(self.output_directory, extracted_data)
-            delete_pdf(pdf_path)
+            extracted_data = await cached_extract(self.cache, client, doc_id, pdf_path)
+            self.sink.write(extracted_data, account_no)
+            metrics.account_succeeded()
             self.update_progress.emit(i, total, f"✅ Success: {account_no}")
         except Exception as e:
             logger.error(f"Error processing PDF for account {account_no}: {e}")
-            if os.path.exists(pdf_path):
-                os.remove(pdf_path)
             self.update_progress.emit(i, total, f"❌ Failed to process PDF for this account: {account_no}")
-            save_text_to_xlsx(self.output_directory, _dummy_data(account_no))
+            self.sink.write(_dummy_data(account_no))
             return  # Exit immediately instead of raising
 
-    async def _finalize_output(self, output_file: str):
+    async def _finalize_output(self):
         try:
-            now = datetime.now()
-            month_year = now.strftime("%#m-%Y") if os.name == "nt" else now.strftime("%-m-%Y")
-            renamed = os.path.join(self.output_directory, f"{self.user_type.upper()}_{month_year}.xlsx")
+            renamed = f"{output_stem(self.output_directory, self.user_type.upper(), self.run_id[:8])}.xlsx"
 
-            # Rename the output file
+            # Write the workbook by streaming the current row of each input account out of the results store.
+            # Rows earlier runs of the same month wrote for these accounts are merged in (real rows win over
+            # dummy rows); other uploads of the month are left out.
             try:
-                if os.path.exists(output_file):
-                    shutil.move(output_file, renamed)
-                else:
-                    logger.warning(f"Output file {output_file} does not exist, cannot rename")
-                    raise FileNotFoundError(f"Output file {output_file} not found")
-            except (OSError, shutil.Error) as e:
-                logger.error(f"Error renaming output file: {e}")
-                raise ValueError(f"Could not rename output file: {str(e)}")
+                self.sink.close()
+                period = self.store.run_period(self.run_id)
+                user_type = self.user_type.upper()
+
+                def current_records():
+                    return self.store.iter_current_records(user_type, period, self.accounts_list)
+
+                export_xlsx(current_records(), renamed)
+            except (OSError, ValueError) as e:
+                logger.error(f"Error writing output file: {e}")
+                raise ValueError(f"Could not write output file: {str(e)}")
+
+            # The companion outputs are optional: failing to write one leaves the workbook and the run finished
+            try:
+                # With TASDEED_OUTPUT_COMPRESSION set, also write a compressed CSV for network shares
+                compression, level = output_compression()
+                if compression:
+                    csv_path = f"{os.path.splitext(renamed)[0]}.csv{COMPRESSION_SUFFIXES[compression]}"
+                    export_csv(current_records(), csv_path, compression, level)
+                export_parquet_from_env(current_records(), renamed)
+            except Exception as e:
+                logger.warning(f"Could not write the CSV/Parquet companion of {renamed}: {e}")
+            self.store.finish_run(self.run_id, renamed)
 
             # Clean up temporary PDF files
             try:
@@ -238,6 +349,42 @@ class ExtractionThread(QThread):
             raise ValueError(f"Error finalizing extraction process: {str(e)}")
 
 
+class LogModel(QAbstractListModel):
+    """The dashboard log: a list model holding the last ``max_lines`` lines."""
+
+    def __init__(self, max_lines: int = MAX_LOG_LINES):
+        super().__init__()
+        self.lines = deque()
+        self.max_lines = max_lines
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.lines)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return self.lines[index.row()]
+        return None
+
+    def append(self, lines: List[str]) -> None:
+        """Append lines, dropping the oldest ones beyond ``max_lines``."""
+        lines = lines[-self.max_lines:]
+        overflow = len(self.lines) + len(lines) - self.max_lines
+        if overflow > 0:
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            for _ in range(overflow):
+                self.lines.popleft()
+            self.endRemoveRows()
+        if lines:
+            self.beginInsertRows(QModelIndex(), len(self.lines), len(self.lines) + len(lines) - 1)
+            self.lines.extend(lines)
+            self.endInsertRows()
+
+    def clear(self) -> None:
+        self.beginResetModel()
+        self.lines.clear()
+        self.endResetModel()
+
+
 def get_user(user_type: str) -> Tuple[str, str]:
     users = {
         "MAZOON": {"username": "emzec", "password": "emzec"},
@@ -260,11 +407,18 @@ class Dashboard(QWidget):
 
         self.success_count = 0
         self.fail_count = 0
+        # Latest (current, total) and log lines received since the last refresh
+        self.pending_progress = None
+        self.pending_log: List[str] = []
 
         self.init_page1()
         self.init_page2()
         self.layout.setCurrentIndex(0)
 
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(1000 // UI_REFRESH_HZ)
+        self.refresh_timer.timeout.connect(self.refresh_ui)
+
     def init_page1(self):
         self.page1 = QWidget()
         layout = QVBoxLayout()
@@ -292,6 +446,12 @@ class Dashboard(QWidget):
         layout.addWidget(self.select_file_btn)
         layout.addWidget(self.select_output_btn)
         layout.addWidget(self.start_btn)
+
+        # Browser preparation status, updated by StartupThread
+        self.startup_status = QLabel("")
+        self.startup_status.setAlignment(Qt.AlignCenter)
+        self.startup_status.setStyleSheet("color: #666;")
+        layout.addWidget(self.startup_status)
         self.page1.setLayout(layout)
         self.layout.addWidget(self.page1)
 
@@ -308,8 +468,10 @@ class Dashboard(QWidget):
         self.status = QLabel("Progress: 0 / 0")
         self.status.setStyleSheet("font-weight: bold;")
 
-        self.log = QTextEdit()
-        self.log.setReadOnly(True)
+        self.log_model = LogModel()
+        self.log = QListView()
+        self.log.setModel(self.log_model)
+        self.log.setUniformItemSizes(True)
         self.log.setStyleSheet("background-color: #f9f9f9; font-family: Consolas;")
 
         self.cancel_btn = QPushButton("❌ Cancel")
@@ -332,6 +494,9 @@ class Dashboard(QWidget):
         self.page2.setLayout(layout)
         self.layout.addWidget(self.page2)
 
+    def set_startup_status(self, message):
+        self.startup_status.setText(message)
+
     def select_file(self):
         path, _ = QFileDialog.getOpenFileName(self, "Select Excel or CSV File", "", "Excel/CSV Files (*.xlsx *.csv)")
         if path:
@@ -349,6 +514,8 @@ class Dashboard(QWidget):
             QMessageBox.warning(self, "Missing Info", "Please select both file and output folder.")
             return
 
+        import pandas as pd
+
         df = pd.read_excel(self.file_path, dtype={"ACCOUNTNO": str}) if self.file_path.endswith(
             ".xlsx") else pd.read_csv(self.file_path, dtype={"ACCOUNTNO": str})
 
@@ -374,32 +541,56 @@ class Dashboard(QWidget):
 
         self.success_count = 0
         self.fail_count = 0
+        self.pending_progress = None
+        self.pending_log = []
 
         self.worker = ExtractionThread(user_type, accounts_list, self.output_directory, pdf_folder)
         self.worker.update_progress.connect(self.update_ui)
         self.worker.finished.connect(self.done_ui)
         self.worker.error.connect(self.handle_error)
         self.worker.start()
+        self.refresh_timer.start()
 
         self.cancel_btn.show()
         self.finish_btn.hide()
         self.layout.setCurrentIndex(1)
 
     def update_ui(self, current, total, message):
+        # Only record the update here; refresh_ui applies it to the widgets at UI_REFRESH_HZ
         if "✅ Success" in message:
             self.success_count += 1
         elif any(pattern in message for pattern in ["❌ Failed", "Can not get", "No bill found", "Old bill skipped"]):
             self.fail_count += 1
-            self.log.append(message)
-
-        self.progress.setMaximum(total)
-        self.progress.setValue(current)
-        self.status.setText(f"Progress: {current} / {total}")
+            self.pending_log.append(message)
+        self.pending_progress = (current, total)
+
+    def refresh_ui(self):
+        if self.pending_progress is not None:
+            current, total = self.pending_progress
+            self.pending_progress = None
+            self.progress.setMaximum(total)
+            self.progress.setValue(current)
+            self.status.setText(f"Progress: {current} / {total}")
+        self.append_log()
+
+    def append_log(self, *lines):
+        """Append the pending failure lines and ``lines`` to the log, following the end if it was showing."""
+        self.pending_log.extend(lines)
+        if not self.pending_log:
+            return
+        scrollbar = self.log.verticalScrollBar()
+        at_end = scrollbar.value() == scrollbar.maximum()
+        self.log_model.append(self.pending_log)
+        self.pending_log = []
+        if at_end:
+            self.log.scrollToBottom()
 
     def done_ui(self, output_file):
+        self.refresh_timer.stop()
+        self.refresh_ui()
         total = self.success_count + self.fail_count
-        self.log.append(f"\n✅ Done! File saved to: {output_file}")
-        self.log.append(f"📊 Summary: Success: {self.success_count}, Failed: {self.fail_count}, Total Tried: {total}")
+        self.append_log(f"✅ Done! File saved to: {output_file}",
+                        f"📊 Summary: Success: {self.success_count}, Failed: {self.fail_count}, Total Tried: {total}")
         self.cancel_btn.hide()
         self.finish_btn.show()
 
@@ -410,25 +601,34 @@ class Dashboard(QWidget):
             if os.path.normpath(source_dir) != os.path.normpath(target_dir):
                 target_file = os.path.join(target_dir, os.path.basename(output_file))
                 shutil.copy(output_file, target_file)
-                self.log.append(f"📂 Output also copied to: {target_file}")
+                self.append_log(f"📂 Output also copied to: {target_file}")
         except Exception as e:
-            self.log.append(f"⚠️ Failed to copy file: {str(e)}")
+            self.append_log(f"⚠️ Failed to copy file: {str(e)}")
 
     def handle_error(self, error_message):
         """Handle errors from the extraction thread."""
+        self.refresh_timer.stop()
+        self.refresh_ui()
         QMessageBox.critical(self, "Error", f"An error occurred: {error_message}")
-        self.log.append(f"❌ Error: {error_message}")
+        self.append_log(f"❌ Error: {error_message}")
         self.cancel_btn.hide()
         self.finish_btn.show()
 
     def cancel_process(self):
         if self.worker and self.worker.isRunning():
+            # The worker stops before its next account and flushes its buffered rows into the
+            # results store itself; a terminated thread may hold the sink's lock, so it is not touched then
             self.worker.stop()
-            self.worker.terminate()
-            self.worker.wait()
+            if not self.worker.wait(CANCEL_WAIT_MS):
+                logger.warning("Extraction thread did not stop in time, terminating it")
+                self.worker.terminate()
+                self.worker.wait()
+        self.refresh_timer.stop()
 
         # Clear log
-        self.log.clear()
+        self.pending_progress = None
+        self.pending_log = []
+        self.log_model.clear()
 
         # Remove temporary PDFs
         if hasattr(self, 'worker') and os.path.exists(self.worker.pdf_folder):
@@ -437,22 +637,14 @@ class Dashboard(QWidget):
                     if file.endswith(".pdf"):
                         os.remove(os.path.join(self.worker.pdf_folder, file))
             except Exception as e:
-                self.log.append(f"⚠️ Error cleaning temp files: {str(e)}")
-
-        # Delete partial CSV output if exists
-        try:
-            temp_csv = os.path.join(self.output_directory, "output.xlsx")
-            if os.path.exists(temp_csv):
-                os.remove(temp_csv)
-        except Exception as e:
-            self.log.append(f"⚠️ Error deleting temp output: {str(e)}")
+                self.append_log(f"⚠️ Error cleaning temp files: {str(e)}")
 
         # ❌ Delete log file
         try:
             if os.path.exists(log_file_path):
                 os.remove(log_file_path)
         except Exception as e:
-            self.log.append(f"⚠️ Error deleting log file: {str(e)}")
+            self.append_log(f"⚠️ Error deleting log file: {str(e)}")
 
         self.layout.setCurrentIndex(0)
 
@@ -528,6 +720,11 @@ if __name__ == "__main__":
         main.resize(500, 400)
         main.show()
 
+        # Install browsers and import the extraction modules once the window has been painted
+        startup = StartupThread(time.perf_counter() - STARTED_AT)
+        startup.status.connect(dash.set_startup_status)
+        QTimer.singleShot(0, startup.start)
+
         sys.exit(app.exec_())
     except ImportError as e:
         logger.error(f"Missing dependency: {e}")
@@ -11,6 +11,7 @@ import logging
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from web.server import create_app
+from web.supervisor import reuse_port_supported, run_workers
 
 if __name__ == '__main__':
     # Configure logging
@@ -25,19 +26,26 @@ if __name__ == '__main__':
     logger = logging.getLogger(__name__)
     
     try:
-        # Create and run the application
-        app = create_app()
-        
         # Get port from environment or use default
         port = int(os.environ.get('PORT', 8080))
-        
+
+        # Number of server processes ("auto": one per CPU core)
+        workers_setting = os.environ.get('TASDEED_WEB_WORKERS', '1').strip().lower()
+        workers = (os.cpu_count() or 1) if workers_setting == 'auto' else max(int(workers_setting), 1)
+        if workers > 1 and not reuse_port_supported():
+            logger.warning("SO_REUSEPORT is not available on this platform, running a single web worker")
+            workers = 1
+
         # Log startup message
-        logger.info(f"Starting web server on port {port}")
+        logger.info(f"Starting web server on port {port} with {workers} worker(s)")
         logger.info("Press Ctrl+C to stop the server")
-        
+
         # Run the server
-        import aiohttp.web
-        aiohttp.web.run_app(app, host='0.0.0.0', port=port)
+        if workers > 1:
+            run_workers(workers, '0.0.0.0', port)
+        else:
+            import aiohttp.web
+            aiohttp.web.run_app(create_app(), host='0.0.0.0', port=port)
     
     except Exception as e:
         logger.error(f"Error starting web server: {e}", exc_info=True)
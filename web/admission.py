@@ -0,0 +1,135 @@
+"""
+Admission control for web extraction tasks.
+
+Every task runs its own Chromium, so starting everything that is uploaded
+makes the machine swap. Tasks instead take a ticket when they are uploaded and
+wait, in FIFO order, until they fit within the configured limits:
+
+* TASDEED_MAX_CONCURRENT_TASKS: tasks running at once (default 2)
+* TASDEED_MAX_INFLIGHT_ACCOUNTS: accounts across running tasks (default 0, no limit)
+* TASDEED_MAX_BROWSER_MEMORY_MB: estimated browser memory across running tasks,
+  at TASDEED_BROWSER_MEMORY_MB per task (default 0, no limit)
+
+A task that exceeds a limit on its own still runs once nothing else is running.
+At most TASDEED_MAX_QUEUED_TASKS tasks wait (default 20); further uploads are
+rejected. Limits apply per web worker process.
+"""
+
+import os
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENT_TASKS = 2
+DEFAULT_MAX_QUEUED_TASKS = 20
+DEFAULT_BROWSER_MEMORY_MB = 350
+
+
+class AdmissionTicket:
+    """A task's place in the admission queue."""
+
+    def __init__(self, task_id: str, on_position: Optional[Callable[[int, int], None]] = None):
+        self.task_id = task_id
+        self.on_position = on_position
+        # Unknown until the task has parsed its account sheet; the head of the queue waits for it
+        self.accounts: Optional[int] = None
+        self.admitted: "asyncio.Future[bool]" = asyncio.get_running_loop().create_future()
+
+
+class AdmissionController:
+    """FIFO admission of tasks within concurrency, account and browser-memory limits."""
+
+    def __init__(self, max_tasks: Optional[int] = None, max_accounts: Optional[int] = None,
+                 max_browser_mb: Optional[int] = None, browser_mb: Optional[int] = None,
+                 max_queued: Optional[int] = None):
+        self.max_tasks = max_tasks or int(os.environ.get("TASDEED_MAX_CONCURRENT_TASKS", DEFAULT_MAX_CONCURRENT_TASKS))
+        self.max_accounts = max_accounts if max_accounts is not None else int(
+            os.environ.get("TASDEED_MAX_INFLIGHT_ACCOUNTS", 0))
+        self.max_browser_mb = max_browser_mb if max_browser_mb is not None else int(
+            os.environ.get("TASDEED_MAX_BROWSER_MEMORY_MB", 0))
+        self.browser_mb = browser_mb or int(os.environ.get("TASDEED_BROWSER_MEMORY_MB", DEFAULT_BROWSER_MEMORY_MB))
+        self.max_queued = max_queued if max_queued is not None else int(
+            os.environ.get("TASDEED_MAX_QUEUED_TASKS", DEFAULT_MAX_QUEUED_TASKS))
+        self.running: Dict[str, int] = {}
+        self.waiting: Deque[AdmissionTicket] = deque()
+
+    def is_full(self) -> bool:
+        """Whether a new upload would exceed the queue limit (tickets that would start right away don't count)."""
+        free_slots = max(self.max_tasks - len(self.running), 0)
+        return len(self.waiting) >= self.max_queued + free_slots
+
+    def enqueue(self, task_id: str, on_position: Optional[Callable[[int, int], None]] = None) -> AdmissionTicket:
+        """
+        Take a place at the back of the queue.
+
+        Args:
+            task_id: The task waiting to run
+            on_position: Called with (position, queue length) whenever the ticket's position changes
+        """
+        ticket = AdmissionTicket(task_id, on_position)
+        self.waiting.append(ticket)
+        return ticket
+
+    async def wait(self, ticket: AdmissionTicket, accounts: int) -> bool:
+        """
+        Wait until the task may run. Returns False if the ticket was withdrawn
+        (the task was cancelled while queued).
+        """
+        ticket.accounts = accounts
+        self._admit()
+        if not ticket.admitted.done():
+            self._notify_positions()
+        return await asyncio.shield(ticket.admitted)
+
+    def withdraw(self, ticket: AdmissionTicket) -> None:
+        """Leave the queue without running."""
+        if ticket in self.waiting:
+            self.waiting.remove(ticket)
+            ticket.admitted.set_result(False)
+            self._admit()
+            self._notify_positions()
+
+    def release(self, ticket: AdmissionTicket) -> None:
+        """Free the capacity of a finished task (or withdraw it, if it never ran)."""
+        if self.running.pop(ticket.task_id, None) is not None:
+            self._admit()
+        else:
+            self.withdraw(ticket)
+
+    def _fits(self, accounts: int) -> bool:
+        if not self.running:
+            return True
+        if len(self.running) >= self.max_tasks:
+            return False
+        if self.max_accounts and sum(self.running.values()) + accounts > self.max_accounts:
+            return False
+        if self.max_browser_mb and (len(self.running) + 1) * self.browser_mb > self.max_browser_mb:
+            return False
+        return True
+
+    def _admit(self) -> None:
+        admitted = False
+        while self.waiting and self.waiting[0].accounts is not None and self._fits(self.waiting[0].accounts):
+            ticket = self.waiting.popleft()
+            self.running[ticket.task_id] = ticket.accounts
+            ticket.admitted.set_result(True)
+            admitted = True
+            logger.info(f"Admitted task {ticket.task_id} ({ticket.accounts} accounts, "
+                        f"{len(self.running)} running, {len(self.waiting)} queued)")
+        if admitted:
+            self._notify_positions()
+
+    def _notify_positions(self) -> None:
+        for position, ticket in enumerate(self.waiting, 1):
+            if ticket.on_position:
+                ticket.on_position(position, len(self.waiting))
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "running": len(self.running),
+            "queued": len(self.waiting),
+            "inflight_accounts": sum(self.running.values()),
+        }
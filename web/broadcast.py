@@ -0,0 +1,154 @@
+"""
+Per-client WebSocket delivery for task updates.
+
+The extraction loop must never wait on a browser tab: every connection gets its
+own bounded send queue drained by a writer task, and progress/stats updates are
+coalesced so a client receives at most one frame of each per interval.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from aiohttp.web import WebSocketResponse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 200
+DEFAULT_COALESCE_SECONDS = 0.25
+DEFAULT_SEND_TIMEOUT = 10.0
+
+# Message types where only the latest value matters
+COALESCED_TYPES = ("progress", "stats", "queued")
+# Message types that may be dropped when a client falls behind
+DROPPABLE_TYPES = ("log",)
+# Message types that end a task; pending coalesced updates are sent before them
+TERMINAL_TYPES = ("complete", "error")
+
+
+class ClientConnection:
+    """
+    One WebSocket client with its own send queue and writer task.
+
+    ``offer`` never blocks. Progress and stats messages replace the previous
+    unsent value of the same type and are sent at most once per
+    ``coalesce_seconds``. Other messages are queued in order; when the queue is
+    full the oldest log message is dropped (downsampling a slow client), and a
+    client whose queue holds nothing droppable, or whose send takes longer than
+    ``send_timeout``, is disconnected.
+    """
+
+    def __init__(self, ws: WebSocketResponse, max_queue: Optional[int] = None,
+                 coalesce_seconds: Optional[float] = None, send_timeout: float = DEFAULT_SEND_TIMEOUT):
+        self.ws = ws
+        self.max_queue = max_queue or int(os.environ.get("TASDEED_WS_QUEUE_SIZE", DEFAULT_QUEUE_SIZE))
+        self.coalesce_seconds = coalesce_seconds if coalesce_seconds is not None else float(
+            os.environ.get("TASDEED_WS_COALESCE_SECONDS", DEFAULT_COALESCE_SECONDS))
+        self.send_timeout = send_timeout
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.closed = False
+        self._queue: Deque[Tuple[str, str]] = deque()
+        self._latest: Dict[str, str] = {}
+        self._next_coalesced_at = 0.0
+        self._wakeup = asyncio.Event()
+        self._writer = asyncio.create_task(self._write_loop())
+
+    @property
+    def pending(self) -> int:
+        """Messages waiting to be sent to this client"""
+        return len(self._queue) + len(self._latest)
+
+    def offer(self, message_type: str, data: str) -> bool:
+        """
+        Queue a serialized message for this client without waiting.
+
+        Returns:
+            bool: False if the client has been disconnected
+        """
+        if self.closed or self.ws.closed:
+            self.closed = True
+            return False
+
+        if message_type in COALESCED_TYPES:
+            if message_type in self._latest:
+                self.coalesced += 1
+            self._latest[message_type] = data
+        else:
+            if message_type in TERMINAL_TYPES:
+                self._queue.extend(self._latest.items())
+                self._latest.clear()
+            if len(self._queue) >= self.max_queue and not self._make_room():
+                logger.warning(f"WebSocket client fell {len(self._queue)} messages behind, disconnecting it")
+                self._disconnect()
+                return False
+            self._queue.append((message_type, data))
+
+        self._wakeup.set()
+        return True
+
+    def replay(self, messages: List[Tuple[str, str]]) -> None:
+        """Queue (type, data) messages in order, bypassing coalescing and the queue limit (used on connect)."""
+        if self.closed:
+            return
+        self._queue.extend(messages)
+        self._wakeup.set()
+
+    def _make_room(self) -> bool:
+        """Drop the oldest droppable message; False if there is none."""
+        for index, (queued_type, _) in enumerate(self._queue):
+            if queued_type in DROPPABLE_TYPES:
+                del self._queue[index]
+                self.dropped += 1
+                return True
+        return False
+
+    def _next_message(self) -> Optional[str]:
+        if self._queue:
+            return self._queue.popleft()[1]
+        if self._latest and time.monotonic() >= self._next_coalesced_at:
+            message_type = next(iter(self._latest))
+            if len(self._latest) == 1:
+                self._next_coalesced_at = time.monotonic() + self.coalesce_seconds
+            return self._latest.pop(message_type)
+        return None
+
+    async def _write_loop(self) -> None:
+        try:
+            while not self.closed:
+                self._wakeup.clear()
+                data = self._next_message()
+                if data is None:
+                    timeout = max(self._next_coalesced_at - time.monotonic(), 0) if self._latest else None
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await asyncio.wait_for(self.ws.send_str(data), self.send_timeout)
+                self.sent += 1
+        except asyncio.TimeoutError:
+            logger.warning(f"WebSocket send took longer than {self.send_timeout}s, disconnecting the client")
+            self._disconnect()
+        except (ConnectionResetError, RuntimeError) as e:
+            logger.info(f"WebSocket client went away: {e}")
+            self.closed = True
+        except asyncio.CancelledError:
+            pass
+
+    def _disconnect(self) -> None:
+        self.closed = True
+        self._wakeup.set()
+        if not self.ws.closed:
+            asyncio.ensure_future(self.ws.close())
+
+    def close(self) -> None:
+        """Stop the writer task (unsent messages are discarded)."""
+        self.closed = True
+        if not self._writer.done():
+            self._writer.cancel()
+        logger.info(f"WebSocket client closed: sent={self.sent}, coalesced={self.coalesced}, dropped={self.dropped}")
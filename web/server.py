@@ -1,22 +1,42 @@
 import os
+import re
 import uuid
 import json
+import time
+import zlib
 import logging
 import asyncio
+import sqlite3
 import tempfile
+import functools
 import pandas as pd
-from datetime import datetime
-from typing import Dict, List, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from typing import Dict, Iterator, List, Any, Optional, Tuple, Union
 
 import aiohttp
-from aiohttp import web
+from aiohttp import hdrs, web
 import aiohttp_jinja2
 import jinja2
 from aiohttp.web import WebSocketResponse
 
 # Import the extraction functionality
+from data_extractor.browser_pool import DEFAULT_POOL_SIZE, BrowserPool
 from data_extractor.get_exact_pg import PortalClient
-from data_transform.core_utils import extract_pdf_data, save_text_to_xlsx, delete_pdf, _dummy_data
+from data_extractor.session_pool import DEFAULT_SESSIONS_PER_USER, SessionPool
+from data_transform.core_utils import _dummy_data, iter_csv_from_docs
+from data_transform.bill_record import BillRecord
+from data_transform.extraction_cache import ExtractionCache
+from data_transform.writers import (
+    COMPRESSION_SUFFIXES, CsvAppendWriter, compression_of, export_csv, export_xlsx, export_parquet_from_env,
+    open_text_input, output_compression, strip_compression_suffix
+)
+from data_transform.results_store import ResultsStore, account_key
+from data_transform.pipeline import cached_extract, open_run_sink, output_stem
+from data_transform import metrics, tracing
+from web.admission import AdmissionController
+from web.broadcast import COALESCED_TYPES, ClientConnection
+from web.task_registry import UNFINISHED_STATUSES, TaskRegistry, process_alive
 
 # Configure logging
 logging.basicConfig(
@@ -29,39 +49,170 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Global storage for active tasks and their WebSocket connections
+# Global storage for active tasks and their WebSocket connections. Every task is also
+# recorded in the TaskRegistry, which rebuilds these on startup (see resume_tasks).
 active_tasks = {}
+# Finished tasks, kept for TASDEED_TASK_RETENTION_SECONDS so clients can reconnect, query
+# them and download their output from /api/tasks/{task_id}/result
+finished_tasks = {}
+# Uploaded tasks wait here, in order, until they fit within the concurrency limits
+admission = AdmissionController()
+# Shared Chromium browsers that tasks lease contexts from (started with the app; None if disabled)
+browser_pool: Optional[BrowserPool] = None
+# Logged-in portal sessions in the pooled browsers, shared by tasks of the same company
+session_pool: Optional[SessionPool] = None
+# Workbooks being exported for download, by path (see _build_xlsx)
+xlsx_builds: Dict[str, asyncio.Future] = {}
+# Task registry writes of every task go through this one thread, in order, off the event loop
+registry_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="task-registry")
+
+DEFAULT_EVENT_BUFFER = 1000
+DEFAULT_TASK_RETENTION_SECONDS = 3600
+# How often a worker relaying another worker's task polls the task registry
+REGISTRY_POLL_SECONDS = 0.5
+# A task's progress and events are written to the task registry in batches, at most this long after they happen
+REGISTRY_FLUSH_SECONDS = 0.5
+RETRY_AFTER_SECONDS = 60
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+UPLOAD_CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_UPLOAD_MB = 50
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+RESULT_CONTENT_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
 
 
 class ExtractionTask:
     """Class to manage an extraction task and its state"""
 
-    def __init__(self, task_id: str, user_type: str, accounts_list: List[str], output_directory: str):
+    def __init__(self, task_id: str, user_type: Optional[str], accounts_list: List[str], output_directory: str,
+                 source_file: Optional[str] = None):
         self.task_id = task_id
+        # Uploaded account sheet; parsed when the task starts (see _load_accounts)
+        self.source_file = source_file
         self.user_type = user_type
         self.accounts_list = accounts_list
         self.output_directory = output_directory
         self.pdf_folder = os.path.join(tempfile.gettempdir(), f"pdf_temp_{task_id}")
+        self.cache = ExtractionCache.default()
+        self.store = ResultsStore.default()
+        self.registry = TaskRegistry.default()
+        self.run_id = None
+        self.ticket = None
+        self.queue_position = None
+        self.runner: Optional[asyncio.Task] = None
+        self.sink = None
+        self.csv_writer = None
+        self.output_file = None
         self.is_running = False
         self.is_cancelled = False
-        self.connections = []  # WebSocket connections
+        self.connections: List[ClientConnection] = []  # WebSocket clients, each with its own send queue
         self.success_count = 0
         self.fail_count = 0
         self.current_progress = 0
         self.total_accounts = len(accounts_list)
-
-        # Create output and temp directories
+        self.status = "pending"
+        self.last_progress_message = None
+        self.started_at = time.time()
+        self.finished_at = None
+        # Every broadcast gets a sequence number; recent log/complete/error events are kept so a
+        # reconnecting client can replay what it missed (progress/stats are covered by the snapshot)
+        self.seq = 0
+        self.events = deque(maxlen=int(os.environ.get("TASDEED_EVENT_BUFFER", DEFAULT_EVENT_BUFFER)))
+        self.evicted_seq = 0
+        # Columns and events waiting for the next task registry write (see _persist)
+        self.registry_values: Dict[str, Any] = {}
+        self.registry_events: List[Tuple[int, str, str]] = []
+        self.registry_flush: Optional[asyncio.TimerHandle] = None
+
+        # Create output directory
         os.makedirs(self.output_directory, exist_ok=True)
-        os.makedirs(self.pdf_folder, exist_ok=True)
+
+    @classmethod
+    def from_registry(cls, row: Dict[str, Any]) -> "ExtractionTask":
+        """Rebuild a task from its TaskRegistry row (see ``TaskRegistry.load``)"""
+        task = cls(row["task_id"], row["user_type"], row["accounts"], row["output_directory"],
+                   source_file=row["source_file"])
+        task.run_id = row["run_id"]
+        # Earlier events are in the registry only
+        task.seq = task.evicted_seq = row["seq"]
+        task.status = row["status"]
+        task.total_accounts = row["total"]
+        task.current_progress = row["current"]
+        task.success_count = row["success"]
+        task.fail_count = row["failed"]
+        task.last_progress_message = row["message"]
+        task.output_file = row["output_file"]
+        task.started_at = row["created_at"]
+        task.finished_at = row["finished_at"]
+        return task
+
+    def _persist(self, **values: Any):
+        """
+        Record the task's status and counters (plus any other columns) in the task
+        registry, within REGISTRY_FLUSH_SECONDS (see ``_flush_registry``)
+        """
+        self.registry_values.update(values)
+        if self.registry_flush is None:
+            self.registry_flush = asyncio.get_running_loop().call_later(
+                REGISTRY_FLUSH_SECONDS, lambda: asyncio.ensure_future(self._flush_registry()))
+
+    async def _flush_registry(self):
+        """
+        Write the task's state and the events broadcast since the last write to the
+        task registry in one transaction, in the registry thread. A cancel requested
+        through another worker process is picked up here.
+        """
+        if self.registry_flush is not None:
+            self.registry_flush.cancel()
+            self.registry_flush = None
+        values, self.registry_values = self.registry_values, {}
+        events, self.registry_events = self.registry_events, []
+        record = functools.partial(
+            self.registry.record, self.task_id, events, status=self.status, current=self.current_progress,
+            success=self.success_count, failed=self.fail_count, total=self.total_accounts,
+            message=self.last_progress_message, seq=self.seq, **values
+        )
+        try:
+            cancel_requested = await asyncio.get_running_loop().run_in_executor(registry_executor, record)
+        except sqlite3.Error as e:
+            logger.error(f"Error saving task {self.task_id} to the task registry: {e}")
+            return
+        if cancel_requested and not self.is_cancelled and self.status in UNFINISHED_STATUSES:
+            logger.info(f"Task {self.task_id} was cancelled through another worker process")
+            self.cancel()
 
     async def start(self):
-        """Start the extraction process"""
+        """
+        Start the extraction process (or resume it, if the task has a results-store
+        run already) once the admission queue lets it run.
+        """
         if self.is_running:
             return
 
         self.is_running = True
+        if self.ticket is None:
+            self.ticket = admission.enqueue(self.task_id, self._on_queue_position)
+        self.status = "queued"
+        self._persist()
+        interrupted = False
         try:
+            os.makedirs(self.pdf_folder, exist_ok=True)
+            if self.source_file:
+                await self._load_accounts()
+            if not await self._wait_for_admission():
+                logger.info(f"Task {self.task_id} was cancelled while queued")
+                return
+            self.status = "running"
+            self.queue_position = None
+            self._persist()
             await self.process_accounts()
+        except asyncio.CancelledError:
+            # Server shutdown: the task stays "running" in the registry and resumes on the next start
+            interrupted = True
+            raise
         except Exception as e:
             logger.error(f"Error in extraction task: {e}", exc_info=True)
             await self.broadcast({
@@ -70,34 +221,118 @@ class ExtractionTask:
             })
         finally:
             self.is_running = False
-            self.cleanup()
+            admission.release(self.ticket)
+            await self.cleanup()
+            if interrupted:
+                await self._flush_registry()
+                logger.info(f"Task {self.task_id} interrupted at {self.current_progress}/{self.total_accounts}")
+            else:
+                if self.status in ("queued", "running"):
+                    self.status = "cancelled" if self.is_cancelled else "completed"
+                self.finished_at = time.time()
+                self._persist(output_file=self.output_file, finished_at=self.finished_at)
+                await self._flush_registry()
+                # Keep the task around (for reconnects, queries and downloads) for the retention window
+                finished_tasks[self.task_id] = self
+                active_tasks.pop(self.task_id, None)
+                logger.info(f"Task {self.task_id} finished with status {self.status}")
+
+    async def _wait_for_admission(self) -> bool:
+        """Wait in the admission queue; False if the task was cancelled before it could run"""
+        waiter = asyncio.ensure_future(admission.wait(self.ticket, self.total_accounts))
+        try:
+            while True:
+                done, _ = await asyncio.wait({waiter}, timeout=REGISTRY_POLL_SECONDS)
+                if done:
+                    return waiter.result()
+                # A cancel may also come in through another worker process
+                if await asyncio.get_running_loop().run_in_executor(
+                        registry_executor, self.registry.cancel_requested, self.task_id):
+                    self.cancel()
+        finally:
+            waiter.cancel()
+
+    def _on_queue_position(self, position: int, queued: int):
+        """Tell clients where the task is in the admission queue"""
+        self.queue_position = position
+        self.last_progress_message = f"⏳ Waiting for a free slot: position {position} of {queued} in the queue"
+        self._persist()
+        asyncio.ensure_future(self.broadcast({
+            "type": "queued",
+            "position": position,
+            "queued": queued,
+            "message": self.last_progress_message
+        }))
+
+    async def _load_accounts(self):
+        """Parse the uploaded account sheet in an executor and announce the account count"""
+        loop = asyncio.get_running_loop()
+        try:
+            self.user_type, self.accounts_list = await loop.run_in_executor(None, load_accounts, self.source_file)
+        finally:
+            try:
+                os.remove(self.source_file)
+            except OSError as e:
+                logger.warning(f"Error removing temp file: {e}")
+            self.source_file = None
+        self.total_accounts = len(self.accounts_list)
+        self._persist(user_type=self.user_type, accounts=self.accounts_list, source_file=None)
+        await self.broadcast({
+            "type": "stats",
+            "success": self.success_count,
+            "failed": self.fail_count,
+            "total": self.total_accounts
+        })
 
     async def process_accounts(self):
         """Process all accounts in the list"""
         try:
             username, password = get_user(self.user_type)
-            client = PortalClient(username=username, password=password, cookies=[])
-            # Use a task-specific output filename to avoid conflicts between concurrent tasks
-            output_filename = f"output_{self.task_id}.csv"
-            output_file = os.path.join(self.output_directory, output_filename)
-
-            async with client:
+            if session_pool is not None:
+                portal = session_pool.session(username, password)
+            else:
+                portal = PortalClient(username=username, password=password, cookies=[], pool=browser_pool)
+            # Rows are appended to a live CSV as they arrive (kept if the task is cancelled) and
+            # persisted in the local results store, which the final output is exported from.
+            # A resumed task keeps its run and live CSV and skips the accounts it already wrote.
+            resumed = self.run_id is not None
+            if resumed:
+                remaining = self._remaining_accounts()
+                logger.info(f"Resuming task {self.task_id}: {len(remaining)} of {self.total_accounts} accounts left")
+            else:
+                remaining = self.accounts_list
+                self.run_id = self.store.start_run(self.user_type.upper(), source=f"web:{self.task_id}")
+                self._persist(run_id=self.run_id)
+            self.csv_writer = CsvAppendWriter(self.output_directory, f"output_{self.task_id}.csv", append=resumed)
+            # Off the event loop: connecting to MongoDB can block for seconds
+            self.sink = await asyncio.get_running_loop().run_in_executor(
+                None, open_run_sink, self.store, self.run_id, self.user_type.upper(), [self.csv_writer])
+
+            async with portal as client:
+                done = self.total_accounts - len(remaining)
                 await self.broadcast({
                     "type": "progress",
-                    "current": 0,
+                    "current": done,
                     "total": self.total_accounts,
                     "message": "⏳ Processing..."
                 })
 
-                await client.login()
+                if not client.logged_in:
+                    await client.login()
+                if not client.logged_in and session_pool is not None:
+                    # Rejected: log in afresh next time instead of reusing this session
+                    session_pool.discard(client)
 
-                for i, account_no in enumerate(self.accounts_list, 1):
+                success_before, fail_before = self.success_count, self.fail_count
+                for i, account_no in enumerate(remaining, done + 1):
+                    # Also set when a cancel comes in through another worker process (see _flush_registry)
                     if self.is_cancelled:
                         logger.info(f"Task {self.task_id} was cancelled")
                         break
 
                     try:
-                        await self._process_account(client, account_no, i)
+                        with metrics.track_account(account_no):
+                            await self._process_account(client, account_no, i)
                     except Exception as e:
                         logger.error(f"Error processing account {account_no}: {e}", exc_info=True)
                         self.fail_count += 1
@@ -113,23 +348,27 @@ class ExtractionTask:
                             "failed": self.fail_count,
                             "total": self.total_accounts
                         })
+                    self._persist()
+
+                # A session most accounts failed on may be broken (expired, or stuck on an error page)
+                failed = self.fail_count - fail_before
+                if session_pool is not None and failed > (self.success_count - success_before):
+                    session_pool.discard(client)
 
                 # Finalize the output
                 if not self.is_cancelled:
-                    output_file = await self._finalize_output(output_file)
+                    output_file = await self._finalize_output()
+                    self.output_file = output_file
                     await self.broadcast({
                         "type": "complete",
                         "success": self.success_count,
                         "failed": self.fail_count,
                         "total": self.total_accounts,
-                        "output_file": output_file
+                        "output_file": output_file,
+                        "download_url": f"/api/tasks/{self.task_id}/result" if output_file else None,
+                        "output_metrics": self.sink.metrics.snapshot()
                     })
 
-                    # Clean up the task from active_tasks
-                    if self.task_id in active_tasks:
-                        del active_tasks[self.task_id]
-                        logger.info(f"Removed completed task {self.task_id} from active_tasks")
-
         except Exception as e:
             logger.error(f"Error in process_accounts: {e}", exc_info=True)
             await self.broadcast({
@@ -137,6 +376,24 @@ class ExtractionTask:
                 "message": str(e)
             })
 
+    def _remaining_accounts(self) -> List[str]:
+        """
+        Return the accounts a resumed task still has to process and recount the
+        finished ones from the rows its run already has in the results store.
+        """
+        written = self.store.run_accounts(self.run_id)
+        remaining = []
+        self.success_count = self.fail_count = 0
+        for account_no in self.accounts_list:
+            is_dummy = written.get(account_key(account_no))
+            if is_dummy is None:
+                remaining.append(account_no)
+            elif is_dummy:
+                self.fail_count += 1
+            else:
+                self.success_count += 1
+        return remaining
+
     async def _process_account(self, client: PortalClient, account_no: str, current_index: int):
         """Process a single account"""
         try:
@@ -158,9 +415,7 @@ class ExtractionTask:
                     "message": f"❌ Failed to search for account: {account_no}",
                     "level": "error"
                 })
-                # Use the task-specific output filename
-                output_filename = f"output_{self.task_id}.csv"
-                save_text_to_xlsx(self.output_directory, _dummy_data(account_no), output_filename)
+                self.sink.write(_dummy_data(account_no))
                 self.fail_count += 1
                 return
 
@@ -174,9 +429,7 @@ class ExtractionTask:
                     "message": f"❌ Failed to get details for account: {account_no}",
                     "level": "error"
                 })
-                # Use the task-specific output filename
-                output_filename = f"output_{self.task_id}.csv"
-                save_text_to_xlsx(self.output_directory, _dummy_data(account_no), output_filename)
+                self.sink.write(_dummy_data(account_no))
                 self.fail_count += 1
                 return
 
@@ -191,9 +444,7 @@ class ExtractionTask:
                     "message": f"❌ Failed to navigate to documents for account: {account_no}",
                     "level": "error"
                 })
-                # Use the task-specific output filename
-                output_filename = f"output_{self.task_id}.csv"
-                save_text_to_xlsx(self.output_directory, _dummy_data(account_no), output_filename)
+                self.sink.write(_dummy_data(account_no))
                 self.fail_count += 1
                 return
 
@@ -208,9 +459,7 @@ class ExtractionTask:
                     "message": f"❌ Failed to fetch documents for account: {account_no}",
                     "level": "error"
                 })
-                # Use the task-specific output filename
-                output_filename = f"output_{self.task_id}.csv"
-                save_text_to_xlsx(self.output_directory, _dummy_data(account_no), output_filename)
+                self.sink.write(_dummy_data(account_no))
                 self.fail_count += 1
                 return
 
@@ -221,9 +470,8 @@ class ExtractionTask:
                     "message": f"⚠️ No bill found for account: {account_no}",
                     "level": "warning"
                 })
-                # Use the task-specific output filename
-                output_filename = f"output_{self.task_id}.csv"
-                save_text_to_xlsx(self.output_directory, _dummy_data(account_no), output_filename)
+                metrics.account_failed("no_documents")
+                self.sink.write(_dummy_data(account_no))
                 self.fail_count += 1
                 return
 
@@ -238,9 +486,8 @@ class ExtractionTask:
                     "message": f"ℹ️ Old bill skipped for account: {account_no}",
                     "level": "info"
                 })
-                # Use the task-specific output filename
-                output_filename = f"output_{self.task_id}.csv"
-                save_text_to_xlsx(self.output_directory, _dummy_data(account_no), output_filename)
+                metrics.account_failed("old_bill")
+                self.sink.write(_dummy_data(account_no))
                 self.fail_count += 1
                 return
 
@@ -249,20 +496,11 @@ class ExtractionTask:
             pdf_path = os.path.join(self.pdf_folder, f"{doc_id}.pdf")
 
             try:
-                # Fetch and save PDF
-                pdf_data = await client.fetch_pdf_data(document_id=doc_id)
-                await client.save_pdf(pdf_data, filepath=pdf_path)
-
-                # Extract data from PDF
-                extracted_data = extract_pdf_data(pdf_path)
-                # Use the task-specific output filename
-                output_filename = f"output_{self.task_id}.csv"
-                save_text_to_xlsx(self.output_directory, extracted_data, output_filename)
-
-                # Delete PDF to save space
-                delete_pdf(pdf_path)
+                extracted_data = await cached_extract(self.cache, client, doc_id, pdf_path)
+                self.sink.write(extracted_data, account_no)
 
                 # Update success count and broadcast progress
+                metrics.account_succeeded()
                 self.success_count += 1
                 await self.broadcast({
                     "type": "progress",
@@ -280,8 +518,6 @@ class ExtractionTask:
 
             except Exception as e:
                 logger.error(f"Error processing PDF for account {account_no}: {e}")
-                if os.path.exists(pdf_path):
-                    os.remove(pdf_path)
 
                 await self.broadcast({
                     "type": "log",
@@ -289,9 +525,7 @@ class ExtractionTask:
                     "level": "error"
                 })
 
-                # Use the task-specific output filename
-                output_filename = f"output_{self.task_id}.csv"
-                save_text_to_xlsx(self.output_directory, _dummy_data(account_no), output_filename)
+                self.sink.write(_dummy_data(account_no))
                 self.fail_count += 1
 
         except Exception as e:
@@ -303,36 +537,35 @@ class ExtractionTask:
                 "level": "error"
             })
 
-    async def _finalize_output(self, output_file: str) -> str:
-        """Finalize the output file and return the path to the renamed file"""
+    async def _finalize_output(self) -> Optional[str]:
+        """Export one current row per account from the results store and return the output path"""
         try:
-            # Generate a filename with the current month and year
-            now = datetime.now()
-            # Use #m-%Y format for Windows, %-m-%Y for other platforms
-            month_format = "#m-%Y" if os.name == "nt" else "%-m-%Y"
-            month_year = now.strftime(month_format)
-            renamed = os.path.join(self.output_directory, f"{self.user_type.upper()}_{month_year}.csv")
-
-            # Rename the output file
-            if os.path.exists(output_file):
-                if os.path.exists(renamed):
-                    os.remove(renamed)  # Remove existing file if it exists
-                os.rename(output_file, renamed)
-                logger.info(f"Renamed output file to {renamed}")
-                await self.broadcast({
-                    "type": "log",
-                    "message": f"📂 Output file renamed to: {os.path.basename(renamed)}",
-                    "level": "info"
-                })
-            else:
-                logger.warning(f"Output file {output_file} does not exist, cannot rename")
-                await self.broadcast({
-                    "type": "log",
-                    "message": f"⚠️ Output file not found: {output_file}",
-                    "level": "warning"
-                })
+            # Named after the task, so that concurrent tasks of the same month never write the same file
+            renamed = f"{output_stem(self.output_directory, self.user_type.upper(), self.task_id)}.csv"
+
+            # Closing the sink flushes the last batch into the store (off the event loop: the writers can
+            # block). Rows earlier runs of the same month wrote for this task's accounts are merged in: real
+            # rows win over dummy rows, so the output has one row per input account (and none of other uploads).
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.sink.close)
+            compression, level = output_compression()
+            output_file = f"{renamed}{COMPRESSION_SUFFIXES[compression]}" if compression else renamed
+            await loop.run_in_executor(None, export_csv, self.iter_output_records(), output_file, compression, level)
+            os.remove(self.csv_writer.path)
+            try:
+                await loop.run_in_executor(None, export_parquet_from_env, self.iter_output_records(), renamed)
+            except Exception as e:
+                # Optional companion output; the CSV is complete and the run still finishes
+                logger.warning(f"Could not write the Parquet companion of {output_file}: {e}")
+            self.store.finish_run(self.run_id, output_file)
+            logger.info(f"Wrote output file {output_file}")
+            await self.broadcast({
+                "type": "log",
+                "message": f"📂 Output file saved as: {os.path.basename(output_file)}",
+                "level": "info"
+            })
 
-            return renamed
+            return output_file
 
         except Exception as e:
             logger.error(f"Error finalizing output: {e}", exc_info=True)
@@ -341,36 +574,107 @@ class ExtractionTask:
                 "message": f"⚠️ Error finalizing output: {str(e)}",
                 "level": "warning"
             })
-            return output_file
+            return None
+
+    def iter_output_records(self) -> Iterator[BillRecord]:
+        """Stream the task's output rows: the current row of each of its accounts in this user type and month"""
+        return _iter_output_records(self.store, self.user_type, self.run_id, self.accounts_list)
 
     async def broadcast(self, message: Dict[str, Any]):
-        """Broadcast a message to all connected WebSocket clients"""
-        if not self.connections:
-            return
+        """
+        Broadcast a message to all connected WebSocket clients.
+
+        The message is numbered and recorded for reconnecting clients, then only
+        queued on each client (see ``ClientConnection``), so this never waits on
+        a slow or dead browser tab.
+        """
+        self.seq += 1
+        message = {**message, "seq": self.seq}
+        if message["type"] == "progress":
+            self.current_progress = message.get("current", self.current_progress)
+            self.last_progress_message = message.get("message")
+        elif message["type"] == "error":
+            self.status = "failed"
 
         data = json.dumps(message)
-        for ws in self.connections[:]:
-            if not ws.closed:
-                await ws.send_str(data)
-            else:
-                self.connections.remove(ws)
+        if message["type"] not in COALESCED_TYPES:
+            if len(self.events) == self.events.maxlen:
+                self.evicted_seq = self.events[0][0]
+            self.events.append((self.seq, message["type"], data))
+            # Other worker processes relay the task to their clients from the registry
+            self.registry_events.append((self.seq, message["type"], data))
+            self._persist()
+        if not self.connections:
+            return
 
-    def add_connection(self, ws: WebSocketResponse):
-        """Add a WebSocket connection"""
-        if ws not in self.connections:
-            self.connections.append(ws)
+        for connection in self.connections[:]:
+            if not connection.offer(message["type"], data):
+                self.remove_connection(connection.ws)
+
+    def snapshot(self, since: int = 0) -> Dict[str, Any]:
+        """
+        Return a compact summary of the task's current state.
+
+        ``truncated`` tells a client that events after ``since`` have already
+        been evicted from the ring buffer.
+        """
+        return {
+            "type": "snapshot",
+            "seq": self.seq,
+            "task_id": self.task_id,
+            "status": self.status,
+            "user_type": self.user_type,
+            "current": self.current_progress,
+            "total": self.total_accounts,
+            "success": self.success_count,
+            "failed": self.fail_count,
+            "message": self.last_progress_message,
+            "output_file": self.output_file,
+            "download_url": f"/api/tasks/{self.task_id}/result" if self.output_file else None,
+            "queue_position": self.queue_position,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "truncated": since < self.evicted_seq,
+        }
+
+    def events_since(self, since: int) -> List[Tuple[str, str]]:
+        """Return the buffered (type, data) events with a sequence number above ``since``"""
+        return [(message_type, data) for seq, message_type, data in self.events if seq > since]
+
+    def add_connection(self, ws: WebSocketResponse) -> ClientConnection:
+        """Add a WebSocket connection and return its client queue"""
+        for connection in self.connections:
+            if connection.ws is ws:
+                return connection
+        connection = ClientConnection(ws)
+        self.connections.append(connection)
+        return connection
 
     def remove_connection(self, ws: WebSocketResponse):
-        """Remove a WebSocket connection"""
-        if ws in self.connections:
-            self.connections.remove(ws)
+        """Remove a WebSocket connection and stop its writer"""
+        for connection in self.connections[:]:
+            if connection.ws is ws:
+                self.connections.remove(connection)
+                connection.close()
 
     def cancel(self):
-        """Cancel the extraction process"""
+        """Cancel the extraction process (or take the task out of the admission queue)"""
         self.is_cancelled = True
+        if self.ticket:
+            admission.withdraw(self.ticket)
 
-    def cleanup(self):
+    async def cleanup(self):
         """Clean up temporary files"""
+        # Flush rows still buffered (e.g. after a cancel) into the results store, off the event loop
+        try:
+            if self.sink:
+                await asyncio.get_running_loop().run_in_executor(None, self.sink.close)
+        except Exception as e:
+            logger.error(f"Error flushing output: {e}", exc_info=True)
+
+        if self.is_cancelled and self.csv_writer and os.path.exists(self.csv_writer.path):
+            logger.info(f"Partial output of cancelled task {self.task_id} kept at {self.csv_writer.path}")
+
         try:
             # Clean up PDF folder
             if os.path.exists(self.pdf_folder):
@@ -389,6 +693,63 @@ class ExtractionTask:
             logger.error(f"Error during cleanup: {e}", exc_info=True)
 
 
+class RegistryTask:
+    """
+    A task held by another worker process (or by an earlier run), read from its
+    task registry row: just what serving its download needs
+    """
+
+    def __init__(self, row: Dict[str, Any]):
+        self.task_id = row["task_id"]
+        self.user_type = row["user_type"]
+        self.accounts_list = row["accounts"]
+        self.run_id = row["run_id"]
+        self.output_file = row["output_file"]
+        self.finished_at = row["finished_at"]
+        self.store = ResultsStore.default()
+
+    def iter_output_records(self) -> Iterator[BillRecord]:
+        """Stream the task's output rows (see ``ExtractionTask.iter_output_records``)"""
+        return _iter_output_records(self.store, self.user_type, self.run_id, self.accounts_list)
+
+
+def _iter_output_records(store: ResultsStore, user_type: str, run_id: str, accounts: List[str]) -> Iterator[BillRecord]:
+    return store.iter_current_records(user_type.upper(), store.run_period(run_id), accounts)
+
+
+def _pending_accounts() -> int:
+    return sum(max(task.total_accounts - task.current_progress, 0) for task in list(active_tasks.values()))
+
+
+def _websocket_backlog() -> int:
+    return sum(connection.pending for task in list(active_tasks.values()) for connection in task.connections)
+
+
+metrics.QUEUE_DEPTH.set_function(_pending_accounts, "accounts")
+metrics.QUEUE_DEPTH.set_function(_websocket_backlog, "websocket")
+metrics.QUEUE_DEPTH.set_function(lambda: len(admission.waiting), "admission")
+
+
+def _task_retention() -> float:
+    return float(os.environ.get("TASDEED_TASK_RETENTION_SECONDS", DEFAULT_TASK_RETENTION_SECONDS))
+
+
+def find_task(task_id: str) -> Optional[ExtractionTask]:
+    """Return a running task, or a finished one still inside the retention window"""
+    cutoff = time.time() - _task_retention()
+    for finished_id, finished_task in list(finished_tasks.items()):
+        if finished_task.finished_at < cutoff:
+            del finished_tasks[finished_id]
+            logger.info(f"Dropped finished task {finished_id} after the retention window")
+    return active_tasks.get(task_id) or finished_tasks.get(task_id)
+
+
+def find_registry_task(task_id: str) -> Optional[RegistryTask]:
+    """Look up a task held by another worker process (or by an earlier run) in the task registry"""
+    row = TaskRegistry.default().get(task_id, with_accounts=True)
+    return RegistryTask(row) if row else None
+
+
 def get_user(user_type: str):
     """Get username and password for the specified user type"""
     users = {
@@ -406,24 +767,94 @@ async def index(request):
     return aiohttp_jinja2.render_template('index.html', request, {})
 
 
+async def _save_upload(part, path: str) -> int:
+    """Stream a multipart file part to disk chunk by chunk; returns the number of bytes written"""
+    max_mb = float(os.environ.get("TASDEED_MAX_UPLOAD_MB", DEFAULT_MAX_UPLOAD_MB))
+    max_bytes = int(max_mb * 1024 * 1024)
+    loop = asyncio.get_running_loop()
+    size = 0
+    with open(path, 'wb') as f:
+        while True:
+            chunk = await part.read_chunk(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise ValueError(f"File is larger than {max_mb:g} MB")
+            await loop.run_in_executor(None, f.write, chunk)
+    return size
+
+
+def read_account_columns(path: str) -> List[str]:
+    """Read only the header row of an account sheet (Excel or CSV)"""
+    if path.endswith(".xlsx"):
+        return list(pd.read_excel(path, nrows=0).columns)
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def load_accounts(path: str) -> Tuple[str, List[str]]:
+    """
+    Parse an account sheet and return its user type and account numbers.
+
+    Raises:
+        ValueError: If the sheet does not have exactly one SUBTYPE or has no accounts
+    """
+    df = pd.read_excel(path, dtype={"ACCOUNTNO": str}) if path.endswith(".xlsx") else pd.read_csv(path, dtype={"ACCOUNTNO": str})
+
+    # Get user type
+    subtypes = df["SUBTYPE"].dropna().unique()
+    if len(subtypes) != 1:
+        raise ValueError("Only one user SUBTYPE should exist in the file")
+
+    # Get account list
+    accounts_list = [str(acc) for acc in df.get("ACCOUNTNO", []) if pd.notna(acc)]
+    if len(accounts_list) == 0:
+        raise ValueError("No valid accounts found in the ACCOUNTNO column")
+
+    return str(subtypes[0]), accounts_list
+
+
 async def upload_file(request):
-    """Handle file upload and start extraction process"""
+    """
+    Handle file upload and start extraction process.
+
+    The multipart body is streamed to a temporary file and only the header row
+    is checked here (in an executor); the task parses the full sheet in the
+    background, so large uploads never block the event loop.
+    """
+    # Reject the upload before reading it when the admission queue is full
+    if admission.is_full():
+        return web.json_response(
+            {"error": "The server is busy and its task queue is full, please try again later", **admission.snapshot()},
+            status=429, headers={hdrs.RETRY_AFTER: str(RETRY_AFTER_SECONDS)}
+        )
+
+    temp_file = None
     try:
-        data = await request.post()
+        reader = await request.multipart()
+        output_dir = None
+        size = 0
+
+        while True:
+            part = await reader.next()
+            if part is None:
+                break
+            if part.name == 'file' and part.filename:
+                # Save the file temporarily with the correct extension
+                file_ext = os.path.splitext(part.filename)[1].lower() or '.xlsx'
+                temp_file = os.path.join(tempfile.gettempdir(), f"{uuid.uuid4()}{file_ext}")
+                try:
+                    size = await _save_upload(part, temp_file)
+                except ValueError as e:
+                    return web.json_response({"error": str(e)}, status=413)
+            elif part.name == 'output_dir':
+                output_dir = (await part.text()).strip()
 
         # Get the uploaded file
-        file_field = data.get('file')
-        if not file_field:
+        if not temp_file or size == 0:
             return web.json_response({"error": "No file uploaded"}, status=400)
 
-        # Save the file temporarily with the correct extension
-        file_ext = os.path.splitext(file_field.filename)[1].lower() or '.xlsx'
-        temp_file = os.path.join(tempfile.gettempdir(), f"{uuid.uuid4()}{file_ext}")
-        with open(temp_file, 'wb') as f:
-            f.write(file_field.file.read())
-
         # Get output directory
-        output_dir = data.get('output_dir')
         if not output_dir:
             return web.json_response({"error": "Output directory is required"}, status=400)
 
@@ -431,55 +862,46 @@ async def upload_file(request):
         if not os.path.isabs(output_dir):
             output_dir = os.path.abspath(output_dir)
 
-        # Read the Excel file
+        # Read the header row off the event loop
+        loop = asyncio.get_running_loop()
         try:
-            df = pd.read_excel(temp_file, dtype={"ACCOUNTNO": str}) if temp_file.endswith(".xlsx") else pd.read_csv(temp_file, dtype={"ACCOUNTNO": str})
+            columns = await loop.run_in_executor(None, read_account_columns, temp_file)
         except Exception as e:
             logger.error(f"Error reading file: {e}", exc_info=True)
             return web.json_response({"error": f"Error reading file: {str(e)}"}, status=400)
 
         # Check for required columns
-        if "ACCOUNTNO" not in df.columns or "SUBTYPE" not in df.columns:
+        if "ACCOUNTNO" not in columns or "SUBTYPE" not in columns:
             return web.json_response({"error": "File must contain ACCOUNTNO and SUBTYPE columns"}, status=400)
 
-        # Get user type
-        subtypes = df["SUBTYPE"].dropna().unique()
-        if len(subtypes) != 1:
-            return web.json_response({"error": "Only one user SUBTYPE should exist in the file"}, status=400)
-
-        user_type = subtypes[0]
-
-        # Get account list
-        accounts_list = [str(acc) for acc in df.get("ACCOUNTNO", []) if pd.notna(acc)]
-        if len(accounts_list) == 0:
-            return web.json_response({"error": "No valid accounts found in the ACCOUNTNO column"}, status=400)
-
         # Create a task ID
         task_id = str(uuid.uuid4())
 
-        # Create and start the extraction task
-        task = ExtractionTask(task_id, user_type, accounts_list, output_dir)
+        # Create and start the extraction task; it loads the accounts from the file itself
+        TaskRegistry.default().create(task_id, output_dir, source_file=temp_file)
+        task = ExtractionTask(task_id, None, [], output_dir, source_file=temp_file)
+        task.ticket = admission.enqueue(task_id, task._on_queue_position)
         active_tasks[task_id] = task
+        temp_file = None
 
         # Start the task in the background
-        asyncio.create_task(task.start())
-
-        # Clean up the temporary file
-        try:
-            os.remove(temp_file)
-        except Exception as e:
-            logger.warning(f"Error removing temp file: {e}")
+        task.runner = asyncio.create_task(task.start())
 
         return web.json_response({
             "task_id": task_id,
-            "total_accounts": len(accounts_list),
-            "user_type": user_type,
             "output_dir": output_dir
         })
 
     except Exception as e:
         logger.error(f"Error in upload_file: {e}", exc_info=True)
         return web.json_response({"error": str(e)}, status=500)
+    finally:
+        # Clean up the temporary file unless a task took it over
+        if temp_file and os.path.exists(temp_file):
+            try:
+                os.remove(temp_file)
+            except Exception as e:
+                logger.warning(f"Error removing temp file: {e}")
 
 
 async def websocket_handler(request):
@@ -487,26 +909,35 @@ async def websocket_handler(request):
     ws = web.WebSocketResponse()
     await ws.prepare(request)
 
-    # Get task ID from URL
+    # Get task ID from URL. A task running in another worker process is relayed from the task registry.
     task_id = request.match_info.get('task_id')
-    task = active_tasks.get(task_id)
+    task = find_task(task_id)
+    registry_row = None if task else TaskRegistry.default().get(task_id)
 
-    if not task:
+    if not task and not registry_row:
         await ws.send_json({"type": "error", "message": "Task not found"})
         await ws.close()
         return ws
 
-    # Add this connection to the task
-    task.add_connection(ws)
+    # Events the client has already seen (its last sequence number; 0 after a page reload)
+    try:
+        since = max(int(request.query.get("since", 0)), 0)
+    except ValueError:
+        since = 0
+
+    relay = None
+    if task:
+        # Add this connection to the task
+        connection = task.add_connection(ws)
+        # Send the task's current state and replay the events the client missed
+        # (through the client's queue, like every other update)
+        connection.replay([("snapshot", json.dumps(task.snapshot(since)))] + task.events_since(since))
+        connection.replay([("replayed", json.dumps({"type": "replayed", "seq": task.seq, "status": task.status}))])
+    else:
+        connection = ClientConnection(ws)
+        relay = asyncio.create_task(_relay_registry_task(connection, registry_row, since))
 
     try:
-        # Send initial stats
-        await ws.send_json({
-            "type": "stats",
-            "success": task.success_count,
-            "failed": task.fail_count,
-            "total": task.total_accounts
-        })
 
         # Keep the connection open until closed by client
         async for msg in ws:
@@ -518,22 +949,70 @@ async def websocket_handler(request):
 
     finally:
         # Remove this connection from the task
-        task.remove_connection(ws)
+        if task:
+            task.remove_connection(ws)
+        else:
+            relay.cancel()
+            connection.close()
 
     return ws
 
 
+async def _relay_registry_task(connection: ClientConnection, row: Dict[str, Any], since: int):
+    """
+    Feed a WebSocket client a task owned by another worker process: the
+    snapshot and recorded events, then new events and progress polled from the
+    task registry until the task finishes.
+    """
+    registry = TaskRegistry.default()
+    task_id = row["task_id"]
+    loop = asyncio.get_running_loop()
+    events = await loop.run_in_executor(None, registry.events_since, task_id, since)
+    connection.replay([("snapshot", json.dumps({**_registry_summary(row), "type": "snapshot", "seq": row["seq"],
+                                                "truncated": since < row["evicted_seq"]}))]
+                      + [(message_type, data) for _, message_type, data in events])
+    connection.replay([("replayed", json.dumps({"type": "replayed", "seq": row["seq"], "status": row["status"]}))])
+    last_seq = events[-1][0] if events else since
+    last_counts = (row["current"], row["success"], row["failed"], row["total"], row["message"])
+
+    while row["status"] in UNFINISHED_STATUSES and not connection.closed:
+        await asyncio.sleep(REGISTRY_POLL_SECONDS)
+        row, events = await loop.run_in_executor(None, _poll_registry, registry, task_id, last_seq)
+        if row is None:
+            break
+        counts = (row["current"], row["success"], row["failed"], row["total"], row["message"])
+        if counts != last_counts:
+            last_counts = counts
+            connection.offer("progress", json.dumps({"type": "progress", "seq": row["seq"], "current": row["current"],
+                                                     "total": row["total"], "message": row["message"]}))
+            connection.offer("stats", json.dumps({"type": "stats", "seq": row["seq"], "success": row["success"],
+                                                  "failed": row["failed"], "total": row["total"]}))
+        for seq, message_type, data in events:
+            connection.offer(message_type, data)
+            last_seq = seq
+
+
+def _poll_registry(registry: TaskRegistry, task_id: str, since: int
+                   ) -> Tuple[Optional[Dict[str, Any]], List[Tuple[int, str, str]]]:
+    """Read a relayed task's row and its events after ``since`` (in an executor thread)"""
+    return registry.get(task_id), registry.events_since(task_id, since)
+
+
 async def cancel_task(request):
     """Cancel an extraction task"""
     try:
         data = await request.json()
         task_id = data.get('task_id')
 
-        if not task_id or task_id not in active_tasks:
+        if not task_id:
             return web.json_response({"error": "Task not found"}, status=404)
 
-        task = active_tasks[task_id]
-        task.cancel()
+        task = active_tasks.get(task_id)
+        if task:
+            task.cancel()
+        elif not TaskRegistry.default().request_cancel(task_id):
+            # Not running here, and not running in another worker process either
+            return web.json_response({"error": "Task not found"}, status=404)
 
         return web.json_response({"status": "cancelled"})
 
@@ -542,17 +1021,382 @@ async def cancel_task(request):
         return web.json_response({"error": str(e)}, status=500)
 
 
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single ``bytes=`` range against a file of ``size`` bytes.
+
+    Returns:
+        Optional[Tuple[int, int]]: Inclusive (start, end), or None when the header
+        should be ignored (unsupported unit or multiple ranges)
+
+    Raises:
+        ValueError: If the range cannot be satisfied
+    """
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", range_header)
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        raise ValueError(f"Invalid range: {range_header}")
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(f"Unsatisfiable range: {range_header}")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(f"Unsatisfiable range: {range_header}")
+    return start, end
+
+
+def _accepts_encoding(request, encoding: str) -> bool:
+    """Check whether the client accepts the given content-encoding"""
+    for coding in request.headers.get(hdrs.ACCEPT_ENCODING, "").split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() == encoding:
+            return params.replace(" ", "") != "q=0"
+    return False
+
+
+async def _stream_file(request, path: str, content_type: str, compressible: bool,
+                       content_encoding: Optional[str] = None) -> web.StreamResponse:
+    """
+    Stream a file in chunks, honouring Range/If-Range and gzip for full responses.
+
+    ``content_encoding`` serves an already compressed file as-is with that
+    Content-Encoding (ranges then refer to the compressed bytes).
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    tag = f"{stat.st_mtime_ns:x}-{size:x}"
+    etag = f'"{tag}"'
+    headers = {
+        hdrs.ACCEPT_RANGES: "bytes",
+        hdrs.ETAG: etag,
+        hdrs.VARY: hdrs.ACCEPT_ENCODING,
+        hdrs.CONTENT_DISPOSITION: f'attachment; filename="{os.path.basename(strip_compression_suffix(path))}"',
+    }
+    if content_encoding:
+        headers[hdrs.CONTENT_ENCODING] = content_encoding
+
+    start, end = 0, size - 1
+    status = 200
+    range_header = request.headers.get(hdrs.RANGE)
+    # A resumed download only gets a partial response if the file has not changed since
+    if range_header and request.headers.get(hdrs.IF_RANGE, etag) == etag:
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            return web.Response(status=416, headers={hdrs.CONTENT_RANGE: f"bytes */{size}"})
+        if byte_range:
+            start, end = byte_range
+            status = 206
+            headers[hdrs.CONTENT_RANGE] = f"bytes {start}-{end}/{size}"
+
+    # Ranges refer to the stored bytes, so only full responses are compressed
+    compressor = None
+    if compressible and not content_encoding and status == 200 and _accepts_encoding(request, "gzip"):
+        compressor = zlib.compressobj(wbits=31)
+
+    response = web.StreamResponse(status=status, headers=headers)
+    response.content_type = content_type
+    if compressor:
+        response.headers[hdrs.CONTENT_ENCODING] = "gzip"
+        # The gzip body differs from the stored bytes, so it must not share their (strong) ETag
+        response.headers[hdrs.ETAG] = f'W/"{tag}-gzip"'
+        response.enable_chunked_encoding()
+    else:
+        response.content_length = end - start + 1
+    await response.prepare(request)
+
+    loop = asyncio.get_running_loop()
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await loop.run_in_executor(None, f.read, min(DOWNLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            await response.write(compressor.compress(chunk) if compressor else chunk)
+    if compressor:
+        await response.write(compressor.flush())
+    await response.write_eof()
+    return response
+
+
+def _iter_file_text(path: str) -> Iterator[str]:
+    """Yield a (possibly compressed) text file in decompressed chunks"""
+    with open_text_input(path) as text_file:
+        while True:
+            chunk = text_file.read(DOWNLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+async def _stream_chunks(request, chunks: Iterator[str], filename: str) -> web.StreamResponse:
+    """Stream generated CSV text with chunked encoding (no Range support)"""
+    response = web.StreamResponse(headers={
+        hdrs.ACCEPT_RANGES: "none",
+        hdrs.VARY: hdrs.ACCEPT_ENCODING,
+        hdrs.CONTENT_DISPOSITION: f'attachment; filename="{filename}"',
+    })
+    response.content_type = RESULT_CONTENT_TYPES["csv"]
+    compressor = zlib.compressobj(wbits=31) if _accepts_encoding(request, "gzip") else None
+    if compressor:
+        response.headers[hdrs.CONTENT_ENCODING] = "gzip"
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+
+    loop = asyncio.get_running_loop()
+    while True:
+        # Chunks come from SQLite or a decompressor, so pull each one off the event loop
+        text = await loop.run_in_executor(None, next, chunks, None)
+        if text is None:
+            break
+        data = text.encode("utf-8")
+        await response.write(compressor.compress(data) if compressor else data)
+    if compressor:
+        await response.write(compressor.flush())
+    await response.write_eof()
+    return response
+
+
+def _registry_summary(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape a TaskRegistry row like a task snapshot (for tasks no longer held in memory)"""
+    return {
+        "task_id": row["task_id"],
+        "status": row["status"],
+        "user_type": row["user_type"],
+        "current": row["current"],
+        "total": row["total"],
+        "success": row["success"],
+        "failed": row["failed"],
+        "message": row["message"],
+        "output_file": row["output_file"],
+        "download_url": f"/api/tasks/{row['task_id']}/result" if row["output_file"] else None,
+        "started_at": row["created_at"],
+        "finished_at": row["finished_at"],
+    }
+
+
+async def list_tasks(request):
+    """
+    List tasks from the task registry, newest first.
+
+    Query parameters:
+        status: Only tasks with this status (e.g. ``running``)
+        limit: Maximum number of tasks (default 100)
+    """
+    try:
+        limit = int(request.query.get("limit", 100))
+    except ValueError:
+        return web.json_response({"error": "limit must be an integer"}, status=400)
+    rows = TaskRegistry.default().list(status=request.query.get("status"), limit=limit)
+    tasks = []
+    for row in rows:
+        task = find_task(row["task_id"])
+        tasks.append({**task.snapshot(), "type": "task"} if task else _registry_summary(row))
+    return web.json_response({"tasks": tasks})
+
+
+async def get_task(request):
+    """Return the snapshot of a running or recently finished task, or its registry entry"""
+    task_id = request.match_info.get('task_id')
+    task = find_task(task_id)
+    if task:
+        return web.json_response(task.snapshot())
+    row = TaskRegistry.default().get(task_id)
+    if not row:
+        return web.json_response({"error": "Task not found"}, status=404)
+    return web.json_response(_registry_summary(row))
+
+
+async def get_task_result(request):
+    """
+    Download a finished task's output.
+
+    Query parameters:
+        format: ``csv`` (default) or ``xlsx``
+
+    The file is streamed in chunks with Range/If-Range support for resuming
+    large downloads, and gzip-encoded when the client accepts it (CSV only).
+    A compressed output (``.csv.gz``/``.csv.zst``) is sent as stored with the
+    matching Content-Encoding, or decompressed on the fly for clients that do
+    not accept it. If the CSV has been removed from the output directory (or is
+    a shared month file written before outputs were named after their task), it
+    is regenerated from the results store and streamed without Range support.
+    """
+    task_id = request.match_info.get('task_id')
+    task = find_task(task_id) or find_registry_task(task_id)
+    if not task:
+        return web.json_response({"error": "Task not found"}, status=404)
+    if task.output_file is None:
+        return web.json_response({"error": "Task output is not available yet"}, status=409)
+
+    result_format = request.query.get("format", "csv").lower()
+    if result_format not in RESULT_CONTENT_TYPES:
+        return web.json_response({"error": "format must be csv or xlsx"}, status=400)
+
+    try:
+        # Tasks finished before outputs were named after their task share the month's file with the other
+        # uploads of that month, which holds whichever task finished last: theirs is rebuilt from the store
+        owns_output = task.task_id in os.path.basename(task.output_file)
+        path = task.output_file
+        if result_format == "xlsx":
+            # Built from the results store and kept next to the CSV, until the task's output is rewritten
+            stem = os.path.splitext(strip_compression_suffix(task.output_file))[0]
+            path = (f"{stem}.xlsx" if owns_output
+                    else os.path.join(os.path.dirname(task.output_file), f"output_{task.task_id}.xlsx"))
+            if _xlsx_outdated(task, path, owns_output):
+                await _build_xlsx(task, path)
+        elif not owns_output:
+            path = None
+
+        content_type = RESULT_CONTENT_TYPES[result_format]
+        filename = os.path.basename(strip_compression_suffix(path or task.output_file))
+        if path and os.path.exists(path):
+            compression = compression_of(path)
+            if compression is None:
+                return await _stream_file(request, path, content_type, compressible=result_format == "csv")
+            if _accepts_encoding(request, compression):
+                return await _stream_file(request, path, content_type, compressible=False,
+                                          content_encoding=compression)
+            return await _stream_chunks(request, _iter_file_text(path), filename)
+
+        if path:
+            logger.warning(f"Output file {path} is missing, streaming task {task_id} from the results store")
+        chunks = iter_csv_from_docs(task.iter_output_records(), chunk_size=DOWNLOAD_CHUNK_SIZE)
+        return await _stream_chunks(request, chunks, filename)
+
+    except ConnectionResetError:
+        logger.info(f"Client disconnected while downloading the result of task {task_id}")
+        raise
+    except Exception as e:
+        logger.error(f"Error in get_task_result: {e}", exc_info=True)
+        return web.json_response({"error": str(e)}, status=500)
+
+
+def _xlsx_outdated(task: Union[ExtractionTask, RegistryTask], path: str, owns_output: bool) -> bool:
+    """Whether a task's workbook is missing or older than its output (a resumed task rewrites the CSV)"""
+    if not os.path.exists(path):
+        return True
+    written_at = os.path.getmtime(path)
+    if owns_output and os.path.exists(task.output_file) and os.path.getmtime(task.output_file) > written_at:
+        return True
+    return bool(task.finished_at and task.finished_at > written_at)
+
+
+async def _build_xlsx(task: Union[ExtractionTask, RegistryTask], path: str) -> None:
+    """Export a task's workbook for download; concurrent first downloads wait for the same build"""
+    build = xlsx_builds.get(path)
+    if build is None:
+        loop = asyncio.get_running_loop()
+        build = xlsx_builds[path] = loop.run_in_executor(None, export_xlsx, task.iter_output_records(), path)
+        build.add_done_callback(lambda _: xlsx_builds.pop(path, None))
+    # A client that disconnects does not cancel the build for the others
+    await asyncio.shield(build)
+
+
+async def get_metrics(request):
+    """Expose the pipeline metrics (see ``data_transform.metrics``) in the Prometheus text format"""
+    return web.Response(body=metrics.render().encode("utf-8"), headers={hdrs.CONTENT_TYPE: METRICS_CONTENT_TYPE})
+
+
 def setup_routes(app):
     """Set up the application routes"""
     app.router.add_get('/', index)
     app.router.add_post('/api/upload', upload_file)
     app.router.add_post('/api/cancel', cancel_task)
+    app.router.add_get('/api/tasks', list_tasks)
+    app.router.add_get('/api/tasks/{task_id}', get_task)
+    app.router.add_get('/api/tasks/{task_id}/result', get_task_result)
     app.router.add_get('/ws/{task_id}', websocket_handler)
+    app.router.add_get('/metrics', get_metrics)
 
     # Static files
     app.router.add_static('/static/', path=os.path.join(os.path.dirname(__file__), 'static'), name='static')
 
 
+async def resume_tasks(app):
+    """
+    Rebuild the task registry on startup: unfinished tasks are resumed from the
+    accounts they had not reached, and recently finished ones are kept for
+    queries and downloads.
+
+    With several worker processes, each unfinished task whose owner is gone is
+    claimed (and resumed) by exactly one of them.
+    """
+    registry = TaskRegistry.default()
+    for row in registry.load(finished_since=time.time() - _task_retention()):
+        task = ExtractionTask.from_registry(row)
+        if row["status"] in UNFINISHED_STATUSES:
+            if process_alive(row["owner_pid"], row["owner_token"]) or not registry.claim(
+                    task.task_id, row["owner_pid"], row["owner_token"]):
+                continue
+            active_tasks[task.task_id] = task
+            task.runner = asyncio.create_task(task.start())
+            logger.info(f"Resuming task {task.task_id} ({task.current_progress}/{task.total_accounts} accounts done)")
+        else:
+            finished_tasks[task.task_id] = task
+
+
+async def start_browser_pool(app):
+    """Launch the shared browsers (TASDEED_BROWSER_POOL_SIZE, 0 to give every task its own)"""
+    global browser_pool
+    if int(os.environ.get("TASDEED_BROWSER_POOL_SIZE", DEFAULT_POOL_SIZE)) <= 0:
+        return
+    pool = BrowserPool()
+    try:
+        await pool.start()
+    except Exception as e:
+        logger.error(f"Could not start the browser pool, tasks will launch their own browsers: {e}", exc_info=True)
+        return
+    browser_pool = pool
+
+
+async def start_session_pool(app):
+    """Keep logged-in portal sessions in the browser pool (TASDEED_SESSIONS_PER_USER, 0 to log in per task)"""
+    global session_pool
+    if browser_pool is None or int(os.environ.get("TASDEED_SESSIONS_PER_USER", DEFAULT_SESSIONS_PER_USER)) <= 0:
+        return
+    session_pool = SessionPool(browser_pool)
+    session_pool.start()
+
+
+async def interrupt_tasks(app):
+    """
+    Stop running tasks before the browsers go away; they stay unfinished in the
+    task registry and resume on the next start.
+    """
+    runners = [task.runner for task in list(active_tasks.values()) if task.runner and not task.runner.done()]
+    for runner in runners:
+        runner.cancel()
+    await asyncio.gather(*runners, return_exceptions=True)
+
+
+async def close_session_pool(app):
+    global session_pool
+    if session_pool is not None:
+        pool, session_pool = session_pool, None
+        await pool.close()
+
+
+async def export_trace(app):
+    """Write the Chrome trace of this worker's spans on shutdown (TASDEED_TRACE_DIR)"""
+    tracing.export_chrome_trace()
+
+
+async def close_browser_pool(app):
+    global browser_pool
+    if browser_pool is not None:
+        pool, browser_pool = browser_pool, None
+        await pool.close()
+
+
 def create_app():
     """Create and configure the application"""
     app = web.Application()
@@ -565,6 +1409,13 @@ def create_app():
 
     # Set up routes
     setup_routes(app)
+    app.on_startup.append(start_browser_pool)
+    app.on_startup.append(start_session_pool)
+    app.on_startup.append(resume_tasks)
+    app.on_shutdown.append(interrupt_tasks)
+    app.on_cleanup.append(close_session_pool)
+    app.on_cleanup.append(close_browser_pool)
+    app.on_cleanup.append(export_trace)
 
     return app
 
@@ -22,6 +22,11 @@ const logContainer = document.getElementById('log-container');
 // Global variables
 let socket = null;
 let processing = false;
+let lastSeq = 0;
+
+// Key under which the running task is remembered across page reloads
+const TASK_STORAGE_KEY = 'tasdeedTaskId';
+const RECONNECT_DELAY_MS = 2000;
 
 // Initialize tooltips
 document.addEventListener('DOMContentLoaded', function() {
@@ -36,8 +41,27 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Check for Firefox and show guidance if needed
     checkBrowserCompatibility();
+
+    // Reattach to a task that was running before the page was reloaded
+    resumeTask();
 });
 
+/**
+ * Reconnect to the task remembered in session storage, replaying its buffered log
+ */
+function resumeTask() {
+    const taskId = sessionStorage.getItem(TASK_STORAGE_KEY);
+    if (!taskId) {
+        return;
+    }
+
+    resetUI();
+    showPage(processingPage);
+    processing = true;
+    addLog('🔄 Reconnecting to the running task...', 'info');
+    connectWebSocket(taskId, 0);
+}
+
 /**
  * Check browser compatibility and show guidance for unsupported features
  */
@@ -104,6 +128,7 @@ function setupEventListeners() {
 
     // Finish button
     finishBtn.addEventListener('click', () => {
+        sessionStorage.removeItem(TASK_STORAGE_KEY);
         showPage(uploadPage);
         resetUI();
     });
@@ -220,12 +245,13 @@ function startProcessing(formData) {
         method: 'POST',
         body: formData
     })
-    .then(response => {
+    .then(response => response.json().then(body => {
         if (!response.ok) {
-            throw new Error('File upload failed');
+            // e.g. 429 when the server's task queue is full
+            throw new Error(body.error || 'File upload failed');
         }
-        return response.json();
-    })
+        return body;
+    }))
     .then(data => {
         // Connect to WebSocket for real-time updates
         connectWebSocket(data.task_id);
@@ -235,8 +261,7 @@ function startProcessing(formData) {
         addLog(`📂 File: ${fileUpload.files[0].name}`, 'info');
         addLog(`💾 Output directory: ${outputDir.value || './output'}`, 'info');
 
-        // Update total count
-        totalCount.textContent = data.total_accounts || '0';
+        // The total arrives over the WebSocket (snapshot/stats) once the task has parsed the sheet
     })
     .catch(error => {
         console.error('Error:', error);
@@ -248,21 +273,24 @@ function startProcessing(formData) {
 /**
  * Connect to WebSocket for real-time updates
  * @param {string} taskId - Task ID for the current processing job
+ * @param {number} since - Last event sequence number already shown (0 replays the buffered log)
  */
-function connectWebSocket(taskId) {
-    // Close existing socket if any
+function connectWebSocket(taskId, since = 0) {
+    // Close existing socket if any (without triggering a reconnect)
     if (socket) {
+        socket.onclose = null;
         socket.close();
     }
 
     // Create new WebSocket connection
     const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    const wsUrl = `${protocol}//${window.location.host}/ws/${taskId}`;
+    const wsUrl = `${protocol}//${window.location.host}/ws/${taskId}?since=${since}`;
 
     socket = new WebSocket(wsUrl);
 
     // Store the task ID on the socket object for later use
     socket.taskId = taskId;
+    sessionStorage.setItem(TASK_STORAGE_KEY, taskId);
 
     // WebSocket event handlers
     socket.onopen = () => {
@@ -272,6 +300,9 @@ function connectWebSocket(taskId) {
 
     socket.onmessage = (event) => {
         const data = JSON.parse(event.data);
+        if (data.seq) {
+            lastSeq = Math.max(lastSeq, data.seq);
+        }
         handleWebSocketMessage(data);
     };
 
@@ -283,7 +314,13 @@ function connectWebSocket(taskId) {
     socket.onclose = () => {
         console.log('WebSocket disconnected');
         if (processing) {
-            addLog('🔌 Disconnected from server', 'warning');
+            addLog('🔌 Disconnected from server, reconnecting...', 'warning');
+            // Resume from the last event we saw; the server replays anything missed
+            setTimeout(() => {
+                if (processing) {
+                    connectWebSocket(taskId, lastSeq);
+                }
+            }, RECONNECT_DELAY_MS);
         }
     };
 }
@@ -294,10 +331,35 @@ function connectWebSocket(taskId) {
  */
 function handleWebSocketMessage(data) {
     switch (data.type) {
+        case 'snapshot':
+            updateProgress(data.current, data.total);
+            updateStats(data.success, data.failed, data.total);
+            if (data.status === 'queued' && data.queue_position) {
+                progressText.textContent = `Queued: position ${data.queue_position}`;
+            }
+            if (data.truncated) {
+                addLog('ℹ️ Some earlier log messages are no longer available', 'info');
+            }
+            break;
+
+        case 'replayed':
+            // The task ended while we were away and its final message was already replayed or evicted
+            if (processing && !['pending', 'queued', 'running'].includes(data.status)) {
+                addLog(`ℹ️ Task ${data.status}`, data.status === 'completed' ? 'success' : 'warning');
+                finishProcessing(data.status === 'completed');
+            }
+            break;
+
         case 'progress':
             updateProgress(data.current, data.total, data.message);
             break;
 
+        case 'queued':
+            // Waiting for a free slot on the server
+            progressText.textContent = `Queued: position ${data.position} of ${data.queued}`;
+            addLog(data.message, 'info');
+            break;
+
         case 'log':
             addLog(data.message, data.level || 'info');
             break;
@@ -312,11 +374,18 @@ function handleWebSocketMessage(data) {
             if (data.output_file) {
                 addLog(`📂 Output saved to: ${data.output_file}`, 'success');
             }
+            if (data.download_url) {
+                addDownloadLink(data.download_url);
+            }
             finishProcessing(true);
             break;
 
         case 'error':
             addLog(`❌ Error: ${data.message}`, 'error');
+            if (!data.seq) {
+                // Not a task event (e.g. the task is unknown or has expired): stop reconnecting
+                sessionStorage.removeItem(TASK_STORAGE_KEY);
+            }
             finishProcessing(false);
             break;
     }
@@ -378,6 +447,30 @@ function addLog(message, level = 'info') {
     logContainer.scrollTop = logContainer.scrollHeight;
 }
 
+/**
+ * Add download links for the task output to the log
+ * @param {string} url - Result endpoint of the finished task
+ */
+function addDownloadLink(url) {
+    const logEntry = document.createElement('div');
+    logEntry.className = 'log-entry log-success';
+    logEntry.append('⬇️ Download: ');
+
+    [['CSV', url], ['Excel', `${url}?format=xlsx`]].forEach(([label, href], index) => {
+        if (index > 0) {
+            logEntry.append(' | ');
+        }
+        const link = document.createElement('a');
+        link.href = href;
+        link.textContent = label;
+        link.setAttribute('download', '');
+        logEntry.appendChild(link);
+    });
+
+    logContainer.appendChild(logEntry);
+    logContainer.scrollTop = logContainer.scrollHeight;
+}
+
 /**
  * Show an alert message
  * @param {string} message - Alert message
@@ -465,6 +558,8 @@ function finishProcessing(success) {
  * Reset the UI for a new processing job
  */
 function resetUI() {
+    lastSeq = 0;
+
     // Reset progress
     progressBar.style.width = '0%';
     progressText.textContent = 'Progress: 0 / 0';
@@ -0,0 +1,90 @@
+"""
+Multi-process web deployment.
+
+``run_workers`` starts N server processes that all listen on the same port
+with ``SO_REUSEPORT`` (the kernel spreads connections across them) and restarts
+any worker that dies. Each worker runs its own event loop and Playwright
+browsers; tasks, their progress events and cancel requests are shared through
+the task registry (see ``web.task_registry``), so any worker can serve any
+task's status, WebSocket and download.
+"""
+
+import time
+import signal
+import socket
+import logging
+import multiprocessing
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# A worker that dies sooner than this after starting is restarted with a delay
+MIN_WORKER_UPTIME_SECONDS = 10.0
+RESTART_DELAY_SECONDS = 5.0
+STOP_TIMEOUT_SECONDS = 30.0
+
+
+def reuse_port_supported() -> bool:
+    return hasattr(socket, "SO_REUSEPORT")
+
+
+def _run_worker(host: str, port: int) -> None:
+    from aiohttp import web
+    from web.server import create_app
+
+    web.run_app(create_app(), host=host, port=port, reuse_port=True, print=None)
+
+
+def run_workers(workers: int, host: str, port: int) -> None:
+    """
+    Run ``workers`` server processes on ``host:port`` until interrupted.
+
+    Raises:
+        RuntimeError: If the platform does not support SO_REUSEPORT
+    """
+    if not reuse_port_supported():
+        raise RuntimeError("Running several web workers requires SO_REUSEPORT (Linux, macOS or BSD)")
+
+    context = multiprocessing.get_context("spawn")
+    processes: Dict[int, multiprocessing.Process] = {}
+    started_at: Dict[int, float] = {}
+    stopping = False
+
+    def start(index: int) -> None:
+        process = context.Process(target=_run_worker, args=(host, port), name=f"tasdeed-web-{index}")
+        process.start()
+        processes[index] = process
+        started_at[index] = time.monotonic()
+        logger.info(f"Started web worker {index} (pid {process.pid}) on port {port}")
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    for index in range(workers):
+        start(index)
+
+    try:
+        while not stopping:
+            time.sleep(1)
+            for index, process in list(processes.items()):
+                if stopping or process.is_alive():
+                    continue
+                logger.warning(f"Web worker {index} (pid {process.pid}) exited with code {process.exitcode}, "
+                               f"restarting it")
+                if time.monotonic() - started_at[index] < MIN_WORKER_UPTIME_SECONDS:
+                    time.sleep(RESTART_DELAY_SECONDS)
+                start(index)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Workers shut down gracefully on SIGTERM; their running tasks resume on the next start
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in processes.values():
+            process.join(STOP_TIMEOUT_SECONDS)
+            if process.is_alive():
+                process.kill()
+        logger.info("All web workers stopped")
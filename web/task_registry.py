@@ -0,0 +1,314 @@
+"""
+Durable registry of web extraction tasks.
+
+Every task's configuration (user type, accounts, output directory), status,
+counters, results-store run and output path is kept in a local SQLite file so
+a restarted server can list old tasks and resume the unfinished ones. Rows
+already written for a task are in the results store under its ``run_id``;
+together they tell a resumed task which accounts are left.
+
+The registry is also how web worker processes share tasks: a task runs in the
+process that owns it (``owner_pid`` and ``owner_token``), which records its
+events here, so any other worker can relay them to a WebSocket client, serve
+the download or pass on a cancel request.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from data_transform.app_paths import app_data_dir
+
+logger = logging.getLogger(__name__)
+
+# Tasks in these states were interrupted by a shutdown and are resumed on startup
+UNFINISHED_STATUSES = ("pending", "queued", "running")
+DEFAULT_EVENTS_KEPT = 1000
+
+_COLUMNS = ("task_id", "user_type", "output_directory", "source_file", "run_id", "status",
+            "total", "current", "success", "failed", "output_file", "message",
+            "created_at", "updated_at", "finished_at", "owner_pid", "owner_token", "seq",
+            "evicted_seq")
+# Columns added after the first release of the registry
+_ADDED_COLUMNS = {
+    "owner_pid": "INTEGER",
+    "seq": "INTEGER NOT NULL DEFAULT 0",
+    "cancel_requested": "INTEGER NOT NULL DEFAULT 0",
+    "owner_token": "TEXT",
+    "evicted_seq": "INTEGER NOT NULL DEFAULT 0",
+}
+
+
+# Columns returned by listings; the account list itself is only loaded for resumes
+_SUMMARY_COLUMNS = tuple(column for column in _COLUMNS if column != "source_file")
+
+_owner_token: Optional[Tuple[int, str]] = None
+
+
+def _process_start(pid: int) -> Optional[str]:
+    """A process's start time in clock ticks since boot, from /proc (None where there is no /proc)."""
+    try:
+        with open(f"/proc/{pid}/stat", encoding="ascii", errors="replace") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name (field 2) may contain spaces and parentheses; the start time is field 22
+    return stat.rsplit(")", 1)[1].split()[19]
+
+
+def owner_token() -> str:
+    """
+    Identify this process for this run: its start time plus a random part.
+
+    PIDs are reused (a restarted container usually gets the same one), so a
+    task's ``owner_pid`` alone cannot tell the process that created it from a
+    later one; the token stored next to it in ``owner_token`` can.
+    """
+    global _owner_token
+    pid = os.getpid()
+    # Recomputed in forked worker processes
+    if _owner_token is None or _owner_token[0] != pid:
+        _owner_token = (pid, f"{_process_start(pid) or ''}:{uuid.uuid4().hex}")
+    return _owner_token[1]
+
+
+def process_alive(pid: Optional[int], token: Optional[str] = None) -> bool:
+    """
+    Whether the process that owns a task (``owner_pid``, ``owner_token``) is still running.
+
+    This process only owns the tasks it created or claimed during this run. For
+    other processes, a live PID whose start time differs from the token's is a
+    reused one (on Windows, other processes are never known to be alive).
+    """
+    if not pid:
+        return False
+    if pid == os.getpid():
+        return token is not None and token == owner_token()
+    if sys.platform == "win32":
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    started = token.split(":", 1)[0] if token else ""
+    if started:
+        current = _process_start(pid)
+        if current is not None and current != started:
+            return False
+    return True
+
+
+class TaskRegistry:
+    """SQLite (WAL mode) table of web tasks, shared by every task in the process."""
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.environ.get("TASDEED_TASKS_DB") or os.path.join(app_data_dir(), "tasks.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                user_type TEXT,
+                output_directory TEXT NOT NULL,
+                source_file TEXT,
+                accounts TEXT NOT NULL DEFAULT '[]',
+                run_id TEXT,
+                status TEXT NOT NULL,
+                total INTEGER NOT NULL DEFAULT 0,
+                current INTEGER NOT NULL DEFAULT 0,
+                success INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                output_file TEXT,
+                message TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status);
+            CREATE INDEX IF NOT EXISTS idx_tasks_created ON tasks (created_at);
+            CREATE TABLE IF NOT EXISTS task_events (
+                task_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                type TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (task_id, seq)
+            ) WITHOUT ROWID;
+        """)
+        # Under the write lock, so that workers starting together do not add the same column twice
+        self._conn.execute("BEGIN IMMEDIATE")
+        task_columns = {row[1] for row in self._conn.execute("PRAGMA table_info(tasks)")}
+        for column, definition in _ADDED_COLUMNS.items():
+            if column not in task_columns:
+                self._conn.execute(f"ALTER TABLE tasks ADD COLUMN {column} {definition}")
+        self._conn.commit()
+        self.events_kept = int(os.environ.get("TASDEED_EVENT_BUFFER", DEFAULT_EVENTS_KEPT))
+
+    @classmethod
+    def default(cls) -> "TaskRegistry":
+        """Return the process-wide registry (TASDEED_TASKS_DB or the application data directory)."""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
+    def create(self, task_id: str, output_directory: str, source_file: Optional[str] = None) -> None:
+        """Register a new pending task, owned by this process."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO tasks (task_id, output_directory, source_file, status, created_at, updated_at,"
+                " owner_pid, owner_token) VALUES (?, ?, ?, 'pending', ?, ?, ?, ?)",
+                (task_id, output_directory, source_file, now, now, os.getpid(), owner_token())
+            )
+            self._conn.commit()
+
+    def claim(self, task_id: str, previous_owner: Optional[int], previous_token: Optional[str] = None) -> bool:
+        """
+        Make this process the owner of a task, unless another process claimed it
+        after ``previous_owner``/``previous_token`` were read. Returns True if the claim succeeded.
+        """
+        with self._lock:
+            claimed = self._conn.execute(
+                "UPDATE tasks SET owner_pid = ?, owner_token = ?, updated_at = ?"
+                " WHERE task_id = ? AND owner_pid IS ? AND owner_token IS ?",
+                (os.getpid(), owner_token(), time.time(), task_id, previous_owner, previous_token)
+            ).rowcount
+            self._conn.commit()
+        return bool(claimed)
+
+    def request_cancel(self, task_id: str) -> bool:
+        """Flag an unfinished task for cancellation by its owner. Returns False if there is no such task."""
+        with self._lock:
+            flagged = self._conn.execute(
+                f"UPDATE tasks SET cancel_requested = 1 WHERE task_id = ?"
+                f" AND status IN ({', '.join('?' for _ in UNFINISHED_STATUSES)})",
+                (task_id, *UNFINISHED_STATUSES)
+            ).rowcount
+            self._conn.commit()
+        return bool(flagged)
+
+    def cancel_requested(self, task_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT cancel_requested FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return bool(row and row[0])
+
+    def events_since(self, task_id: str, since: int) -> List[Tuple[int, str, str]]:
+        """Return the recorded (seq, type, data) events of a task after ``since``."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT seq, type, data FROM task_events WHERE task_id = ? AND seq > ? ORDER BY seq",
+                (task_id, since)
+            ).fetchall()
+
+    def update(self, task_id: str, accounts: Optional[List[str]] = None, **values: Any) -> None:
+        """
+        Update a task's columns.
+
+        Args:
+            task_id: The task to update
+            accounts: The parsed account list, if it changed
+            **values: Column values (see ``_COLUMNS``); ``updated_at`` is set automatically
+        """
+        self.record(task_id, accounts=accounts, **values)
+
+    def record(self, task_id: str, events: Sequence[Tuple[int, str, str]] = (), accounts: Optional[List[str]] = None,
+               **values: Any) -> bool:
+        """
+        Update a task's columns and record its new events (for WebSocket clients
+        connected to other processes) in one transaction.
+
+        Args:
+            task_id: The task to update
+            events: (seq, type, data) events, in order
+            accounts: The parsed account list, if it changed
+            **values: Column values (see ``_COLUMNS``); ``updated_at`` is set automatically
+
+        Returns:
+            bool: Whether a cancel was requested for the task (see ``request_cancel``)
+        """
+        unknown = set(values) - set(_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown task columns: {', '.join(sorted(unknown))}")
+        values["updated_at"] = time.time()
+        if accounts is not None:
+            values["accounts"] = json.dumps(accounts)
+        assignments = ", ".join(f"{column} = ?" for column in values)
+        with self._lock:
+            self._conn.execute(f"UPDATE tasks SET {assignments} WHERE task_id = ?", (*values.values(), task_id))
+            if events:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO task_events (task_id, seq, type, data) VALUES (?, ?, ?, ?)",
+                    [(task_id, seq, message_type, data) for seq, message_type, data in events]
+                )
+                # Trim old events every 100 sequence numbers; relays report the gap as "truncated"
+                evicted = events[-1][0] - self.events_kept
+                if events[-1][0] // 100 > (events[0][0] - 1) // 100 and evicted > 0:
+                    self._conn.execute("DELETE FROM task_events WHERE task_id = ? AND seq <= ?", (task_id, evicted))
+                    self._conn.execute("UPDATE tasks SET evicted_seq = ? WHERE task_id = ?", (evicted, task_id))
+            row = self._conn.execute("SELECT cancel_requested FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            self._conn.commit()
+        return bool(row and row[0])
+
+    def get(self, task_id: str, with_accounts: bool = False) -> Optional[Dict[str, Any]]:
+        """Return a task's summary (or its full row, with ``with_accounts``), or None if it is unknown."""
+        columns = (*_COLUMNS, "accounts") if with_accounts else _SUMMARY_COLUMNS
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(columns)} FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        task = dict(zip(columns, row))
+        if with_accounts:
+            task["accounts"] = json.loads(task["accounts"] or "[]")
+        return task
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Return task summaries, newest first."""
+        query = f"SELECT {', '.join(_SUMMARY_COLUMNS)} FROM tasks"
+        params: List[Any] = []
+        if status is not None:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [dict(zip(_SUMMARY_COLUMNS, row)) for row in rows]
+
+    def load(self, finished_since: float) -> List[Dict[str, Any]]:
+        """
+        Return the full rows (including accounts) of unfinished tasks and of
+        tasks finished after ``finished_since``, oldest first.
+        """
+        columns = (*_COLUMNS, "accounts")
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(columns)} FROM tasks"
+                f" WHERE status IN ({', '.join('?' for _ in UNFINISHED_STATUSES)}) OR finished_at >= ?"
+                f" ORDER BY created_at",
+                (*UNFINISHED_STATUSES, finished_since)
+            ).fetchall()
+        tasks = []
+        for row in rows:
+            task = dict(zip(columns, row))
+            task["accounts"] = json.loads(task["accounts"] or "[]")
+            tasks.append(task)
+        return tasks
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()